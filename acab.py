@@ -5,49 +5,549 @@
 #-----------------------------------------------------------
 
 # Import libraries
-from acab_funcs import fitting,ftest,log_info,choose_model
-import numpy as np
-from sherpa.astro.ui import *
-import logging
+from acab_funcs import process_source,process_task,init_worker,start_tournament_pool,stop_tournament_pool,candidate_models,set_fit_strategy,warm_up
+from acab_plots import PLOT_POLICIES,PLOT_FORMATS,set_plot_policy,start_renderer,submit_plots,finish_plots
+from acab_db import open_db,save_result,done_sources,written_sources,source_outcomes
+from acab_timing import timing_summary
+from acab_catalog import parse_shard,read_catalog
+from acab_response import install_response_cache
+from acab_watchdog import set_budgets
+from acab_prefetch import start_prefetch,stop_prefetch,prefetch_tasks
+from acab_queue import open_queue,worker_id,enqueue,claim,finish,start_heartbeat,queue_status
+from acab_fingerprint import fit_settings,reuse_for,changed_sources
+from acab_triage import TIERS
+from acab_events import set_event_log
+from acab_flux import set_flux_options
+from acab_memory import limits,set_recycling,over_limit
+from acab_service import open_spool,submit_batch,claim_batch,finish_batch,requeue_orphans,wait_batch,POLL_SECONDS
+import argparse
+import collections
+import queue
+import multiprocessing
 import time
 
-# Set start time
-start_time = time.time()
+# Energy bounds (keV) of all fits
+BOUNDS = [0.3,10]
 
-# Input sources from file; If only one source, list of lists becomes list... source has 3 values associated
-sources = np.loadtxt('srcs_2000_rk.csv', delimiter=',', unpack=False, dtype=str, comments='#')
-if len(sources) == 3:
-    sources = [sources]
+# Command line options
+parser = argparse.ArgumentParser(description='Automated Characterization of Accreting Binaries.')
+parser.add_argument('--catalog', default='srcs_2000_rk.csv',
+                    help='source list, CSV rows of obsid, srcid, RA, DEC, nH (default: srcs_2000_rk.csv)')
+parser.add_argument('--shard', type=parse_shard, default=(0,1), metavar='i/N',
+                    help='process only shard i of N (0 <= i < N); sources are split by obsid (default: 0/1, all)')
+parser.add_argument('--obsid', action='append', dest='obsids',
+                    help='process only sources of this observation; may be repeated (default: all)')
+parser.add_argument('--workers', type=int, default=1,
+                    help='number of worker processes, each with its own Sherpa session (default: 1, serial)')
+parser.add_argument('--recycle-sources', type=int, default=0, metavar='N',
+                    help='replace each worker process by a fresh one after N sources, for long runs (default: 0, never)')
+parser.add_argument('--max-rss-mb', type=float, default=0,
+                    help='restart the worker processes once one holds more than this many megabytes of resident memory after '
+                         'a source (default: 0, no limit)')
+parser.add_argument('--tournament-workers', type=int, default=1,
+                    help='number of processes fitting the candidate models of a source at the same time, for low latency on '
+                         'a few sources; only with --workers 1 (default: 1, candidates fitted in turn)')
+parser.add_argument('--prefetch', type=int, default=0, metavar='K',
+                    help='read the spectra of the next K sources in the background while fitting; serial catalog runs only '
+                         '(default: 0, off)')
+parser.add_argument('--prefetch-mb', type=float, default=512,
+                    help='memory budget of the prefetch buffer in megabytes (default: 512)')
+parser.add_argument('--response-cache', metavar='DIR',
+                    help='directory of parsed ARFs/RMFs shared by the processes of a node (memory-mapped, keyed by content '
+                         'hash); responses are re-parsed for every spectrum without it (default: none)')
+parser.add_argument('--response-cache-mb', type=float, default=1024,
+                    help='megabytes of cached responses kept mapped per process (default: 1024)')
+parser.add_argument('--fit-methods', default='levmar,neldermead',
+                    help='Sherpa optimizers tried in turn, fastest first; a fit is escalated to the next one only if it does '
+                         'not converge or its reduced statistic exceeds --escalate-rstat (default: levmar,neldermead)')
+parser.add_argument('--escalate-rstat', type=float, default=2.0,
+                    help='reduced statistic above which a converged fit is escalated to the next optimizer (default: 2.0)')
+parser.add_argument('--engine', choices=['sherpa','batch'], default='sherpa',
+                    help='engine fitting candidate models: batch fits absorbed power-law & disk candidates with NumPy '
+                         '(acab_vector) & leaves the rest, and poor batch fits, to Sherpa; chi-squared tiers only (default: sherpa)')
+parser.add_argument('--fit-timeout', type=float, default=0,
+                    help='wall-clock budget in seconds per fit; a candidate running out of time is left out of the '
+                         'tournament (default: 0, no limit)')
+parser.add_argument('--tournament-timeout', type=float, default=0,
+                    help='wall-clock budget in seconds per model tournament; the best model fitted so far is chosen when '
+                         'it runs out (default: 0, no limit)')
+parser.add_argument('--source-timeout', type=float, default=0,
+                    help="wall-clock budget in seconds per source; the source is recorded with status 'timeout' "
+                         "(default: 0, no limit)")
+parser.add_argument('--triage', action='store_true',
+                    help='sort sources into faint/medium/bright tiers by their net counts (read from the PHA files, needs '
+                         'astropy) before fitting; faint sources get fewer candidate models & W-statistic (default: off, '
+                         'all models with chi-squared)')
+parser.add_argument('--flux-samples', type=int, default=0,
+                    help='parameter sets drawn from the covariance matrix of the final fit for flux uncertainties, e.g. '
+                         '100; absorbed powerlaw/diskbb models are evaluated in NumPy, others by Sherpa (default: 0, off)')
+parser.add_argument('--flux-workers', type=int, default=1,
+                    help="processes of Sherpa's flux sampling for models NumPy does not evaluate; serial runs only (default: 1)")
+parser.add_argument('--plots', choices=PLOT_POLICIES, default='winner',
+                    help="plots to keep: none, winner (raw spectra & final fit) or all (also candidate fits) (default: winner)")
+parser.add_argument('--plot-format', choices=PLOT_FORMATS, default='pdf',
+                    help='plot file format (default: pdf)')
+parser.add_argument('--plot-workers', type=int, default=1,
+                    help='number of background plot rendering processes; 0 renders plots in-process (default: 1)')
+parser.add_argument('--events', default='acab_events.jsonl',
+                    help='JSON Lines log of model comparisons, fit statistics & source outcomes, shared by all processes '
+                         '(default: acab_events.jsonl)')
+parser.add_argument('--event-batch', type=int, default=256,
+                    help='events buffered per process before they are written (default: 256; sources flush at their end)')
+parser.add_argument('--db', default='acab_results.sqlite',
+                    help='SQLite results database; sources already processed without error are skipped (default: acab_results.sqlite)')
+parser.add_argument('--resume', action='store_true',
+                    help='skip every source with a result in the database, also failed ones (default: failed sources are retried)')
+parser.add_argument('--queue', metavar='PATH',
+                    help='SQLite work queue shared by drivers on several machines; sources are claimed under a lease instead of '
+                         'processed in catalog order. Needs a local or lock-safe filesystem (e.g. Lustre, GPFS); NFS & SMB are '
+                         'refused (default: none)')
+parser.add_argument('--queue-network', action='store_true',
+                    help='allow the queue on NFS or SMB, where POSIX locking is known to work')
+parser.add_argument('--lease', type=float, default=600,
+                    help='queue lease in seconds, renewed by a heartbeat while a source is alive; sources of drivers that stop '
+                         'renewing are retried (default: 600)')
+parser.add_argument('--max-hold', type=float, default=0,
+                    help='seconds a source may be held before it is taken to be hung & its lease left to expire, so another '
+                         'driver retries it (default: --source-timeout plus one lease, or 6 leases without a source budget)')
+parser.add_argument('--max-attempts', type=int, default=3,
+                    help='queue attempts per source before it is parked (default: 3)')
+parser.add_argument('--serve', metavar='SPOOL',
+                    help='run as a fit service: keep Sherpa, XSPEC & the worker processes warm & fit the source batches '
+                         'submitted to this spool directory until stopped (default: none)')
+parser.add_argument('--idle-exit', type=float, default=0,
+                    help='stop the service after this many seconds without batches (default: 0, run until stopped)')
+parser.add_argument('--submit', metavar='SPOOL',
+                    help='submit the selected sources (--catalog, --shard, --obsid) as one batch to the service of this '
+                         'spool directory instead of fitting them (default: none)')
+parser.add_argument('--wait', action='store_true',
+                    help='with --submit, wait for the batch & print the outcome of each source')
+parser.add_argument('--timing-report', default='timing_summary.txt',
+                    help='file for the per-run table of stage times over sources (default: timing_summary.txt)')
 
-# TEMPORARILY CONTRAIN NUMBER OF SOURCES FOR TESTING
-# sources = sources[0:1]
 
-# For each source in source list
-for source,n in zip(sources,range(1,len(sources)+1)):
 
-    # Unpack source
-    obsid,srcid,ra,dec,srcnh = source
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     start_pool()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Start a pool of worker processes, each with its own Sherpa session, replaced by fresh ones after     #
+#               --recycle-sources sources.                                                                           #
+#                                                                                                                    #
+# VARIABLES:    args -- Namespace; command line options                                                              #
+#               initargs -- Tuple; arguments of acab_funcs.init_worker()                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def start_pool(args, initargs):
+
+    return(multiprocessing.Pool(args.workers, initializer=init_worker, initargs=initargs,
+                                maxtasksperchild=limits['sources'] or None))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     recycle_pool()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Wait for the workers of a pool to exit & start a fresh pool (a pool cannot replace a single worker,  #
+#               so all are replaced once one holds too much memory). Call with no sources in flight.                 #
+#                                                                                                                    #
+# VARIABLES:    pool -- multiprocessing.Pool; from start_pool()                                                      #
+#               args -- Namespace; command line options                                                              #
+#               initargs -- Tuple; arguments of acab_funcs.init_worker()                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def recycle_pool(pool, args, initargs):
+
+    print('\n\n\nRECYCLING WORKERS (more than %g MB resident)' % args.max_rss_mb)
+    pool.close()
+    pool.join()
+
+    return(start_pool(args, initargs))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     run_pool()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Process sources on a pool of worker processes, saving results in catalog order. Each worker has a    #
+#               source queued behind the one it is fitting; once a worker exceeds --max-rss-mb, no more sources are  #
+#               handed out until the pool is drained & recycled.                                                     #
+#                                                                                                                    #
+# VARIABLES:    args -- Namespace; command line options                                                              #
+#               db -- SQLite connection; results database                                                            #
+#               tasks -- Iterable of tuples; arguments of process_source()                                           #
+#               timings -- List; stage timings of each processed source are appended                                 #
+#               pool -- multiprocessing.Pool; from start_pool(), returned (or its replacement) for further use       #
+#               initargs -- Tuple; arguments of acab_funcs.init_worker()                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def run_pool(args, db, tasks, timings, pool, initargs):
+
+    tasks = iter(tasks)
+    pending = collections.deque()
+
+    try:
+        recycle = False
+        while True:
+
+            # Hand out sources, unless the pool is to be recycled
+            while len(pending) < 2*args.workers and not recycle:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.append(pool.apply_async(process_task, (task,)))
+
+            # Drained: recycle the pool or stop
+            if not pending:
+                if not recycle:
+                    break
+                pool = recycle_pool(pool, args, initargs)
+                recycle = False
+                continue
+
+            # Record oldest source (errors of the worker itself are raised here)
+            result = pending.popleft().get()
+            save_result(db, result, result['position'])
+            submit_plots(result['plots'])
+            timings.append(result['timings'])
+            recycle = recycle or over_limit(result)
+
+    except BaseException:
+        pool.terminate()
+        raise
+
+    return(pool)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     run_queue()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Add catalog sources to the work queue, then claim & process sources (keeping every worker busy)      #
+#               until the queue is drained, also by other drivers. A heartbeat renews the leases of sources being    #
+#               processed until they are held for longer than --max-hold (hung).                                     #
+#                                                                                                                    #
+# VARIABLES:    args -- Namespace; command line options                                                              #
+#               db -- SQLite connection; results database                                                            #
+#               catalog -- Iterable of (<position>, <source list>)                                                   #
+#               timings -- List; stage timings of each processed source are appended                                 #
+#               responses -- Tuple; (<directory>, <megabytes>) of the shared response cache, or None                 #
+#               budgets -- Dictionary; watchdog budgets {<stage>: <seconds>}, or None                                #
+#               events -- Tuple; (<path>, <batch size>) of the event log, or None                                    #
+#               flux -- Tuple; (<samples>, <workers>, <seed>) of flux uncertainties, or None                         #
+#               strategy -- Tuple; (<optimizers>, <maximum reduced statistic>, <engine>) of fits, or None            #
+#               models -- Dictionary; candidate models per tier, for source fingerprints                             #
+#               settings -- Dictionary; fit settings, for source fingerprints                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def run_queue(args, db, catalog, timings, responses=None, budgets=None, events=None, flux=None, strategy=None, models=None,
+              settings=None):
+
+    work = open_queue(args.queue, args.queue_network)
+    print('\n\n\n%d SOURCES QUEUED' % enqueue(work, catalog))
+
+    # Results of sources in flight; filled directly (serial) or by pool callbacks
+    worker = worker_id()
+    results = queue.Queue()
+    slots = max(args.workers,1)
+    initargs = (args.plots,args.plot_format,responses,budgets,events,flux,strategy)
+    pool = None if args.workers <= 1 else start_pool(args, initargs)
+
+    # Sources being processed & when they were claimed; a source held past its watchdog budget is hung
+    held = {}
+    max_hold = args.max_hold or (args.source_timeout + args.lease if args.source_timeout else 6*args.lease)
+    stop = start_heartbeat(args.queue, worker, held, args.lease, max_hold, args.queue_network)
+
+    try:
+        inflight, recycle = 0, False
+        while True:
+
+            # Claim sources for free workers, unless the pool is to be recycled
+            while inflight < slots and not recycle:
+                claimed = claim(work, worker, args.lease, args.max_attempts)
+                if claimed is None:
+                    break
+                n,source = claimed
+                held[(source[0],source[1])] = time.time()
+                reuse = reuse_for(db, source, models, settings)
+                if pool is None:
+                    results.put(process_source(source, n, 0, BOUNDS, args.triage, reuse))
+                else:
+                    pool.apply_async(process_task, ((source,n,0,BOUNDS,args.triage,reuse),), callback=results.put, error_callback=results.put)
+                inflight += 1
+
+            # Record next result; failed sources go back to the queue until parked
+            if inflight:
+                result = results.get()
+                inflight -= 1
+                if isinstance(result, Exception):
+                    raise result
+                save_result(db, result, result['position'])
+                held.pop((result['obsid'],result['srcid']), None)
+                state = finish(work, worker, result, args.max_attempts)
+                if state == 'parked':
+                    print('\n\n\nPARKED SOURCE %s_%s: %s' % (result['obsid'],result['srcid'],result['error']))
+                elif state == 'stale':
+                    print('\n\n\nSTALE RESULT OF %s_%s: lease expired & source claimed by another driver' % (result['obsid'],result['srcid']))
+                submit_plots(result['plots'])
+                timings.append(result['timings'])
+                recycle = pool is not None and (recycle or over_limit(result))
+
+            # Pool drained for recycling
+            elif recycle:
+                pool = recycle_pool(pool, args, initargs)
+                recycle = False
+
+            # Nothing to claim; wait while other drivers hold leases (retried here if they die), else done
+            elif work.execute("SELECT COUNT(*) FROM queue WHERE state = 'leased'").fetchone()[0]:
+                time.sleep(min(args.lease/4.0,30))
+            else:
+                break
+
+    finally:
+        stop.set()
+        if pool is not None:
+            pool.terminate()
+
+    print('\n\n\nQUEUE: %s' % '  '.join('%s: %d' % item for item in queue_status(work).items()))
+    work.close()
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     run_service()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Fit source batches submitted to the spool directory (acab_service) with Sherpa, XSPEC & the worker   #
+#               processes set up once; sources already done with the same inputs are skipped, as in catalog runs.    #
+#               Runs until interrupted, or until --idle-exit seconds pass without a batch.                           #
+#                                                                                                                    #
+# VARIABLES:    args -- Namespace; command line options                                                              #
+#               db -- SQLite connection; results database                                                            #
+#               timings -- List; stage timings of each processed source are appended                                 #
+#               initargs -- Tuple; arguments of acab_funcs.init_worker()                                             #
+#               models -- Dictionary; candidate models per tier, for source fingerprints                             #
+#               settings -- Dictionary; fit settings, for source fingerprints                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def run_service(args, db, timings, initargs, models, settings):
+
+    # Batches claimed by services of this host that have stopped are fitted again
+    spool = open_spool(args.serve)
+    orphans = requeue_orphans(spool)
+    if orphans:
+        print('\n\n\n%d ORPHANED BATCHES REQUEUED' % orphans)
+
+    # Set up the fitting process(es) before the first batch
+    if args.workers <= 1:
+        warm_up()
+    pool = None if args.workers <= 1 else start_pool(args, initargs)
+    print('\n\n\nSERVING %s WITH %d WORKER(S)' % (spool,max(args.workers,1)))
 
     try:
-        # Print current source
-        print('\n\n\nSOURCE %d/%d\n\n\n' % (n,len(sources)))
+        idle = time.time()
+        while True:
+
+            # Next batch; stop once idle for too long
+            batch = claim_batch(spool)
+            if batch is None:
+                if args.idle_exit and time.time()-idle > args.idle_exit:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+            name, sources = batch
+            print('\n\n\nBATCH %s: %d SOURCES' % (name,len(sources)))
+
+            # Sources of the batch whose inputs changed since they were last done, with reusable candidate fits
+            try:
+                catalog = changed_sources(args.db, sources, done_sources(db), models, settings)
+                tasks = ((source,n,0,BOUNDS,args.triage,reuse) for n,source,reuse in catalog)
+                if pool is None:
+                    for task in tasks:
+                        result = process_source(*task)
+                        save_result(db, result, result['position'])
+                        submit_plots(result['plots'])
+                        timings.append(result['timings'])
+                else:
+                    pool = run_pool(args, db, tasks, timings, pool, initargs)
+            except Exception as e:
+                finish_batch(spool, name, source_outcomes(db, sources), '%s: %s' % (type(e).__name__,e))
+                raise
+            finish_batch(spool, name, source_outcomes(db, sources))
+            idle = time.time()
+
+    # Stopped by hand; a batch in progress is requeued by the next service on this host
+    except KeyboardInterrupt:
+        print('\n\n\nSERVICE STOPPED')
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     submit()                                                                                             #
+#                                                                                                                    #
+# DESCRIPTION:  Submit the selected catalog sources as one batch to a service's spool directory; with --wait, print  #
+#               the outcome of each source once the batch is finished.                                               #
+#                                                                                                                    #
+# VARIABLES:    args -- Namespace; command line options                                                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def submit(args):
+
+    sources = list(read_catalog(args.catalog, args.shard, args.obsids and set(args.obsids)))
+    name = submit_batch(args.submit, sources)
+    print('\n\n\n%d SOURCES SUBMITTED AS BATCH %s' % (len(sources),name))
+
+    if args.wait:
+        outcome = wait_batch(args.submit, name)
+        for source in outcome['sources']:
+            print('%s_%s: %s %s' % (source['obsid'],source['srcid'],source['status'],source['model'] or source['error'] or ''))
+        if outcome['error']:
+            print('\n\n\nBATCH FAILED: %s' % outcome['error'])
+
+
+
+
+
+
+def main():
+
+    # Parse command line options
+    args = parser.parse_args()
+    if args.tournament_workers > 1 and args.workers > 1:
+        parser.error('--tournament-workers needs --workers 1 (pool workers cannot start pools of their own)')
+    if args.triage:
+        try:
+            import astropy.io.fits
+        except ImportError:
+            parser.error('--triage needs astropy to read the PHA files')
+    if (args.recycle_sources or args.max_rss_mb) and args.workers <= 1:
+        parser.error('--recycle-sources & --max-rss-mb replace worker processes; use --workers 2 or more')
+    if args.serve and args.queue:
+        parser.error('--serve & --queue are separate modes')
+
+    # Submit sources to a running service; nothing is fitted here
+    if args.submit:
+        submit(args)
+        return
+
+    # Set start time
+    start_time = time.time()
+
+    # Watchdog budgets for this process & the worker processes
+    budgets = {'fit': args.fit_timeout, 'tournament': args.tournament_timeout, 'source': args.source_timeout}
+    set_budgets(**budgets)
+
+    # Shared response cache for this process & the worker processes
+    responses = None
+    if args.response_cache:
+        responses = (args.response_cache,args.response_cache_mb)
+        install_response_cache(*responses)
+
+    # Event log of this process & the worker processes
+    events = (args.events,args.event_batch)
+    set_event_log(*events)
+
+    # Flux uncertainties of this process & the worker processes
+    flux = (args.flux_samples,args.flux_workers,None)
+    set_flux_options(*flux)
+
+    # Optimizer strategy of this process & the worker processes
+    strategy = (args.fit_methods.split(','),args.escalate_rstat,args.engine)
+    set_fit_strategy(*strategy)
+
+    # Worker processes replaced after a number of sources or above a memory limit
+    set_recycling(args.recycle_sources, args.max_rss_mb)
+
+    # Results database; skip sources already done with the same inputs, and with --resume every source written, also
+    # failed ones
+    db = open_db(args.db)
+    done = done_sources(db)
+    written = written_sources(db) if args.resume else set()
+
+    # Fingerprinted inputs besides the source's files: candidate models of the tiers in use & fit settings
+    models = {tier: candidate_models(tier) for tier in ([tier[0] for tier in TIERS] if args.triage else ['bright'])}
+    settings = fit_settings(BOUNDS, args.triage, strategy=strategy)
+
+    # Sources of this shard still to be processed (not done, or their files, models or settings changed), read lazily
+    # from the catalog, with candidate fits stored for the same data & settings
+    sources = ((n,source) for n,source in read_catalog(args.catalog, args.shard, args.obsids and set(args.obsids))
+               if (source[0],source[1]) not in written)
+    catalog = changed_sources(args.db, sources, done, models, settings)
+
+    # Arguments of process_source() for each source (catalog size is not known in advance, so total is 0)
+    tasks = ((source,n,0,BOUNDS,args.triage,reuse) for n,source,reuse in catalog)
+
+    # Stage timings of each processed source
+    timings = []
+
+    # Plots are captured while fitting & rendered in the background
+    set_plot_policy(args.plots, args.plot_format)
+    start_renderer(args.plot_workers)
+
+    # Candidate models of each source are fitted at the same time if requested
+    start_tournament_pool(args.tournament_workers, args.plots, args.plot_format, responses, budgets, events, strategy)
+
+    # Worker processes' set-up
+    initargs = (args.plots,args.plot_format,responses,budgets,events,flux,strategy)
+
+    # Service; batches are claimed from the spool directory instead of the catalog
+    if args.serve:
+        run_service(args, db, timings, initargs, models, settings)
+
+    # Queue run; sources are claimed from the shared queue (filled from the catalog by every driver)
+    elif args.queue:
+        run_queue(args, db, ((n,source) for n,source,reuse in catalog), timings, responses, budgets, events, flux, strategy, models, settings)
+
+    # Serial run in this process, with a Sherpa session of its own (acab_funcs.require_session()); spectra of the next
+    # sources are optionally read ahead
+    elif args.workers <= 1:
+        if args.prefetch > 0:
+            start_prefetch(args.prefetch_mb)
+            tasks = prefetch_tasks(tasks, args.prefetch)
+        for task in tasks:
+            result = process_source(*task)
+            save_result(db, result, result['position'])
+            submit_plots(result['plots'])
+            timings.append(result['timings'])
 
-        # Set model
-        model = choose_model(source)
-        print('\n\n\nMODEL: %s\n\n\n' % model)
+    # Parallel run; each worker owns a separate Sherpa session & is recycled if requested
+    else:
+        pool = run_pool(args, db, tasks, timings, start_pool(args, initargs), initargs)
+        pool.terminate()
 
-        # Fit sources
-        fitting(source,model,bounds=[0.3,10],silent=True)
+    # Wait for plots to be rendered
+    stop_prefetch()
+    stop_tournament_pool()
+    finish_plots()
+    db.close()
 
-        # Log stats
-        log_info(source,model)
+    # Print number of sources processed in this run
+    print('\n\n\n%d SOURCES PROCESSED' % len(timings))
 
-        # Print runtime
-        print('\nRUNTIME FOR SOURCE %s-%s: %d sec\n' % (obsid,srcid,time.time()-start_time))
+    # Print & save table of stage times (seconds; fits, function evaluations, escalations & memory in MB per source in
+    # the last rows)
+    if timings:
+        summary = timing_summary(timings)
+        print('\n\n\nTIMING SUMMARY (%d SOURCES)\n\n%s' % (len(timings),summary))
+        with open(args.timing_report,'w') as f:
+            f.write(summary + '\n')
 
+    # Print runtime
+    print('\n\n\nTOTAL RUNTIME: %d\n\n\n' % (time.time()-start_time))
 
-    except:
-        print('\n\n\nERROR in SOURCE %s_%s' % (obsid,srcid))
 
-# Print runtime
-print('\n\n\nTOTAL RUNTIME: %d\n\n\n' % (time.time()-start_time))
+if __name__ == '__main__':
+    main()
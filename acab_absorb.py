@@ -0,0 +1,159 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_absorb.py                                                      #
+#                                                                           #
+# PURPOSE: Frozen Galactic absorption for ACAB fits. The xstbabs curve of   #
+#          the catalog nH is computed once per energy grid & reused as a    #
+#          fixed multiplicative array; XSPEC abundance & cross-section      #
+#          tables are set once per process. Sherpa is imported on first     #
+#          use only, so drivers that do not fit need not load it.           #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import hashlib
+import numpy as np
+
+# XSPEC abundance & cross-section tables used for all fits
+XS_ABUND = 'wilm'
+XS_XSECT = 'vern'
+
+# Maximum number of cached transmission curves
+MAX_CURVES = 256
+
+# Transmission curves for (nH, energy grid) keys, the XSPEC model evaluating them, whether XSPEC is set up, and the
+# FrozenTransmission model class once defined
+curves = {}
+tbabs = None
+xspec_ready = False
+model_class = None
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     init_xspec()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Set XSPEC abundance & cross-section tables, once per process.                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def init_xspec():
+
+    global xspec_ready
+
+    if not xspec_ready:
+        from sherpa.astro import xspec
+        xspec.set_xsabund(XS_ABUND)
+        xspec.set_xsxsect(XS_XSECT)
+        xspec_ready = True
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     transmission()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return xstbabs transmission of a column density on an energy grid, computed once per (nH, grid).     #
+#                                                                                                                    #
+# VARIABLES:    nh -- Float; column density in 1e22 cm^-2                                                            #
+#               xlo, xhi -- Arrays; energy bin edges in keV (xhi may be None)                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def transmission(nh, xlo, xhi=None):
+
+    global tbabs
+
+    xlo = np.ascontiguousarray(xlo, dtype=float)
+    grid = xlo.tobytes() if xhi is None else xlo.tobytes() + np.ascontiguousarray(xhi, dtype=float).tobytes()
+    key = (float(nh), len(xlo), hashlib.sha1(grid).hexdigest())
+
+    if key not in curves:
+        from sherpa.astro import xspec
+
+        init_xspec()
+        if tbabs is None:
+            tbabs = xspec.XStbabs('frozentbabs')
+
+        if len(curves) >= MAX_CURVES:
+            curves.clear()
+        curves[key] = tbabs.calc([float(nh)], xlo) if xhi is None else tbabs.calc([float(nh)], xlo, xhi)
+        curves[key].setflags(write=False)
+
+    return(curves[key])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     frozen_transmission()                                                                                #
+#                                                                                                                    #
+# DESCRIPTION:  Return class FrozenTransmission, defined (& Sherpa imported) on the first call: a Sherpa model equal #
+#               to xstbabs with a frozen column density (parameter nH, always frozen), returning the cached curve    #
+#               from transmission() instead of calling XSPEC on every model evaluation. The class is also available  #
+#               as acab_absorb.FrozenTransmission (e.g. for pickle).                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def frozen_transmission():
+
+    global model_class
+
+    if model_class is None:
+        from sherpa.models.model import ArithmeticModel
+        from sherpa.models.parameter import Parameter
+
+        class FrozenTransmission(ArithmeticModel):
+
+            def __init__(self, name='frozentransmission'):
+
+                self.nH = Parameter(name, 'nH', 1.0, 0.0, 1.0E6, 0.0, 1.0E6, units='10^22 atoms / cm^2', alwaysfrozen=True)
+                ArithmeticModel.__init__(self, name, (self.nH,))
+
+            def calc(self, p, xlo, xhi=None, *args, **kwargs):
+
+                return(transmission(p[0], xlo, xhi))
+
+        FrozenTransmission.__qualname__ = 'FrozenTransmission'
+        model_class = FrozenTransmission
+
+    return(model_class)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     __getattr__()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Module attribute hook; defines FrozenTransmission when first looked up, see frozen_transmission().   #
+#                                                                                                                    #
+# VARIABLES:    name -- String; attribute name                                                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def __getattr__(name):
+
+    if name == 'FrozenTransmission':
+        return(frozen_transmission())
+
+    raise AttributeError('module %r has no attribute %r' % (__name__,name))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     frozen_source()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return model expression with the Galactic absorption xstbabs.abs1 replaced by FrozenTransmission.    #
+#                                                                                                                    #
+# VARIABLES:    model -- String; '(<absorption models>)*(emission models)'                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def frozen_source(model):
+
+    return(model.replace('xstbabs.abs1', 'frozentransmission.abs1'))
@@ -0,0 +1,356 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_bench.py                                                       #
+#                                                                           #
+# PURPOSE: Offline benchmark of ACAB fitting & model selection throughput.  #
+#          Fakes grouped spectra (synthetic ARF, RMF & background) for the  #
+#          candidate model families at several count levels, then times     #
+#          single fits, model tournaments & a mini-catalog run. Results     #
+#          (fits per second, peak memory) are written as JSON to compare    #
+#          between commits.                                                 #
+#                                                                           #
+# USAGE: python acab_bench.py [--counts 100 1000 10000] [--models 3]        #
+#                             [--output bench.json] [--compare old.json]    #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import numpy as np
+
+# Command line options
+parser = argparse.ArgumentParser(description='Benchmark ACAB fitting & model selection on fake spectra.')
+parser.add_argument('--counts', type=int, nargs='+', default=[100,1000,10000],
+                    help='source counts of the fake spectra (default: 100 1000 10000)')
+parser.add_argument('--models', type=int, default=3,
+                    help='number of candidate models (from candidate_models()) to fake spectra for (default: 3)')
+parser.add_argument('--exposure', type=float, default=20000.0,
+                    help='exposure of the fake spectra in seconds (default: 20000)')
+parser.add_argument('--binning', type=int, default=15,
+                    help='counts per group of the fake spectra (default: 15)')
+parser.add_argument('--seed', type=int, default=1,
+                    help='random seed for the fake spectra (default: 1)')
+parser.add_argument('--workdir', default=None,
+                    help='directory for fake spectra & pipeline output (default: new temporary directory)')
+parser.add_argument('--output', default='bench.json',
+                    help='JSON file for the benchmark results (default: bench.json)')
+parser.add_argument('--compare', default=None,
+                    help='JSON file of an earlier benchmark to compare the results with')
+
+# Galactic nH (cm^-2) of the fake sources, as in the catalog's fifth column
+BENCH_NH = '3e20'
+
+# Starting values of the fake sources' model parameters (others keep Sherpa's defaults)
+BENCH_PARS = {'abs2.nH': 0.5, 'powlaw.gamma': 1.8, 'compbb.kT': 2.0, 'didkbb.Tin': 1.0,
+              'diskpn.T_max': 1.0, 'apec.kT': 1.0, 'mekal.kT': 0.8}
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     peak_rss()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Return peak resident memory of this process in MB since the last acab_memory.reset_peak() (VmHWM);   #
+#               where /proc is not available, the peak over the lifetime of the process.                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def peak_rss():
+
+    from acab_memory import memory_mb
+
+    peak = memory_mb('VmHWM')
+    if peak is not None:
+        return(peak)
+
+    # ru_maxrss is in kB on Linux (bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return(rss/1024.0**2 if sys.platform == 'darwin' else rss/1024.0)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     make_responses()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Return synthetic ARF & diagonal RMF on a 0.1-11 keV grid, roughly shaped like an ACIS effective      #
+#               area.                                                                                                #
+#                                                                                                                    #
+# VARIABLES:    arfname, rmfname -- Strings; file names the responses will be saved as                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def make_responses(arfname, rmfname):
+
+    from sherpa.astro.instrument import create_arf, create_delta_rmf
+
+    # Energy grid (keV); 10 eV bins
+    egrid = np.arange(0.1, 11.0, 0.01)
+    elo, ehi = egrid[:-1], egrid[1:]
+
+    # Effective area (cm^2); rises below ~1.5 keV, falls off above
+    emid = (elo+ehi)/2
+    specresp = 600.0*(1-np.exp(-(emid/0.8)**3))*np.exp(-emid/6.0)
+
+    arf = create_arf(elo, ehi, specresp=specresp, name=arfname)
+    rmf = create_delta_rmf(elo, ehi, e_min=elo, e_max=ehi, name=rmfname)
+
+    return(arf, rmf)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     make_spectrum()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Fake a grouped spectrum (with ARF, RMF & background files) in the layout read by prepare_data();     #
+#               return the source list entry [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>].                  #
+#                                                                                                                    #
+# VARIABLES:    session -- Sherpa session used for faking (not the one used for fitting)                             #
+#               obsid, srcid -- Strings; observation & source ID of the fake source                                  #
+#               model -- String; '<model>' to fake the spectrum from                                                 #
+#               counts -- Integer; expected source counts                                                            #
+#               exposure -- Float; exposure in seconds                                                               #
+#               binning -- Integer; counts per group                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def make_spectrum(session, obsid, srcid, model, counts, exposure, binning):
+
+    # Start from empty data sets
+    for id in ('src','bkg'):
+        if id in session.list_data_ids():
+            session.delete_data(id)
+
+    # File names, as expected by prepare_data()
+    os.makedirs(obsid, exist_ok=True)
+    stem = '%s/extracted_spectra_%s_%s' % (obsid,obsid,srcid)
+    arf, rmf = make_responses(stem + '.arf', stem + '.rmf')
+
+    # Background: flat spectrum from a region 10x the source area, ~5% of the source counts in the source region
+    session.set_source('bkg', 'const1d.bkgflat')
+    session.fake_pha('bkg', arf, rmf, exposure, backscal=10.0)
+    bkgflat = session.get_model_component('bkgflat')
+    bkgflat.c0.val *= 0.05*counts*10.0/max(session.calc_model_sum(id='bkg'),1e-30)
+    session.fake_pha('bkg', arf, rmf, exposure, backscal=10.0)
+    bkg = session.get_data('bkg')
+    bkg.name = stem + '_bkg.pi'
+
+    # Source: model with benchmark parameter values, normalizations scaled to the requested counts
+    session.set_source('src', model)
+    source = session.get_source('src')
+    for par in source.pars:
+        if par.fullname in BENCH_PARS:
+            par.val = BENCH_PARS[par.fullname]
+        elif par.fullname == 'abs1.nH':
+            par.val = float(BENCH_NH)/1.0E22
+    session.fake_pha('src', arf, rmf, exposure, backscal=1.0)
+    scale = counts/max(session.calc_model_sum(id='src'),1e-30)
+    for par in source.pars:
+        if par.name in ('norm','ampl') and not par.frozen:
+            par.val = min(par.val*scale, par.max)
+    session.fake_pha('src', arf, rmf, exposure, backscal=1.0, bkg=bkg)
+    session.set_bkg('src', bkg)
+    session.group_counts('src', binning)
+
+    # Save spectrum, responses & background; PHA headers point at the response & background files
+    session.save_arf('src', stem + '.arf', clobber=True)
+    session.save_rmf('src', stem + '.rmf', clobber=True)
+    session.save_pha('bkg', stem + '_bkg.pi', clobber=True)
+    session.save_pha('src', stem + '_grp.pi', clobber=True)
+
+    return([obsid, srcid, '0.0', '0.0', BENCH_NH])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     make_catalog()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Fake spectra for the first candidate models at each count level in the current directory; return     #
+#               list of (source, model, counts).                                                                     #
+#                                                                                                                    #
+# VARIABLES:    models -- List of strings; models to fake spectra from                                               #
+#               count_levels -- List of integers; source counts                                                      #
+#               exposure -- Float; exposure in seconds                                                               #
+#               binning -- Integer; counts per group                                                                 #
+#               seed -- Integer; random seed                                                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def make_catalog(models, count_levels, exposure, binning, seed=1):
+
+    from acab_funcs import new_session
+
+    # Separate session, so faking leaves the fitting session untouched; seeded random numbers for fake_pha()
+    session = new_session()
+    np.random.seed(seed)
+    if hasattr(session,'set_rng'):
+        session.set_rng(np.random.default_rng(seed))
+
+    catalog = []
+    for n,model in enumerate(models):
+        for counts in count_levels:
+            srcid = '%d%06d' % (n+1,counts)
+            catalog.append((make_spectrum(session, 'bench', srcid, model, counts, exposure, binning), model, counts))
+
+    return(catalog)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     bench_stage()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Time a benchmark stage over the fake catalog; return wall time, fits, fits/s & peak memory of the    #
+#               stage (the peak is reset first, so earlier stages do not count).                                     #
+#                                                                                                                    #
+# VARIABLES:    name -- String; stage name (printed)                                                                 #
+#               catalog -- List of (source, model, counts); from make_catalog()                                      #
+#               run -- Function; called with (source, model), runs the stage for one source                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def bench_stage(name, catalog, run):
+
+    from acab_funcs import clear_fit_cache
+    from acab_timing import pop_timings
+    from acab_memory import reset_peak
+
+    reset_peak()
+    per_counts = {}
+    start = time.perf_counter()
+    fits = 0
+    for source,model,counts in catalog:
+
+        # Every source starts without cached fits or timings
+        clear_fit_cache()
+        pop_timings()
+
+        t0 = time.perf_counter()
+        out = run(source, model)
+        seconds = time.perf_counter()-t0
+
+        # Fits counted by acab_timing; process_source() hands its count back in its result
+        if isinstance(out, dict) and 'timings' in out:
+            nfits = out['timings']['fits']
+        else:
+            nfits = pop_timings()['fits']
+
+        fits += nfits
+        stats = per_counts.setdefault(str(counts), {'sources': 0, 'seconds': 0.0, 'fits': 0})
+        stats['sources'] += 1
+        stats['seconds'] += seconds
+        stats['fits'] += nfits
+
+    seconds = time.perf_counter()-start
+    result = {'seconds': seconds, 'sources': len(catalog), 'fits': fits,
+              'fits_per_sec': fits/seconds if seconds > 0 else 0.0,
+              'peak_rss_mb': peak_rss(), 'by_counts': per_counts}
+    print('%-12s %8.2f s %6d fits %8.2f fits/s %8.1f MB' % (name,seconds,fits,result['fits_per_sec'],result['peak_rss_mb']))
+
+    return(result)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     compare()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Print fits/s & peak memory of two benchmark results side by side.                                    #
+#                                                                                                                    #
+# VARIABLES:    old, new -- Dictionaries; benchmark results (as written to --output)                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def compare(old, new):
+
+    print('\n%-12s %12s %12s %8s %12s %12s' % ('STAGE','OLD FITS/S','NEW FITS/S','SPEEDUP','OLD MB','NEW MB'))
+    for stage in new['stages']:
+        if stage not in old['stages']:
+            continue
+        o, n = old['stages'][stage], new['stages'][stage]
+        speedup = o['seconds']/n['seconds'] if n['seconds'] > 0 else float('nan')
+        print('%-12s %12.2f %12.2f %7.2fx %12.1f %12.1f' % (stage,o['fits_per_sec'],n['fits_per_sec'],speedup,o['peak_rss_mb'],n['peak_rss_mb']))
+
+
+
+
+
+
+def main():
+
+    # Parse command line options; output paths are relative to where the benchmark is started
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    old = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+    # Import pipeline (from this file's directory) once options are known
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import sherpa
+    from acab_funcs import candidate_models, prepare_data, fitting_fast, choose_model, process_source
+    from acab_plots import set_plot_policy
+
+    # Work in a scratch directory; pipeline writes plots & the event log relative to it
+    workdir = args.workdir or tempfile.mkdtemp(prefix='acab_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    for subdir in ('plots/raw','plots/fits'):
+        os.makedirs(subdir, exist_ok=True)
+
+    # Plots are not part of the fitting benchmark
+    set_plot_policy('none')
+
+    # Fake spectra
+    models = candidate_models()[:args.models]
+    t0 = time.perf_counter()
+    catalog = make_catalog(models, args.counts, args.exposure, args.binning, args.seed)
+    print('\nFaked %d spectra in %s (%.1f s)\n' % (len(catalog),workdir,time.perf_counter()-t0))
+
+    # Single fits of the true model (spectrum prepared beforehand), model tournaments & full per-source pipeline
+    def single_fit(source, model):
+        prepare_data(source)
+        fitting_fast(source, model)
+
+    stages = {}
+    stages['single_fit'] = bench_stage('single_fit', catalog, single_fit)
+    stages['tournament'] = bench_stage('tournament', catalog, lambda source,model: choose_model(source))
+    stages['catalog'] = bench_stage('catalog', catalog, lambda source,model: process_source(source))
+
+    # Identify the run, so results from different commits can be told apart
+    try:
+        commit = subprocess.check_output(['git','rev-parse','--short','HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        commit = None
+
+    result = {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'sherpa': sherpa.__version__, 'platform': platform.platform(),
+              'counts': args.counts, 'models': models, 'exposure': args.exposure, 'binning': args.binning,
+              'seed': args.seed, 'stages': stages}
+
+    with open(output,'w') as f:
+        json.dump(result, f, indent=2)
+    print('\nResults written to %s' % output)
+
+    if old is not None:
+        compare(old, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_catalog.py                                                     #
+#                                                                           #
+# PURPOSE: Streaming, sharded reader of ACAB source catalogs (CSV rows of   #
+#          obsid, srcid, RA, DEC, Goddard nH), so several nodes can each    #
+#          take a disjoint slice of a large catalog without loading it.     #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import argparse
+import zlib
+
+# Catalog columns
+COLUMNS = ('obsid','srcid','ra','dec','nh')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     parse_shard()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Parse a shard specification 'i/N' (0 <= i < N) into a tuple (i, N); for argparse 'type'.             #
+#                                                                                                                    #
+# VARIABLES:    text -- String; e.g. '0/4'                                                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def parse_shard(text):
+
+    try:
+        index,count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('shard must be i/N, e.g. 0/4, not %r' % text)
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard i/N needs 0 <= i < N, not %r' % text)
+
+    return((index,count))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     shard_of()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Return shard (0 ... count-1) of an observation; stable across processes & nodes, and all sources of  #
+#               an observation go to the same shard.                                                                 #
+#                                                                                                                    #
+# VARIABLES:    obsid -- String; observation ID                                                                      #
+#               count -- Integer; number of shards                                                                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def shard_of(obsid, count):
+
+    return(zlib.crc32(obsid.encode()) % count)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     parse_source()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Validate a catalog row; return source list [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]     #
+#               of stripped strings, or raise ValueError.                                                            #
+#                                                                                                                    #
+# VARIABLES:    fields -- List of strings; comma-separated fields of the row                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def parse_source(fields):
+
+    if len(fields) != len(COLUMNS):
+        raise ValueError('expected %d columns (%s), found %d' % (len(COLUMNS),', '.join(COLUMNS),len(fields)))
+
+    source = [field.strip() for field in fields]
+    obsid,srcid,ra,dec,nh = source
+
+    if not obsid or not srcid:
+        raise ValueError('empty obsid or srcid')
+    try:
+        ra,dec,nh = float(ra),float(dec),float(nh)
+    except ValueError:
+        raise ValueError('RA, DEC & nH must be numbers')
+    if not 0 <= ra <= 360 or not -90 <= dec <= 90:
+        raise ValueError('RA %g or DEC %g out of range' % (ra,dec))
+    if not nh >= 0:
+        raise ValueError('nH %g must be >= 0' % nh)
+
+    return(source)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     read_catalog()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Yield (<position>, <source list>) for each valid source of a catalog, reading it line by line.       #
+#               Positions count valid sources of the whole catalog (from 1), so they do not depend on sharding or    #
+#               filtering. Comments (#) & blank lines are ignored; invalid rows are reported & skipped.              #
+#                                                                                                                    #
+# VARIABLES:    path -- String; CSV catalog file                                                                     #
+#               shard -- Tuple of two integers; (i, N), only sources of shard i of N are yielded                     #
+#               obsids -- Set of strings; only sources of these observations are yielded (all if None)               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def read_catalog(path, shard=(0,1), obsids=None):
+
+    index,count = shard
+    position = 0
+
+    with open(path) as f:
+        for line_number,line in enumerate(f, 1):
+
+            # Skip comments & blank lines
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+
+            # Validate row
+            try:
+                source = parse_source(line.split(','))
+            except ValueError as e:
+                print('\nread_catalog(): Skipping line %d of %s: %s' % (line_number,path,e))
+                continue
+            position += 1
+
+            # Keep sources of the requested shard & observations
+            if obsids is not None and source[0] not in obsids:
+                continue
+            if count > 1 and shard_of(source[0], count) != index:
+                continue
+
+            yield(position, source)
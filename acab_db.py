@@ -0,0 +1,266 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_db.py                                                          #
+#                                                                           #
+# PURPOSE: Local SQLite results store for ACAB catalog runs; one row per    #
+#          processed source, written as each source finishes, so runs can  #
+#          skip finished sources & resume after a crash.                    #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import json
+import sqlite3
+import time
+
+# Results table; covariance results, timings, watchdog notes & input fingerprints are stored as JSON
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    obsid     TEXT NOT NULL,
+    srcid     TEXT NOT NULL,
+    position  INTEGER,
+    status    TEXT NOT NULL,
+    model     TEXT,
+    rstat     REAL,
+    dof       INTEGER,
+    statval   REAL,
+    net_src   REAL,
+    net_bkg   REAL,
+    rate_src  REAL,
+    rate_bkg  REAL,
+    pflux     REAL,
+    eflux     REAL,
+    pflux_lo  REAL,
+    pflux_hi  REAL,
+    eflux_lo  REAL,
+    eflux_hi  REAL,
+    covar     TEXT,
+    timings   TEXT,
+    error     TEXT,
+    timeouts  TEXT,
+    tier      TEXT,
+    fingerprint TEXT,
+    finished  REAL,
+    PRIMARY KEY (obsid, srcid)
+)
+'''
+
+# Candidate fit summaries (JSON, see acab_funcs.fit_summary()) per source & data/settings fingerprint, reused by
+# reruns, and SHA-1 digests of input files by path, size & modification time (see acab_fingerprint)
+FITS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fits (
+    obsid        TEXT NOT NULL,
+    srcid        TEXT NOT NULL,
+    fingerprint  TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    fit          TEXT NOT NULL,
+    PRIMARY KEY (obsid, srcid, fingerprint, model)
+)
+'''
+FILES_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path   TEXT PRIMARY KEY,
+    size   INTEGER,
+    mtime  INTEGER,
+    sha1   TEXT
+)
+'''
+
+# Columns added after the first release, added to older databases by open_db()
+ADDED_COLUMNS = (('timeouts','TEXT'),('tier','TEXT'),('fingerprint','TEXT'),
+                 ('pflux_lo','REAL'),('pflux_hi','REAL'),('eflux_lo','REAL'),('eflux_hi','REAL'))
+
+# Columns filled from the 'stats' dictionary returned by log_info()
+STAT_COLUMNS = ('rstat','dof','statval','net_src','net_bkg','rate_src','rate_bkg','pflux','eflux',
+                'pflux_lo','pflux_hi','eflux_lo','eflux_hi')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     open_db()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Open (and create if needed) a results database; return the connection.                               #
+#                                                                                                                    #
+# VARIABLES:    path -- String; SQLite database file                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def open_db(path='acab_results.sqlite'):
+
+    db = sqlite3.connect(path)
+    db.execute(SCHEMA)
+    db.execute(FITS_SCHEMA)
+    db.execute(FILES_SCHEMA)
+    columns = [row[1] for row in db.execute('PRAGMA table_info(results)')]
+    for column,kind in ADDED_COLUMNS:
+        if column not in columns:
+            db.execute('ALTER TABLE results ADD COLUMN %s %s' % (column,kind))
+    db.commit()
+
+    return(db)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     save_result()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Write (or overwrite) the result of a source & its new candidate fits, and commit, checkpointing the  #
+#               run.                                                                                                 #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#               result -- Dictionary; as returned by acab_funcs.process_source()                                     #
+#               position -- Integer; position of source in source list                                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def save_result(db, result, position=None):
+
+    stats = result['stats'] or {}
+    covar = stats.get('covar')
+
+    row = {'obsid': result['obsid'], 'srcid': result['srcid'], 'position': position,
+           'status': result['status'], 'model': result['model'],
+           'covar': None if covar is None else json.dumps(covar),
+           'timings': json.dumps(result['timings']),
+           'error': result['error'], 'timeouts': json.dumps(result.get('timeouts') or []), 'tier': result.get('tier'),
+           'fingerprint': None if result.get('fingerprint') is None else json.dumps(result['fingerprint']),
+           'finished': time.time()}
+    for column in STAT_COLUMNS:
+        row[column] = stats.get(column)
+
+    db.execute('INSERT OR REPLACE INTO results (%s) VALUES (%s)' % (','.join(row), ','.join(':%s' % column for column in row)), row)
+    if result.get('fingerprint') is not None:
+        save_fits(db, result['obsid'], result['srcid'], result['fingerprint'], result.get('fits') or {})
+    db.commit()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fits_key()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Return key of stored candidate fits: the data & settings parts of a source fingerprint (candidate    #
+#               fits do not depend on which other models compete).                                                   #
+#                                                                                                                    #
+# VARIABLES:    fingerprint -- Dictionary; from acab_fingerprint.fingerprint()                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fits_key(fingerprint):
+
+    return('%s:%s' % (fingerprint['data'],fingerprint['settings']))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     save_fits()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Store candidate fit summaries of a source; fits stored with other data or settings are dropped.      #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#               obsid -- String; observation ID                                                                      #
+#               srcid -- String; source number                                                                       #
+#               fingerprint -- Dictionary; from acab_fingerprint.fingerprint()                                       #
+#               fits -- Dictionary; {<model>: <fit summary>}                                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def save_fits(db, obsid, srcid, fingerprint, fits):
+
+    key = fits_key(fingerprint)
+    db.execute('DELETE FROM fits WHERE obsid = ? AND srcid = ? AND fingerprint != ?', (obsid,srcid,key))
+    db.executemany('INSERT OR REPLACE INTO fits (obsid, srcid, fingerprint, model, fit) VALUES (?,?,?,?,?)',
+                   [(obsid,srcid,key,model,json.dumps(fit, default=lambda value: value.item())) for model,fit in fits.items()])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     load_fits()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Return stored candidate fit summaries {<model>: <fit summary>} of a source with the same data &      #
+#               settings.                                                                                            #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#               obsid -- String; observation ID                                                                      #
+#               srcid -- String; source number                                                                       #
+#               fingerprint -- Dictionary; from acab_fingerprint.fingerprint()                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def load_fits(db, obsid, srcid, fingerprint):
+
+    rows = db.execute('SELECT model, fit FROM fits WHERE obsid = ? AND srcid = ? AND fingerprint = ?',
+                      (obsid,srcid,fits_key(fingerprint)))
+
+    return({model: json.loads(fit) for model,fit in rows})
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     done_sources()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary {(<obsid>, <source number>): <fingerprint>} of sources processed without error;    #
+#               the fingerprint is None for results stored before fingerprints were recorded.                        #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def done_sources(db):
+
+    rows = db.execute("SELECT obsid, srcid, fingerprint FROM results WHERE status = 'ok'")
+
+    return({(obsid,srcid): fingerprint and json.loads(fingerprint) for obsid,srcid,fingerprint in rows})
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     source_outcomes()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Return list of dictionaries {'obsid', 'srcid', 'status', 'model', 'error'} of the stored results of  #
+#               sources; status is 'missing' for sources without a result.                                           #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#               sources -- List of (<position>, <source list>)                                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def source_outcomes(db, sources):
+
+    outcomes = []
+    for n,source in sources:
+        row = db.execute('SELECT status, model, error FROM results WHERE obsid = ? AND srcid = ?', (source[0],source[1])).fetchone()
+        status, model, error = row or ('missing',None,None)
+        outcomes.append({'obsid': source[0], 'srcid': source[1], 'status': status, 'model': model, 'error': error})
+
+    return(outcomes)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     written_sources()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Return set of (<obsid>, <source number>) of sources with a result written, successful or not. Pool,  #
+#               queue & service runs write results out of catalog order, so a run is resumed from this set rather    #
+#               than from the highest position written.                                                              #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from open_db()                                                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def written_sources(db):
+
+    return(set(db.execute('SELECT obsid, srcid FROM results').fetchall()))
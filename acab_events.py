@@ -0,0 +1,116 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_events.py                                                      #
+#                                                                           #
+# PURPOSE: Buffered JSON Lines event log of ACAB runs (model comparisons,   #
+#          fit statistics & source outcomes, each tagged with the source). #
+#          Events are buffered per process & appended in batches under an  #
+#          exclusive lock, so worker processes can share one file.          #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import json
+import time
+import fcntl
+import atexit
+
+# Event log file, events buffered before a flush, & buffered events (JSON lines)
+log = {'path': 'acab_events.jsonl', 'batch': 256}
+buffer = []
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_event_log()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Set the event log file & batch size; events buffered for another file are written first.             #
+#                                                                                                                    #
+# VARIABLES:    path -- String; JSON Lines file, shared by all processes of a run                                    #
+#               batch -- Integer; events buffered before they are written                                            #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_event_log(path='acab_events.jsonl', batch=256):
+
+    flush_events()
+    log.update(path=path, batch=max(int(batch),1))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     emit()                                                                                               #
+#                                                                                                                    #
+# DESCRIPTION:  Buffer an event {'event': <kind>, 'time': ..., 'pid': ..., <fields>}; write the buffer once it holds #
+#               a batch. NumPy values are stored as plain numbers.                                                   #
+#                                                                                                                    #
+# VARIABLES:    kind -- String; e.g. 'ftest', 'rank', 'fit' or 'source'                                              #
+#               fields -- Keyword arguments; JSON-serializable values                                                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def emit(kind, **fields):
+
+    event = {'event': kind, 'time': time.time(), 'pid': os.getpid()}
+    event.update(fields)
+    buffer.append(json.dumps(event, default=lambda value: value.item() if hasattr(value,'item') else str(value)))
+
+    if len(buffer) >= log['batch']:
+        flush_events()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     flush_events()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Append buffered events to the event log in one write, holding an exclusive lock so that lines of     #
+#               different processes never interleave.                                                                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def flush_events():
+
+    if not buffer:
+        return
+
+    data = ('\n'.join(buffer) + '\n').encode()
+    del buffer[:]
+
+    fd = os.open(log['path'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+# Write events left in the buffer when the process exits
+atexit.register(flush_events)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     read_events()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Yield events (dictionaries) of an event log, optionally of one kind only.                            #
+#                                                                                                                    #
+# VARIABLES:    path -- String; JSON Lines file                                                                      #
+#               kind -- String; event kind, e.g. 'ftest' (all events if None)                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def read_events(path='acab_events.jsonl', kind=None):
+
+    with open(path) as f:
+        for line in f:
+            event = json.loads(line)
+            if kind is None or event['event'] == kind:
+                yield(event)
@@ -0,0 +1,248 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_fingerprint.py                                                 #
+#                                                                           #
+# PURPOSE: Fingerprints of the inputs of an ACAB source: its PHA, response  #
+#          & background file contents, the candidate model lists & the fit  #
+#          settings. Reruns reprocess only sources whose fingerprint        #
+#          changed & reuse stored candidate fits with the same data &       #
+#          settings.                                                        #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import json
+import hashlib
+from acab_triage import TIERS
+from acab_prefetch import spectrum_path
+from acab_db import open_db,load_fits
+
+# PHA header keywords naming the files a spectrum is read with
+LINKED_FILES = ('RESPFILE','ANCRFILE','BACKFILE')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     header_keywords()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary of the first value of given keywords in any HDU header of a FITS file, read card   #
+#               by card without astropy (data units are skipped, not read).                                          #
+#                                                                                                                    #
+# VARIABLES:    path -- String; FITS file                                                                            #
+#               names -- Tuple of strings; keywords                                                                  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def header_keywords(path, names):
+
+    found = {}
+    with open(path,'rb') as f:
+        while True:
+
+            # Header of the next HDU: 2880-byte blocks of 80-character cards, up to END
+            header = {}
+            while 'END' not in header:
+                block = f.read(2880)
+                if len(block) < 2880:
+                    return(found)
+                for n in range(0,2880,80):
+                    card = block[n:n+80].decode('ascii','replace')
+                    key = card[:8].strip()
+                    if key == 'END':
+                        header['END'] = None
+                        break
+                    if card[8:10] == '= ':
+                        value = card[10:].strip()
+                        if value.startswith("'"):
+                            value = value[1:].split("'")[0].strip()
+                        else:
+                            value = value.split('/')[0].strip()
+                        header[key] = value
+
+            for name in names:
+                if name in header and name not in found:
+                    found[name] = header[name]
+
+            # Skip data unit
+            naxis = int(header.get('NAXIS',0))
+            size = 0
+            if naxis:
+                size = 1
+                for n in range(1,naxis+1):
+                    size *= int(header['NAXIS%d' % n])
+            size = abs(int(header.get('BITPIX',8)))//8 * int(header.get('GCOUNT',1)) * (size + int(header.get('PCOUNT',0)))
+            f.seek((size+2879)//2880*2880, 1)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     file_digest()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return SHA-1 of a file's contents ('missing' if it does not exist). Digests are stored in the        #
+#               results database by path, size & modification time, so unchanged files are not read again.           #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from acab_db.open_db()                                                      #
+#               path -- String; file                                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def file_digest(db, path):
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return('missing')
+
+    path = os.path.realpath(path)
+    row = db.execute('SELECT sha1 FROM files WHERE path = ? AND size = ? AND mtime = ?',
+                     (path,stat.st_size,stat.st_mtime_ns)).fetchone()
+    if row is not None:
+        return(row[0])
+
+    sha = hashlib.sha1()
+    with open(path,'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            sha.update(chunk)
+    db.execute('INSERT OR REPLACE INTO files (path, size, mtime, sha1) VALUES (?,?,?,?)',
+               (path,stat.st_size,stat.st_mtime_ns,sha.hexdigest()))
+
+    return(sha.hexdigest())
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     digest()                                                                                             #
+#                                                                                                                    #
+# DESCRIPTION:  Return SHA-1 of a JSON-serializable value (dictionary keys sorted).                                  #
+#                                                                                                                    #
+# VARIABLES:    value -- Any JSON-serializable value                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def digest(value):
+
+    return(hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest())
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fit_settings()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary of settings a source's fits depend on: bounds, binning & statistic per tier (one   #
+#               chi-squared tier without triage), information criterion, optimizer strategy, fit engine & XSPEC      #
+#               abundance & cross-section tables.                                                                    #
+#                                                                                                                    #
+# VARIABLES:    bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               triage -- Boolean; sources are sorted into tiers by acab_triage                                      #
+#               criterion -- String; information criterion of choose_model(), 'aic' or 'bic'                         #
+#               strategy -- Tuple; (<optimizers>, <maximum reduced statistic>[, <engine>]) of                        #
+#                          acab_funcs.set_fit_strategy()                                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fit_settings(bounds=[0.3,10], triage=False, criterion='aic', strategy=(('levmar','neldermead'),2.0)):
+
+    # XSPEC tables; imported here, so reading headers & digests does not need Sherpa
+    from acab_absorb import XS_ABUND,XS_XSECT
+
+    tiers = TIERS if triage else (('bright',0,'chi2datavar',''),)
+
+    settings = {'bounds': list(bounds), 'tiers': [list(tier) for tier in tiers], 'criterion': criterion,
+                'methods': list(strategy[0]), 'max_rstat': float(strategy[1]), 'abund': XS_ABUND, 'xsect': XS_XSECT}
+
+    # Engine only if not Sherpa, so fingerprints of Sherpa runs are those of earlier versions
+    if len(strategy) > 2 and strategy[2] != 'sherpa':
+        settings['engine'] = strategy[2]
+
+    return(settings)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fingerprint()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return fingerprint {'data': ..., 'models': ..., 'settings': ...} of a source: digests of its PHA,    #
+#               response, ARF & background file contents, of the candidate models & of the fit settings.             #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from acab_db.open_db()                                                      #
+#               source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               models -- Dictionary; candidate models per tier {<tier>: <list of models>}                           #
+#               settings -- Dictionary; from fit_settings()                                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fingerprint(db, source, models, settings):
+
+    # Spectrum & the files named in its header, relative to it (as in Sherpa)
+    path = spectrum_path(source)
+    files = {'PHA': file_digest(db, path)}
+    if files['PHA'] != 'missing':
+        folder = os.path.dirname(path)
+        for name,value in header_keywords(path, LINKED_FILES).items():
+            if value.lower() != 'none':
+                files[name] = file_digest(db, os.path.join(folder, value))
+
+    return({'data': digest(files), 'models': digest(models), 'settings': digest(settings)})
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     reuse_for()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Return {'fingerprint': <fingerprint>, 'fits': {<model>: <fit summary>}} for process_source(): the    #
+#               source's current fingerprint & its stored candidate fits with the same data & settings.              #
+#                                                                                                                    #
+# VARIABLES:    db -- SQLite connection; from acab_db.open_db()                                                      #
+#               source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               models -- Dictionary; candidate models per tier {<tier>: <list of models>}                           #
+#               settings -- Dictionary; from fit_settings()                                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def reuse_for(db, source, models, settings):
+
+    current = fingerprint(db, source, models, settings)
+
+    return({'fingerprint': current, 'fits': load_fits(db, source[0], source[1], current)})
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     changed_sources()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Yield (<position>, <source list>, <reuse>) for catalog sources not processed without error with      #
+#               their current fingerprint; <reuse> is from reuse_for(). Uses its own database connection, as it may  #
+#               run in a pool's task thread.                                                                         #
+#                                                                                                                    #
+# VARIABLES:    path -- String; SQLite results database file                                                         #
+#               catalog -- Iterable of (<position>, <source list>)                                                   #
+#               done -- Dictionary; {(<obsid>, <source number>): <fingerprint>}, from acab_db.done_sources()         #
+#               models -- Dictionary; candidate models per tier {<tier>: <list of models>}                           #
+#               settings -- Dictionary; from fit_settings()                                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def changed_sources(path, catalog, done, models, settings):
+
+    db = open_db(path)
+    try:
+        for n,source in catalog:
+            reuse = reuse_for(db, source, models, settings)
+            db.commit()
+            if done.get((source[0],source[1])) != reuse['fingerprint']:
+                yield(n, source, reuse)
+    finally:
+        db.close()
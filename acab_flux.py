@@ -0,0 +1,147 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_flux.py                                                        #
+#                                                                           #
+# PURPOSE: Flux uncertainties of ACAB fits. Parameter sets are drawn from   #
+#          the covariance matrix of the final fit, and absorbed power-law & #
+#          disk models (those of the batch engine, acab_vector) are         #
+#          evaluated for all of them at once in NumPy. Other models, or     #
+#          where NumPy & Sherpa disagree on the best-fit flux, are sampled  #
+#          by Sherpa (see acab_funcs.flux_errors()).                        #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import numpy as np
+from acab_vector import BATCH_COMPONENTS,component_flux
+
+# keV to erg, as in Sherpa's calc_energy_flux()
+KEV_TO_ERG = 1.60217653E-9
+
+# Percentiles of flux samples reported: lower 1-sigma bound, median & upper 1-sigma bound
+FLUX_PERCENTILES = (15.865, 50.0, 84.135)
+
+# Largest relative difference between NumPy & Sherpa fluxes of the best fit for which NumPy samples are used
+FLUX_TOLERANCE = 0.01
+
+# Number of parameter samples per source (0: no flux uncertainties, the default), processes of Sherpa's sampling &
+# random seed
+options = {'samples': 0, 'workers': 1, 'seed': None}
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_flux_options()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Set number of parameter samples, processes & random seed of flux uncertainties.                      #
+#                                                                                                                    #
+# VARIABLES:    samples -- Integer; parameter samples per source; 0 turns flux uncertainties off                     #
+#               workers -- Integer; processes of Sherpa's flux sampling (numcores), for models NumPy cannot evaluate #
+#               seed -- Integer; random seed (None: different samples each run)                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_flux_options(samples=0, workers=1, seed=None):
+
+    options.update(samples=int(samples), workers=int(workers), seed=seed)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     sample_parameters()                                                                                  #
+#                                                                                                                    #
+# DESCRIPTION:  Return array (samples x parameters) drawn from a multivariate normal distribution, clipped to the    #
+#               parameter limits. Negative eigenvalues of a poorly conditioned covariance matrix are set to zero.    #
+#                                                                                                                    #
+# VARIABLES:    vals -- Array; best-fit parameter values                                                             #
+#               covar -- Array (parameters x parameters); covariance matrix                                          #
+#               mins, maxs -- Arrays; parameter limits                                                               #
+#               n -- Integer; number of samples                                                                      #
+#               seed -- Integer; random seed, or None                                                                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def sample_parameters(vals, covar, mins, maxs, n, seed=None):
+
+    covar = np.asarray(covar, dtype=float)
+    w, v = np.linalg.eigh((covar+covar.T)/2)
+    scale = v*np.sqrt(np.clip(w, 0.0, None))
+
+    normal = np.random.default_rng(seed).standard_normal((n,len(vals)))
+
+    return(np.clip(np.asarray(vals, dtype=float) + normal.dot(scale.T), mins, maxs))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     flux_samples()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return photon & energy flux (photons/cm^2/s, erg/cm^2/s) of the absorbed model                       #
+#               (abs1+abs2)*(<components>) for each parameter set, as arrays (samples), evaluated in one batch.      #
+#                                                                                                                    #
+# VARIABLES:    components -- List of (<type>, <name>); emission components, from acab_vector.batch_components()     #
+#               column -- Dictionary; {<Sherpa parameter name>: <array (samples)>} of all parameters used, e.g.      #
+#                         'abs2.nH', 'p1.gamma' & 'p1.ampl'                                                          #
+#               nh1 -- Float; frozen Galactic column density in 1e22 cm^-2                                           #
+#               sigma -- Array; optical depth per 1e22 cm^-2, from acab_vector.absorption_sigma()                    #
+#               elo, ehi -- Arrays; energy bin edges in keV                                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def flux_samples(components, column, nh1, sigma, elo, ehi):
+
+    elo, ehi = np.asarray(elo, dtype=float), np.asarray(ehi, dtype=float)
+    nh2 = np.asarray(column['abs2.nH'], dtype=float)
+
+    # Unabsorbed photon flux per bin (samples x energies): normalization times unit-normalization component
+    photons = np.zeros((len(nh2),len(elo)))
+    for typ,name in components:
+        par, norm = ('%s.%s' % (name,parname) for parname in BATCH_COMPONENTS[typ])
+        photons += np.asarray(column[norm], dtype=float)[:,None]*component_flux(typ, elo[None,:], ehi[None,:],
+                                                                                 np.asarray(column[par], dtype=float)[:,None])
+
+    # Transmission of (abs1 + abs2), as in the base model
+    photons *= np.exp(-nh1*sigma)[None,:] + np.exp(-nh2[:,None]*sigma[None,:])
+
+    return(photons.sum(axis=1), photons.dot((elo+ehi)/2)*KEV_TO_ERG)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     flux_agrees()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return True if a NumPy flux of the best fit is within FLUX_TOLERANCE of Sherpa's.                    #
+#                                                                                                                    #
+# VARIABLES:    value -- Float; flux from flux_samples() at the best-fit parameters                                  #
+#               flux -- Float; flux from calc_photon_flux() or calc_energy_flux()                                    #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def flux_agrees(value, flux):
+
+    return(bool(np.isfinite(value)) and abs(value-flux) <= FLUX_TOLERANCE*abs(flux))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     flux_interval()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return (<lower bound>, <median>, <upper bound>) of flux samples, see FLUX_PERCENTILES.               #
+#                                                                                                                    #
+# VARIABLES:    samples -- Array; fluxes                                                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def flux_interval(samples):
+
+    samples = np.asarray(samples, dtype=float)
+
+    return(tuple(float(value) for value in np.percentile(samples[np.isfinite(samples)], FLUX_PERCENTILES)))
@@ -8,14 +8,26 @@
 
 # Import libraries
 import os
-from sherpa.astro.ui import *
-import matplotlib.pylab as plt
+import re
+from acab_plots import set_plot_policy,wants_plot,add_plot_job,add_plot_jobs,pop_plot_jobs,render_plot
+from acab_timing import timer,count_fit,pop_timings,add_timings
+from acab_absorb import frozen_transmission,init_xspec,frozen_source
+from acab_prefetch import spectrum_path,take_spectrum
+from acab_response import install_response_cache
+from acab_watchdog import Timeout,set_budgets,watchdog,note_timeout,pop_timeouts
+from acab_triage import triage_source
+from acab_events import set_event_log,emit,flush_events
+from acab_flux import set_flux_options,sample_parameters,flux_samples,flux_agrees,flux_interval,options as flux_options
+from acab_vector import batch_components,batch_parnames,absorption_sigma,load_batch_source,batch_fit
+from acab_memory import memory_mb,reset_peak,release_memory
 import numpy as np
 import logging
-from itertools import combinations
+import multiprocessing
+import time
 
-# Matplotlib style sheet
-plt.style.use('bmh')
+# Sherpa session the Sherpa functions of this module (load_pha, set_source, fit, ...) are bound to; sherpa.astro.ui
+# (with its I/O & plotting backends) is imported only once a spectrum is fitted, see require_session()
+session = None
 
 
 
@@ -23,68 +35,66 @@ plt.style.use('bmh')
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     log_info()                                                                                           #
-#                                                                                                                    #
-# DESCRIPTION:  Logs statistics for a given source with the fit most recently run.                                   #
+# FUNCTION:     new_session()                                                                                        #
 #                                                                                                                    #
-# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
-#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
+# DESCRIPTION:  Create a Sherpa session with the same model types as the global sherpa.astro.ui session.             #
 #--------------------------------------------------------------------------------------------------------------------#
 
-def log_info(source,model):
-
-    # Unpack source array
-    obsid,srcid,ra,dec,srcnh = source
+def new_session():
 
-    # Set logfile for given source
-    logfile = 'plots/logs/%s_%s-fit.log' % (obsid,srcid)
+    # Import Sherpa modules providing model types
+    import sherpa.models
+    import sherpa.models.basic
+    import sherpa.models.template
+    import sherpa.instrument
+    import sherpa.astro
+    import sherpa.astro.models
+    import sherpa.astro.optical
+    import sherpa.astro.instrument
+    import sherpa.astro.ui.utils
 
-    # This process sometimes raises an error...
-    try:
-        # Calculate characteristic values
-        net_src, net_bkg = calc_data_sum(id=1), calc_data_sum(bkg_id=1)
-        rate_src, rate_bkg = calc_data_sum()/get_exposure(id=1), calc_data_sum(bkg_id=1)/get_exposure(bkg_id=1)
-        pflux, eflux = calc_photon_flux(), calc_energy_flux()
+    # Register model types in the same way as sherpa.astro.ui does for its global session
+    session = sherpa.astro.ui.utils.Session()
+    session._add_model_types(sherpa.models.basic)
+    session._add_model_types(sherpa.astro.models)
+    session._add_model_types(sherpa.astro.optical)
+    session._add_model_types(sherpa.models.template)
+    session._add_model_types(sherpa.instrument, baselist=(sherpa.models.Model,))
+    session._add_model_types(sherpa.astro.instrument)
+    if hasattr(sherpa.astro, 'xspec'):
+        session._add_model_types(sherpa.astro.xspec,
+                                 (sherpa.astro.xspec.XSAdditiveModel,
+                                  sherpa.astro.xspec.XSMultiplicativeModel,
+                                  sherpa.astro.xspec.XSConvolutionKernel))
 
-        # Write characteristic values, statistics to logfile for given source
-        with open(logfile,'w') as f:
+    # Frozen Galactic absorption used in place of xstbabs.abs1
+    session.add_model(frozen_transmission())
 
-            f.write('Source: %s-%s' % (obsid,srcid))
-            f.write('\n(RA,Dec) = (%s,%s)' % (ra,dec))
-            f.write('\nModel: %s' % model)
-            f.write('\nMilky Way nH = %s\n' % srcnh)
+    return(session)
 
-            f.write('\nNet counts (src): ' % net_src)
-            f.write(str(net_src))
 
-            f.write('\nCount rate (src): ' % rate_src)
-            f.write(str(rate_src))
 
-            f.write('\nNet counts (bkg):' % net_bkg)
-            f.write(str(net_bkg))
 
-            f.write('\nCount rate (bkg): ' % rate_bkg)
-            f.write(str(rate_bkg))
 
-            f.write('\nPhoton flux: ' % pflux)
-            f.write(str(pflux))
 
-            f.write('\nEnergy flux: ')
-            f.write(str(eflux))
-            f.write('\n\n')
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     use_session()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Bind the Sherpa functions used in this module (load_pha, set_source, fit, ...) to a given session.   #
+#                                                                                                                    #
+# VARIABLES:    new -- Sherpa session; e.g. from new_session()                                                       #
+#--------------------------------------------------------------------------------------------------------------------#
 
-            covariance()
-            f.write(str(get_covar_results()))
+def use_session(new):
 
-            f.write(str(get_stat_info()[0]))
+    global session, prepared_key
 
-        f.close()
+    # Bind the names of sherpa.astro.ui to methods of the given session
+    new._export_names(globals())
+    session = new
 
-    # Log *only* error message if error is raised
-    except:
-        f = open(logfile,'w')
-        f.write('Error in calculations. Check PHA files.')
-        f.close()
+    # The new session has no spectrum loaded
+    prepared_key = None
 
 
 
@@ -92,110 +102,111 @@ def log_info(source,model):
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     fitting_silent()                                                                                     #
+# FUNCTION:     reset_session()                                                                                      #
 #                                                                                                                    #
-# DESCRIPTION:  Identical to fitting(), with print statements removed.                                               #
+# DESCRIPTION:  Drop the datasets, model components & plot objects of the current Sherpa session & the fit caches,   #
+#               continue with a fresh session, and release the memory they held.                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def reset_session():
+
+    if session is not None:
+        clean()
+    use_session(new_session())
+    clear_fit_cache()
+    release_memory()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     require_session()                                                                                    #
 #                                                                                                                    #
-# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
-#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
-#               binning -- Integer; counts per bin                                                                   #
-#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
-#               silent -- Boolean; allow or disallow fitting() to print statements to terminal                       #
+# DESCRIPTION:  Bind a new Sherpa session if none is bound yet (first fit of a process), importing Sherpa's UI.      #
 #--------------------------------------------------------------------------------------------------------------------#
 
-def fitting_silent(source, model, binning='', bounds=''):
+def require_session():
 
-        # Unpack source array to define OBSID, source ID, column density
-        obsid,srcid,srcnh = source[0],source[1],source[4]
+    if session is None:
+        use_session(new_session())
 
-        #------------------------#
-        #     INITIALIZATION     #
-        #------------------------#
 
-        # Load grouped spectrum
-        load_pha('%s/extracted_spectra_%s_%s_grp.pi' % (obsid,obsid,srcid))
 
-        #------------------------#
-        #      RAW SPECTRUM      #
-        #------------------------#
 
-        # Save plot of raw spectrum in log space
-        set_xlog()
-        set_ylog()
-        plot_data()
-        plt.savefig('plots/raw/%s_%s-rawspec.pdf' % (obsid,srcid))
-        plt.close()
 
-        #-----------------------#
-        #     ENERGY BOUNDS     #
-        #-----------------------#
 
-        # If bounds are not provided with function call, prompt for user input
-        if bounds == '':
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     warm_up()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Import Sherpa, bind a session & set up XSPEC now rather than at the first fit; for processes started #
+#               ahead of their sources (worker pools, the service of acab.py --serve).                               #
+#--------------------------------------------------------------------------------------------------------------------#
 
-            # Open raw spectrum
-            os.system('open plots/raw/%s_%s-rawspec.pdf' % (obsid,srcid))
+def warm_up():
 
-            # Error if user hits 'enter,' so pass if error is raised (no energy bounds attributed in this case)
-            try:
-                lo,hi = input('\nfitting(): Enter energy bounds, separated by space (Enter to skip): ').split()
-                notice(float(lo),float(hi))
-                plot_data()
-                plt.savefig('plots/raw/%s_%s-rawspec_bounded.pdf' % (obsid,srcid))
-                plt.close()
-            except:
-                pass
+    require_session()
 
-        # If bounds are given in function call, use those
-        else:
-            notice(bounds[0],bounds[1])
-            plot_data()
-            plt.savefig('plots/raw/%s_%s-rawspec_bounded.pdf' % (obsid,srcid))
-            plt.close()
+    # XSPEC is optional until a model needs it
+    try:
+        init_xspec()
+    except ImportError:
+        pass
 
-        #-----------------------#
-        #        BINNING        #
-        #-----------------------#
 
-        # If no binning is provided in function call, use default binning
-        if binning == '':
-            pass
 
-        # If binning is provided in function call, use the provided counts/bin value
-        else:
-            group_counts(binning)
 
-        #----------------------#
-        #         MODEL        #
-        #----------------------#
 
-        # Subtract background
-        subtract()
 
-        # Set model
-        set_source(model)
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     init_worker()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Initializer for batch worker processes; gives each worker its own Sherpa session, set up (with       #
+#               XSPEC) before the first source.                                                                      #
+#                                                                                                                    #
+# VARIABLES:    policy -- String; plot policy, 'none', 'winner' or 'all'                                             #
+#               fmt -- String; plot file format, 'pdf' or 'png'                                                      #
+#               responses -- Tuple; (<directory>, <megabytes>) of the shared response cache, or None                 #
+#               budgets -- Dictionary; watchdog budgets {<stage>: <seconds>}, or None                                #
+#               events -- Tuple; (<path>, <batch size>) of the event log, or None                                    #
+#               flux -- Tuple; (<samples>, <workers>, <seed>) of flux uncertainties, or None                         #
+#               strategy -- Tuple; (<optimizers>, <maximum reduced statistic>, <engine>), see set_fit_strategy(), or #
+#                          None                                                                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def init_worker(policy='winner', fmt='pdf', responses=None, budgets=None, events=None, flux=None, strategy=None):
+
+    use_session(new_session())
+    warm_up()
+    set_plot_policy(policy, fmt)
+    if events is not None:
+        set_event_log(*events)
+    if flux is not None:
+        set_flux_options(*flux)
+    if strategy is not None:
+        set_fit_strategy(*strategy)
+    if responses is not None:
+        install_response_cache(*responses)
+    if budgets is not None:
+        set_budgets(**budgets)
 
-        # Set statistic
-        set_stat("chi2datavar")
 
-        # Set hydrogen column density, abundance & cross-section for xstbabs
-        abs1.nH = float(srcnh)/1.0E22
-        freeze(abs1.nH)
-        set_xsabund('wilm')
-        set_xsxsect('vern')
 
-        #----------------------#
-        #        FITTING       #
-        #----------------------#
 
-        # Apply fit
-        fit()
 
-        # Plot, save and open fit
-        plot_fit_delchi()
-        plt.savefig('plots/fits/%s_%s_fit.pdf' % (obsid,srcid))
-        plt.close()
 
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     process_task()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Call process_source() with a tuple of arguments (for Pool.imap()).                                   #
+#                                                                                                                    #
+# VARIABLES:    task -- Tuple; arguments of process_source()                                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def process_task(task):
+
+    return(process_source(*task))
 
 
 
@@ -203,114 +214,118 @@ def fitting_silent(source, model, binning='', bounds=''):
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     fitting()                                                                                            #
+# FUNCTION:     process_source()                                                                                     #
 #                                                                                                                    #
-# DESCRIPTION:  Generates fit of grouped Chandra spectrum using SHERPA.                                              #
+# DESCRIPTION:  Choose model for, fit and log a single source; return dictionary with position, status ('ok',        #
+#               'error' or 'timeout'), chosen model, statistics from log_info(), error message, watchdog notes,      #
+#               input fingerprint, candidate fits not reused, timings (with peak & retained memory of the process)   #
+#               & captured plot jobs. The Sherpa session is reset after each source, so memory stays flat.           #
 #                                                                                                                    #
 # VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
-#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
-#               binning -- Integer; counts per bin                                                                   #
+#               n -- Integer; position of source in source list                                                      #
+#               total -- Integer; number of sources in source list (0 if not known)                                  #
 #               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
-#               silent -- Boolean; allow or disallow fitting() to print statements to terminal                       #
+#               triage -- Boolean; sort source into a tier by its counts (acab_triage) that sets candidate models,   #
+#                         fit statistic & binning; otherwise all models are fitted with chi-squared                  #
+#               reuse -- Dictionary; {'fingerprint': <fingerprint>, 'fits': {<model>: <fit summary>}}, the source's  #
+#                        input fingerprint & candidate fits stored by an earlier run (acab_fingerprint.reuse_for())  #
 #--------------------------------------------------------------------------------------------------------------------#
 
-def fitting(source, model, binning='', bounds='', silent=False):
+def process_source(source, n=1, total=1, bounds=[0.3,10], triage=False, reuse=None):
 
-        # Unpack source array to define OBSID, source ID, column density
-        obsid,srcid,srcnh = source[0],source[1],source[4]
+    # Unpack source
+    obsid,srcid,ra,dec,srcnh = source
 
-        # Run with print statements
-        if silent == False:
+    # Without stored fits, every candidate is fitted
+    reuse = reuse or {'fingerprint': None, 'fits': {}}
 
-            #------------------------#
-            #     INITIALIZATION     #
-            #------------------------#
+    # Result; plot jobs captured while processing are handed back for rendering
+    result = {'obsid': obsid, 'srcid': srcid, 'position': n, 'status': 'error', 'model': None, 'stats': None,
+              'error': None, 'tier': None, 'counts': None, 'timeouts': [], 'timings': {}, 'plots': [],
+              'fingerprint': reuse['fingerprint'], 'fits': {}}
 
-            # Load grouped spectrum
-            load_pha('%s/extracted_spectra_%s_%s_grp.pi' % (obsid,obsid,srcid))
+    # Start time & peak memory of source; discard timings & watchdog notes left over from earlier calls
+    source_time = time.time()
+    pop_timings()
+    pop_timeouts()
+    reset_peak()
 
-            #------------------------#
-            #      RAW SPECTRUM      #
-            #------------------------#
+    try:
+        with watchdog('source'):
+            # Print current source
+            if total:
+                print('\n\n\nSOURCE %d/%d\n\n\n' % (n,total))
+            else:
+                print('\n\n\nSOURCE %d\n\n\n' % n)
 
-            # Save plot of raw spectrum in log space
-            print('\nfitting(): Plotting raw spectrum...')
-            set_xlog()
-            set_ylog()
-            plot_data()
-            plt.savefig('plots/raw/%s_%s-rawspec.pdf' % (obsid,srcid))
-            plt.close()
-            print('\nfitting(): Saved as %s_%s-rawspec.pdf.' % (obsid,srcid))
+            # Drop cached fits of the previous source
+            clear_fit_cache()
 
-            #-----------------------#
-            #     ENERGY BOUNDS     #
-            #-----------------------#
+            # Tier, fit statistic & binning from counts in the PHA files (without Sherpa), or the full tournament
+            tier = {'tier': 'bright', 'stat': 'chi2datavar', 'binning': ''}
+            if triage:
+                with timer('triage'):
+                    tier = triage_source(source, bounds)
+                result['tier'], result['counts'] = tier['tier'], tier['counts']
+                if tier['counts'] is not None:
+                    print('\nprocess_source(): %d net counts, tier %s' % (tier['counts']['net'],tier['tier']))
 
-            # If bounds are not provided with function call, choose default inputß
-            if bounds == '':
-                bounds = [0.3,10]
-            else:
-                pass
+            # Candidate fits of an earlier run with the same data & settings are not fitted again
+            for model,fit in reuse['fits'].items():
+                fit_cache[fit_key(source, model, tier['binning'], bounds, tier['stat'])] = fit
 
-            notice(bounds[0],bounds[1])
-            plot_data()
-            print('\nfitting(): Energy bounds set to [' + str(bounds[0]) + ' ,' + str(bounds[1]) + '].')
-            print('\nfitting(): Saving bounded spectrum as %s_%s-rawspec_bounded.pdf' % (obsid,srcid))
-            plt.savefig('plots/raw/%s_%s-rawspec_bounded.pdf' % (obsid,srcid))
-            plt.close()
+            # Load, filter & background-subtract spectrum once; reused by all fits below
+            prepare_data(source, tier['binning'], bounds, plot_raw=True, stat=tier['stat'])
 
-            #-----------------------#
-            #        BINNING        #
-            #-----------------------#
+            # Set model
+            with timer('choose_model'):
+                model = choose_model(source,tier['binning'],bounds,stat=tier['stat'],tier=tier['tier'])
+            print('\n\n\nMODEL: %s\n\n\n' % model)
 
-            # If no binning is provided in function call, use default binning
-            if binning == '':
-                pass
+            # Fit sources
+            with timer('fitting'):
+                fitting(source,model,tier['binning'],bounds,silent=True,stat=tier['stat'])
 
-            # If binning is provided in function call, use the provided counts/bin value
-            else:
-                group_counts(binning)
-                print('\nfitting(): Binning set to %d counts per bin.' % binning)
+            # Log stats
+            with timer('log_info'):
+                result['stats'] = log_info(source,model)
 
-            #----------------------#
-            #         MODEL        #
-            #----------------------#
+            # Print runtime
+            print('\nRUNTIME FOR SOURCE %s-%s: %d sec\n' % (obsid,srcid,time.time()-source_time))
 
-            # Subtract background
-            subtract()
+            result['status'], result['model'] = 'ok', model
 
-            # Set model
-            print('\nfitting(): Fitting spectrum with model %s...' % model)
-            set_source(model)
+    # Source (or a fit outside the tournament) ran out of time
+    except Timeout as e:
+        print('\n\n\nTIMEOUT in SOURCE %s_%s' % (obsid,srcid))
+        result['status'], result['error'] = 'timeout', str(e)
+        note_timeout('source %s_%s: %s' % (obsid,srcid,e))
 
-            # Set statistic
-            set_stat("chi2datavar")
+    except Exception as e:
+        print('\n\n\nERROR in SOURCE %s_%s' % (obsid,srcid))
+        result['error'] = '%s: %s' % (type(e).__name__,e)
 
-            # Set hydrogen column density, abundance & cross-section for xstbabs
-            abs1.nH = float(srcnh)/1.0E22
-            freeze(abs1.nH)
-            set_xsabund('wilm')
-            set_xsxsect('vern')
+    # New candidate fits (also of failed sources), stored for reruns
+    result['fits'] = {key[2]: fit for key,fit in fit_cache.items() if key[:2] == (obsid,srcid) and key[2] not in reuse['fits']}
 
-            #----------------------#
-            #        FITTING       #
-            #----------------------#
+    # Watchdog notes, stage timings & fit count
+    result['timeouts'] = pop_timeouts()
+    result['timings'] = pop_timings()
+    result['timings']['source'] = time.time()-source_time
+    result['plots'] = pop_plot_jobs()
 
-            # Apply fit
-            print('\nfitting(): Fitting...')
-            fit()
+    # Sherpa state of this source is not kept for the next; peak memory of the source & memory retained after it (MB)
+    reset_session()
+    for key,field in (('peak_rss_mb','VmHWM'),('rss_mb','VmRSS')):
+        if memory_mb(field) is not None:
+            result['timings'][key] = memory_mb(field)
 
-            # Plot, save and open fit
-            print('\nfitting(): Plotting fit...\n')
-            plot_fit_delchi()
-            print('fitting(): Printing stats...\n')
-            print('fitting(): Saving figure as %s_%s_fit.pdf' % (obsid,srcid))
-            plt.savefig('plots/fits/%s_%s_fit.pdf' % (obsid,srcid))
-            plt.close()
+    # Log outcome of source; events of the source are written in one batch
+    emit('source', **{key: result[key] for key in ('obsid','srcid','position','status','model','tier','counts','error',
+                                                   'timeouts','timings')})
+    flush_events()
 
-        # Run without print statements
-        else:
-            fitting_silent(source,model,binning,bounds)
+    return(result)
 
 
 
@@ -318,230 +333,1258 @@ def fitting(source, model, binning='', bounds='', silent=False):
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     fitting_fast()                                                                                       #
+# FUNCTION:     log_info()                                                                                           #
 #                                                                                                                    #
-# DESCRIPTION:  Identical to fitting_silent(), with plot statements removed.                                         #
+# DESCRIPTION:  Logs statistics for a given source with the fit most recently run as a 'fit' event (acab_events);    #
+#               returns them as a dictionary (None if the calculations raised an error).                             #
 #                                                                                                                    #
 # VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
 #               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
-#               binning -- Integer; counts per bin                                                                   #
-#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
 #--------------------------------------------------------------------------------------------------------------------#
 
-def fitting_fast(source, model, binning='', bounds=''):
+def log_info(source,model):
 
-        # Unpack source array to define OBSID, source ID, column density
-        obsid,srcid,srcnh = source[0],source[1],source[4]
+    # Unpack source array
+    obsid,srcid,ra,dec,srcnh = source
 
-        #------------------------#
-        #     INITIALIZATION     #
-        #------------------------#
+    # This process sometimes raises an error...
+    try:
+        # Calculate characteristic values
+        with timer('flux'):
+            net_src, net_bkg = calc_data_sum(id=1), calc_data_sum(bkg_id=1)
+            rate_src, rate_bkg = net_src/get_exposure(id=1), net_bkg/get_exposure(bkg_id=1)
+            pflux, eflux = calc_photon_flux(), calc_energy_flux()
+
+        # Covariance of the final fit, computed once per best fit; also used for flux uncertainties
+        covar, stats = cached_covariance(source, model), get_stat_info()[0]
+
+        # Characteristic values, statistics & covariance results (unbounded errors as None)
+        info = {'net_src': float(net_src), 'net_bkg': float(net_bkg),
+                'rate_src': float(rate_src), 'rate_bkg': float(rate_bkg),
+                'pflux': float(pflux), 'eflux': float(eflux),
+                'rstat': float(stats.rstat), 'dof': int(stats.dof), 'statval': float(stats.statval),
+                'covar': {'parnames': list(covar.parnames),
+                          'parvals': [float(val) for val in covar.parvals],
+                          'parmins': [None if val is None else float(val) for val in covar.parmins],
+                          'parmaxes': [None if val is None else float(val) for val in covar.parmaxes]}}
+
+        # Flux uncertainties from parameter samples (1-sigma bounds & median); None if they cannot be sampled
+        with timer('flux_errors'):
+            info.update(flux_errors(source, model, covar, float(pflux), float(eflux)))
 
-        # Load grouped spectrum
-        load_pha('%s/extracted_spectra_%s_%s_grp.pi' % (obsid,obsid,srcid))
+    # Log *only* error message if error is raised
+    except Exception as e:
+        emit('fit', obsid=obsid, srcid=srcid, ra=ra, dec=dec, nh=srcnh, model=model,
+             error='Error in calculations (%s: %s). Check PHA files.' % (type(e).__name__,e))
+        return(None)
 
-        #-----------------------#
-        #     ENERGY BOUNDS     #
-        #-----------------------#
+    # Log characteristic values & statistics for given source, and return them
+    emit('fit', obsid=obsid, srcid=srcid, ra=ra, dec=dec, nh=srcnh, model=model, **info)
+    return(info)
 
-        # If bounds are not provided with function call, use default bounds
-        if bounds == '':
-            bounds = [0.3,10]
-        else:
-            pass
 
-        # Set bounds
-        notice(bounds[0],bounds[1])
 
-        #-----------------------#
-        #        BINNING        #
-        #-----------------------#
 
-        # If no binning is provided in function call, use default binning
-        if binning == '':
-            pass
 
-        # If binning is provided in function call, use the provided counts/bin value
-        else:
-            group_counts(binning)
 
-        #----------------------#
-        #         MODEL        #
-        #----------------------#
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     cached_covariance()                                                                                  #
+#                                                                                                                    #
+# DESCRIPTION:  Run covariance() for the current fit unless already run for the same best-fit values; return the     #
+#               covariance results (with the matrix in extra_output).                                                #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#--------------------------------------------------------------------------------------------------------------------#
 
-        # Subtract background
-        subtract()
+# Covariance results for (<obsid>, <source number>, <model>, <parameter values>) keys
+covar_cache = {}
 
-        # Set model
-        set_source(model)
+def cached_covariance(source, model):
 
-        # Set statistic
-        set_stat("chi2datavar")
+    key = (source[0], source[1], model, tuple(par.val for par in get_source().pars))
+    if key not in covar_cache:
+        with timer('covariance'):
+            covariance()
+        covar_cache[key] = get_covar_results()
 
-        # Set hydrogen column density, abundance & cross-section for xstbabs
-        abs1.nH = float(srcnh)/1.0E22
-        freeze(abs1.nH)
-        set_xsabund('wilm')
-        set_xsxsect('vern')
+    return(covar_cache[key])
 
-        #----------------------#
-        #        FITTING       #
-        #----------------------#
 
-        # Apply fit
-        fit()
 
-        # Plot, save and open fit
-        plot_fit_delchi()
-        plt.savefig('plots/fits/%s_%s_fit.pdf' % (obsid,srcid))
-        plt.close()
 
 
 
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     flux_errors()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary of 1-sigma bounds & median of photon & energy flux ('pflux_lo', 'pflux_med',       #
+#               'pflux_hi', 'eflux_lo', ...) from parameter sets drawn from the covariance matrix of the current     #
+#               fit; values are None if sampling is off or the covariance does not allow it. Models of the batch     #
+#               engine are evaluated in NumPy (see acab_flux) if it agrees with Sherpa on the flux of the best fit;  #
+#               other models are sampled with Sherpa's sample_photon_flux() & sample_energy_flux().                  #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
+#               covar -- Covariance results; from cached_covariance()                                                #
+#               pflux, eflux -- Floats; photon & energy flux of the fit (calc_photon_flux(), calc_energy_flux())     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def flux_errors(source, model, covar, pflux, eflux):
+
+    errors = dict.fromkeys(['%s_%s' % (flux,bound) for flux in ('pflux','eflux') for bound in ('lo','med','hi')])
+
+    matrix = getattr(covar, 'extra_output', None)
+    if not flux_options['samples'] or matrix is None or not np.all(np.isfinite(matrix)):
+        return(errors)
+
+    pfluxes = efluxes = None
+
+    # Absorbed power-law & disk models: parameter sets drawn from the covariance matrix of the free parameters, within
+    # parameter limits, and evaluated at once in NumPy on the energy grid of the response (as used by calc_photon_flux()
+    # & calc_energy_flux()); the best fit is evaluated as a last extra set, to check NumPy against Sherpa
+    components = batch_components(model)
+    if components is not None:
+        pars = {par.fullname: par for par in get_source().pars}
+        free = [pars[name] for name in covar.parnames]
+        samples = sample_parameters(covar.parvals, matrix, [par.min for par in free], [par.max for par in free],
+                                    flux_options['samples'], flux_options['seed'])
+        column = {name: np.append(samples[:,n], val) for n,(name,val) in enumerate(zip(covar.parnames,covar.parvals))}
+        for name in batch_parnames(model):
+            if name not in column:
+                column[name] = np.full(len(samples)+1, pars[name].val)
+
+        rmf = get_rmf()
+        photons, energies = flux_samples(components, column, float(source[4])/1.0E22,
+                                         absorption_sigma(rmf.energ_lo, rmf.energ_hi), rmf.energ_lo, rmf.energ_hi)
+        if flux_agrees(photons[-1], pflux) and flux_agrees(energies[-1], eflux):
+            pfluxes, efluxes = photons[:-1], energies[:-1]
+        else:
+            print("\nflux_errors(): NumPy fluxes of %s_%s (%g, %g) differ from Sherpa's (%g, %g); sampling with Sherpa"
+                  % (source[0],source[1],photons[-1],energies[-1],pflux,eflux))
+
+    # Other models: Sherpa draws & evaluates the parameter sets (flux in the first column), on several processes only
+    # outside pool workers (which cannot start processes of their own)
+    if pfluxes is None:
+        if flux_options['seed'] is not None:
+            np.random.seed(flux_options['seed'])
+            if hasattr(session, 'set_rng'):
+                session.set_rng(np.random.default_rng(flux_options['seed']))
+        workers = 1 if multiprocessing.current_process().daemon else flux_options['workers']
+        sampling = {'num': flux_options['samples'], 'scales': matrix, 'correlated': True, 'numcores': workers}
+        pfluxes = np.asarray(sample_photon_flux(**sampling))[:,0]
+        efluxes = np.asarray(sample_energy_flux(**sampling))[:,0]
+
+    for flux,values in (('pflux',pfluxes),('eflux',efluxes)):
+        errors['%s_lo' % flux], errors['%s_med' % flux], errors['%s_hi' % flux] = flux_interval(values)
+
+    return(errors)
+
+    # Parameter sets drawn from the covariance matrix of the free parameters, within parameter limits
+    pars = {par.fullname: par for par in get_source().pars}
+    free = [pars[name] for name in covar.parnames]
+    samples = sample_parameters(covar.parvals, matrix, [par.min for par in free], [par.max for par in free],
+                                flux_options['samples'], flux_options['seed'])
+    column = {name: samples[:,n] for n,name in enumerate(covar.parnames)}
+
+    # Parameter values per emission component (samples x parameters), frozen parameters at their values
+    terms = []
+    for name in names:
+        component = get_model_component(name)
+        values = np.array([column.get(par.fullname, np.full(len(samples), par.val)) for par in component.pars]).T
+        terms.append((type(component).__module__, type(component).__name__, type(component).__name__.lower(),
+                      [par.name for par in component.pars], values))
+
+    # Energy grid of the response, as used by calc_photon_flux() & calc_energy_flux()
+    rmf = get_rmf()
+    nh2 = column.get('abs2.nH', np.full(len(samples), get_model_component('abs2').nH.val))
+    pfluxes, efluxes = flux_samples(terms, float(source[4])/1.0E22, nh2, rmf.energ_lo, rmf.energ_hi)
+
+    for flux,values,value in (('pflux',pfluxes,pflux),('eflux',efluxes,eflux)):
+        errors['%s_lo' % flux], errors['%s_med' % flux], errors['%s_hi' % flux] = flux_interval(values, value)
+
+    return(errors)
+
+
 
 
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     ftest()                                                                                              #
+# FUNCTION:     save_data_plot()                                                                                     #
 #                                                                                                                    #
-# DESCRIPTION:  Perform statistical comparison (f-test) between two models, return best model.                       #
+# DESCRIPTION:  Capture arrays of the current data plot as a plot job (see acab_plots) if the plot policy keeps it;  #
+#               return the job (None if not kept).                                                                   #
 #                                                                                                                    #
-# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
-#               model1 -- String; '<model>'                                                                          #
-#               model2 -- String; '<model>'                                                                          #
-#               binning -- Integer; counts per bin                                                                   #
-#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
-#               good -- Boolean; determines whether good or bad model is returned                                    #
+# VARIABLES:    path -- String; plot file path without extension                                                     #
+#               stage -- String; 'final', 'candidate' or 'interactive' (always kept, not queued for rendering)       #
 #--------------------------------------------------------------------------------------------------------------------#
 
+def save_data_plot(path, stage='final'):
 
+    if stage != 'interactive' and not wants_plot(stage):
+        return(None)
 
-def ftest(source,model1,model2,binning='',bounds='',good=True):
+    # Data plot & log scale preferences (set_xlog(), set_ylog())
+    with timer('plotting'):
+        data, prefs = get_data_plot(), get_data_plot_prefs()
 
-    # Fit simple model, get reduced chi-squared and degrees of freedom
-    fitting_fast(source, model1, binning, bounds)
-    chi1, dof1 = get_stat_info()[0].rstat, get_stat_info()[0].dof
+    # Bin edges; older Sherpa versions give bin centers & widths instead
+    if getattr(data,'xlo',None) is not None:
+        xlo, xhi = np.asarray(data.xlo), np.asarray(data.xhi)
+    else:
+        xlo, xhi = data.x - data.xerr/2, data.x + data.xerr/2
 
-    # Fit simple model, get reduced chi-squared and degrees of freedom
-    fitting_fast(source, model2, binning, bounds)
-    chi2, dof2 = get_stat_info()[0].rstat, get_stat_info()[0].dof
+    job = {'kind': 'data', 'path': path,
+           'xlo': xlo, 'xhi': xhi, 'y': np.asarray(data.y), 'yerr': data.yerr,
+           'xlabel': data.xlabel, 'ylabel': data.ylabel, 'title': data.title,
+           'xlog': prefs['xlog'], 'ylog': prefs['ylog']}
 
-    # Decide which model is more complex
-    if dof1 > dof2:
-        simpMod, compMod = model1, model2
-        simpChi, compChi = chi1, chi2
-        simpDOF, compDOF = dof1, dof2
-    elif dof2 > dof1:
-        simpMod, compMod = model2, model1
-        simpChi, compChi = chi2, chi1
-        simpDOF, compDOF = dof2, dof1
-    # If DoF vals are the same, calc_ftest doesn't work; arbitrarily choose the model with the lower red. chi^2 in this case
-    elif chi1 < chi2:
-        with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s\n\n' % (model1,model2))
-        f.close()
-        return(model1)
-    # If red. chi^2 are identical, arbitrarily choose model2
-    elif chi2 <= chi1:
-        with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s (TOSS UP)\n\n' % (model2,model1))
-        f.close()
-        return(model2)
+    return(add_plot_job(job, queue=(stage != 'interactive')))
 
-    # Calculate p-value, select model (95% certainty)
-    p = calc_ftest(simpDOF, simpChi, compDOF, compChi)
 
-    # Return model, log results
-    if p > 0.05:
-        if good==True:
-            with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s\n\n' % (simpMod,compMod))
-            f.close()
-            return(simpMod)
-        else:
-            with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s\n\n' % (compMod,simpMod))
-            f.close()
-            return(compMod)
-    else:
-        if good==True:
-            with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s\n\n' % (compMod,simpMod))
-            f.close()
-            return(compMod)
-        else:
-            with open('tournament.log','a') as f: f.write('\n\n%s BEATS %s\n\n' % (simpMod,compMod))
-            f.close()
-            return(simpMod)
 
 
 
 
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     save_fit_plot()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Capture arrays of the current fit & residuals (as in plot_fit_delchi()) as a plot job if the plot    #
+#               policy keeps it; return the job (None if not kept).                                                  #
+#                                                                                                                    #
+# VARIABLES:    path -- String; plot file path without extension                                                     #
+#               stage -- String; 'final' or 'candidate'                                                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def save_fit_plot(path, stage='final'):
+
+    job = save_data_plot(path, stage)
+
+    if job is not None:
+        with timer('plotting'):
+            job['kind'] = 'fit'
+            job['model'] = np.asarray(get_model_plot().y)
+            job['delchi'] = np.asarray(get_delchi_plot().y)
+
+    return(job)
+
+
+
 
 
 
 #--------------------------------------------------------------------------------------------------------------------#
-# FUNCTION:     choose_model()                                                                                       #
+# FUNCTION:     prepare_data()                                                                                       #
 #                                                                                                                    #
-# DESCRIPTION:  Perform statistical comparison (f-test) between all available models, return best model.             #
+# DESCRIPTION:  Load, filter, group & background-subtract a source's spectrum, unless it is already prepared with    #
+#               the same bounds, binning & statistic; return True if the spectrum was (re)loaded. The background is  #
+#               subtracted for chi-squared statistics only (W-statistic models the background itself).               #
 #                                                                                                                    #
 # VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
 #               binning -- Integer; counts per bin                                                                   #
 #               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               plot_raw -- Boolean; save plots of raw & bounded spectrum when (re)loading                           #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
 #--------------------------------------------------------------------------------------------------------------------#
 
-def choose_model(source,binning='',bounds=''):
+# Key (<obsid>, <source number>, <bounds>, <binning>, <statistic>) of the spectrum currently prepared by prepare_data()
+prepared_key = None
 
-    #--------------------------------#
-    #        MODEL DEFINITIONS       #
-    #--------------------------------#
+def prepare_data(source, binning='', bounds='', plot_raw=False, stat='chi2datavar'):
 
-    # Define default base model (always two-component absorption from MW & source)
-    base = '(xstbabs.abs1+xstbabs.abs2)'
+    global prepared_key
 
-    # Define allowed emission models
-    diskModels = ['xsdiskbb.didkbb','xsdiskpn.diskpn','xsapec.apec']
-    coronaModels = ['powlaw1d.powlaw','xscompbb.compbb']
-    gasModels = ['xsmekal.mekal']
+    require_session()
 
-    # Create an array of all models; gas, corona cannot exist without disk & base model alone not sufficient
-    allModels = []
-    for disk in diskModels:
-        for corona in coronaModels:
-            for gas in gasModels:
-                # allModels.append(base + ('*(%s)' % (gas)))
-                # allModels.append(base + ('*(%s+%s)' % (gas,corona)))
-                allModels.append(base + ('*(%s+%s)' % (gas,disk)))
-                allModels.append(base + ('*(%s+%s+%s)' % (gas,corona,disk)))
-            # allModels.append(base + ('*(%s)') % corona)
-            allModels.append(base + ('*(%s+%s)' % (corona,disk)))
-        # allModels.append(base + '*(%s)' % disk)
+    # Unpack source array to define OBSID, source ID
+    obsid,srcid = source[0],source[1]
+
+    # If bounds are not provided with function call, use default bounds
+    if bounds == '':
+        bounds = [0.3,10]
+
+    # Reuse the loaded spectrum if it was prepared the same way
+    key = (obsid, srcid, tuple(bounds), binning, stat)
+    if key == prepared_key:
+        return(False)
+    prepared_key = None
 
     #------------------------#
-    #        F-TESTING       #
+    #     INITIALIZATION     #
     #------------------------#
 
-    # Loop until 'winner' is found
-    winner = 0
-    contenders = allModels
-    while winner == 0 or len(contenders) > 1:
-
-        # Create list of tuples containing possible models for comparison
-        combos = list(combinations(contenders,2))
-
-        # For each combination, run an f-test and remove the loser from the list of possible models
-        for combo in combos:
-            print('\n\n\n\nLEN(COMBOS) = %d, LEN(CONTENDERS) = %d\n\n\n\n' % (len(combos),len(contenders)))
-            badmodel = ftest(source,combo[0],combo[1],binning=binning,bounds=bounds,good=False)
-            for n,model in zip(range(len(contenders)),contenders):
-                if badmodel == model:
-                    contenders.pop(n)
-            for m,combo2 in zip(range(len(combos)),combos):
-                if badmodel == combo2[0] or badmodel == combo2[1]:
-                    combos.pop(m)
-
-        # When one model remains, exit the loop
-        if len(contenders) > 1:
-            winner = 0
+    # Load grouped spectrum; use the copy read ahead in the background, if any
+    with timer('load_pha'):
+        pha = take_spectrum(spectrum_path(source))
+        if pha is not None:
+            set_data(pha)
         else:
-            # Return best model
-            return(contenders[0])
+            load_pha(spectrum_path(source))
+
+    # Save plot of raw spectrum in log space
+    if plot_raw:
+        set_xlog()
+        set_ylog()
+        save_data_plot('plots/raw/%s_%s-rawspec' % (obsid,srcid))
+
+    #-----------------------#
+    #     ENERGY BOUNDS     #
+    #-----------------------#
+
+    # Set bounds
+    with timer('notice/group'):
+        notice(bounds[0],bounds[1])
+
+    # Save plot of bounded spectrum
+    if plot_raw:
+        save_data_plot('plots/raw/%s_%s-rawspec_bounded' % (obsid,srcid))
+
+    #-----------------------#
+    #        BINNING        #
+    #-----------------------#
+
+    # If binning is provided in function call, use the provided counts/bin value; subtract background for chi-squared
+    with timer('notice/group'):
+        if binning != '':
+            group_counts(binning)
+        if stat.startswith('chi2'):
+            subtract()
+
+    prepared_key = key
+    return(True)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fitting_silent()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Identical to fitting(), with print statements removed.                                               #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fitting_silent(source, model, binning='', bounds='', stat='chi2datavar'):
+
+        global prepared_key
+
+        require_session()
+
+        # Unpack source array to define OBSID, source ID, column density
+        obsid,srcid,srcnh = source[0],source[1],source[4]
+
+        #-----------------------#
+        #     ENERGY BOUNDS     #
+        #-----------------------#
+
+        # If bounds are not provided with function call, prompt for user input
+        if bounds == '':
+
+            # Load grouped spectrum; the prepared spectrum (if any) is replaced
+            prepared_key = None
+            with timer('load_pha'):
+                load_pha('%s/extracted_spectra_%s_%s_grp.pi' % (obsid,obsid,srcid))
+
+            # Save plot of raw spectrum in log space (rendered right away, so it can be opened)
+            set_xlog()
+            set_ylog()
+            job = save_data_plot('plots/raw/%s_%s-rawspec' % (obsid,srcid), stage='interactive')
+            render_plot(job)
+
+            # Open raw spectrum
+            os.system('open %s' % job['path'])
+
+            # Error if user hits 'enter,' so pass if error is raised (no energy bounds attributed in this case)
+            try:
+                lo,hi = input('\nfitting(): Enter energy bounds, separated by space (Enter to skip): ').split()
+                notice(float(lo),float(hi))
+                save_data_plot('plots/raw/%s_%s-rawspec_bounded' % (obsid,srcid))
+            except:
+                pass
+
+            # If binning is provided in function call, use the provided counts/bin value
+            if binning != '':
+                group_counts(binning)
+
+            # Subtract background (chi-squared only)
+            if stat.startswith('chi2'):
+                subtract()
+
+        # If bounds are given in function call, use those; spectrum is loaded (and plotted) only if not yet prepared
+        else:
+            prepare_data(source, binning, bounds, plot_raw=True, stat=stat)
+
+        #----------------------#
+        #         MODEL        #
+        #----------------------#
+
+        # Set model
+        set_source(frozen_source(model))
+
+        # Set statistic
+        set_stat(stat)
+
+        # Set frozen Galactic column density (transmission cached per energy grid); XSPEC tables are set once per process
+        abs1.nH = float(srcnh)/1.0E22
+        init_xspec()
+
+        #----------------------#
+        #        FITTING       #
+        #----------------------#
+
+        # Apply fit
+        run_fit(source, model)
+
+        # Save fit plot
+        save_fit_plot('plots/fits/%s_%s_fit' % (obsid,srcid))
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fitting()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Generates fit of grouped Chandra spectrum using SHERPA.                                              #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               silent -- Boolean; allow or disallow fitting() to print statements to terminal                       #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fitting(source, model, binning='', bounds='', silent=False, stat='chi2datavar'):
+
+        require_session()
+
+        # Unpack source array to define OBSID, source ID, column density
+        obsid,srcid,srcnh = source[0],source[1],source[4]
+
+        # Run with print statements
+        if silent == False:
+
+            #------------------------#
+            #     INITIALIZATION     #
+            #------------------------#
+
+            # If bounds are not provided with function call, choose default input
+            if bounds == '':
+                bounds = [0.3,10]
+            else:
+                pass
+
+            # Load, filter & group spectrum (and save raw spectrum plots) unless already prepared for these settings
+            print('\nfitting(): Preparing spectrum...')
+            if prepare_data(source, binning, bounds, plot_raw=True, stat=stat):
+                print('\nfitting(): Loaded spectrum of %s_%s.' % (obsid,srcid))
+            else:
+                print('\nfitting(): Reusing spectrum loaded for %s_%s.' % (obsid,srcid))
+            print('\nfitting(): Energy bounds set to [' + str(bounds[0]) + ' ,' + str(bounds[1]) + '].')
+
+            # If binning is provided in function call, report the provided counts/bin value
+            if binning != '':
+                print('\nfitting(): Binning set to %d counts per bin.' % binning)
+
+            #----------------------#
+            #         MODEL        #
+            #----------------------#
+
+            # Set model
+            print('\nfitting(): Fitting spectrum with model %s...' % model)
+            set_source(frozen_source(model))
+
+            # Set statistic
+            set_stat(stat)
+
+            # Set frozen Galactic column density (transmission cached per energy grid); XSPEC tables are set once per process
+            abs1.nH = float(srcnh)/1.0E22
+            init_xspec()
+
+            #----------------------#
+            #        FITTING       #
+            #----------------------#
+
+            # Apply fit
+            print('\nfitting(): Fitting...')
+            for attempt in run_fit(source, model):
+                print('\nfitting(): %s %s after %s function evaluations (%.1f sec)' %
+                      (attempt['method'],'converged' if attempt['succeeded'] else 'failed',attempt['nfev'],attempt['seconds']))
+
+            # Save fit plot
+            if save_fit_plot('plots/fits/%s_%s_fit' % (obsid,srcid)) is not None:
+                print('\nfitting(): Saving fit plot as %s_%s_fit.' % (obsid,srcid))
+
+        # Run without print statements
+        else:
+            fitting_silent(source,model,binning,bounds,stat)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fitting_fast()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Identical to fitting_silent(), with plot statements removed.                                         #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '(<absorption models>)*(emission models)'; suffixes .abs<n> & .emis<n>, n = 1,2,... #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               seed -- Dictionary; starting values {<parameter name>: <value>}, e.g. from nested_seed()             #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fitting_fast(source, model, binning='', bounds='', seed=None, stat='chi2datavar'):
+
+        # Unpack source array to define OBSID, source ID, column density
+        obsid,srcid,srcnh = source[0],source[1],source[4]
+
+        #------------------------#
+        #     INITIALIZATION     #
+        #------------------------#
+
+        # Load, filter, group & background-subtract spectrum, unless already prepared for these settings
+        prepare_data(source, binning, bounds, stat=stat)
+
+        #----------------------#
+        #         MODEL        #
+        #----------------------#
+
+        # Set model
+        set_source(frozen_source(model))
+
+        # Set statistic
+        set_stat(stat)
+
+        # Set frozen Galactic column density (transmission cached per energy grid); XSPEC tables are set once per process
+        abs1.nH = float(srcnh)/1.0E22
+        init_xspec()
+
+        # Warm start: set free parameters shared with a seed fit to its best-fit values (within parameter limits)
+        if seed:
+            for par in get_source().pars:
+                if par.fullname in seed and not par.frozen:
+                    par.val = min(max(seed[par.fullname], par.min), par.max)
+
+        #----------------------#
+        #        FITTING       #
+        #----------------------#
+
+        # Apply fit
+        run_fit(source, model)
+
+        # Save fit plot of candidate model (kept only with plot policy 'all')
+        save_fit_plot('plots/fits/%s_%s_fit_%s' % (obsid,srcid,re.sub(r'[^\w.+]+','_',model).strip('_')), stage='candidate')
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     run_fit()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Fit the current source model with the first optimizer of the strategy, escalating to the next one    #
+#               (starting from the previous best-fit values) only if the fit fails to converge or its reduced        #
+#               statistic exceeds the strategy's limit. The best attempt (lowest statistic, converged fits first) is #
+#               restored at the end; an error is raised only if every optimizer failed with one. Log method,         #
+#               function evaluations, convergence & time of each attempt as an 'optimizer' event, and return the     #
+#               attempts.                                                                                            #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+# Optimizers tried in turn by run_fit(), fastest first, reduced statistic above which a fit is escalated, & engine of
+# candidate fits in choose_model()
+fit_strategy = {'methods': ('levmar','neldermead'), 'max_rstat': 2.0, 'engine': 'sherpa'}
+
+def run_fit(source, model):
+
+    methods = fit_strategy['methods']
+    attempts = []
+
+    # Best attempt so far: ((<not converged>, <statistic>), <parameter values>, <method>), and the attempt whose fit
+    # results the session holds (None after a failed attempt)
+    best = None
+    latest = None
+
+    try:
+        for n,method in enumerate(methods):
+            set_method(method)
+            start = time.time()
+
+            # A failed fit is escalated; its error is raised only if no attempt produced a fit
+            try:
+                with timer('fit'), timer('fit_%s' % method), watchdog('fit'):
+                    fit()
+            except Exception as e:
+                count_fit(escalated=(n > 0))
+                attempts.append({'method': method, 'succeeded': False, 'nfev': None, 'rstat': None, 'statval': None,
+                                 'seconds': time.time()-start, 'message': '%s: %s' % (type(e).__name__,e)})
+                if best is None and n == len(methods)-1:
+                    raise
+                latest = None
+                continue
+
+            results = get_fit_results()
+            count_fit(int(results.nfev), escalated=(n > 0))
+            attempts.append({'method': method, 'succeeded': bool(results.succeeded), 'nfev': int(results.nfev),
+                             'rstat': results.rstat, 'statval': results.statval, 'seconds': time.time()-start,
+                             'message': results.message})
+
+            rank = (not results.succeeded, results.statval)
+            if best is None or rank < best[0]:
+                best = (rank, [par.val for par in get_source().pars], method)
+            latest = method
+
+            # Keep a converged fit unless its reduced statistic looks poor
+            if results.succeeded and (results.rstat is None or results.rstat <= fit_strategy['max_rstat']):
+                break
+
+        # If a later attempt did worse, fit again with the best attempt's optimizer from its best-fit values, so the
+        # session's parameters & fit results (read by fit_summary(), log_info(), ...) are those of the best attempt
+        if latest != best[2]:
+            for par,val in zip(get_source().pars, best[1]):
+                if not par.alwaysfrozen and par.link is None:
+                    par.val = val
+            set_method(best[2])
+            with timer('fit'), timer('fit_%s' % best[2]), watchdog('fit'):
+                fit()
+            count_fit(int(get_fit_results().nfev), escalated=True)
+
+    finally:
+        emit('optimizer', obsid=source[0], srcid=source[1], model=model, attempts=attempts)
+
+    return(attempts)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_fit_strategy()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Set optimizers tried in turn by run_fit(), the reduced statistic above which a fit is escalated, and #
+#               the engine fitting candidate models in choose_model().                                               #
+#                                                                                                                    #
+# VARIABLES:    methods -- List of strings; Sherpa optimizers, fastest first, e.g. ['levmar','neldermead','moncar']  #
+#               max_rstat -- Float; reduced statistic above which a converged fit is escalated                       #
+#               engine -- String; 'sherpa', or 'batch' to fit the candidates acab_vector supports with its NumPy     #
+#                         engine first (see batch_fits())                                                            #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_fit_strategy(methods=('levmar','neldermead'), max_rstat=2.0, engine='sherpa'):
+
+    fit_strategy.update(methods=tuple(methods), max_rstat=float(max_rstat), engine=engine)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fit_key()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Return key identifying a fit of a given model to a given source's spectrum, bounds, binning &        #
+#               statistic.                                                                                           #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+# Cache of fit results for fit_key() tuples, filled by cached_fit()
+fit_cache = {}
+
+def fit_key(source, model, binning='', bounds='', stat='chi2datavar'):
+
+    # Default bounds are the same as in fitting_fast()
+    if bounds == '':
+        bounds = [0.3,10]
+
+    return((source[0], source[1], model, tuple(bounds), binning, stat))
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     cached_fit()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Fit model with fitting_fast() only if not already fitted, return fit statistics & best-fit values.   #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def cached_fit(source, model, binning='', bounds='', stat='chi2datavar'):
+
+    # Fit model once (warm-started from a nested simpler fit), store reduced chi-squared, degrees of freedom,
+    # statistic & best-fit parameter values
+    key = fit_key(source, model, binning, bounds, stat)
+    if key not in fit_cache:
+        with timer('fitting_fast'):
+            fitting_fast(source, model, binning, bounds, seed=nested_seed(source, model, binning, bounds, stat), stat=stat)
+        fit_cache[key] = fit_summary()
+
+    return(fit_cache[key])
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fit_summary()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return reduced chi-squared, degrees of freedom, statistic, number of bins, best-fit parameter        #
+#               values, optimizer & function evaluations of the last fit, as stored in the fit cache.                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def fit_summary():
+
+    stats, results = get_stat_info()[0], get_fit_results()
+
+    return({'rstat': stats.rstat,
+            'dof': stats.dof,
+            'statval': stats.statval,
+            'numpoints': stats.numpoints,
+            'parnames': tuple(results.parnames),
+            'parvals': tuple(results.parvals),
+            'method': results.methodname,
+            'nfev': int(results.nfev)})
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     nested_seed()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return best-fit values {<parameter name>: <value>} of the largest cached fit of a model nested in    #
+#               the given model (same source, bounds, binning & statistic); None if no such fit is cached.           #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def nested_seed(source, model, binning='', bounds='', stat='chi2datavar'):
+
+    # Cached fits of the same data with a nested model: most components first, then best statistic
+    obsid,srcid,_,bnds,binn,stat = fit_key(source, model, binning, bounds, stat)
+    components = model_components(model)
+    nested = [(-len(model_components(key[2])), fit['statval'], key[2], fit) for key,fit in fit_cache.items()
+              if key[:2] == (obsid,srcid) and key[3:] == (bnds,binn,stat) and model_components(key[2]) < components]
+
+    if not nested:
+        return(None)
+
+    fit = min(nested)[3]
+    return(dict(zip(fit['parnames'], fit['parvals'])))
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     clear_fit_cache()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Empty the fit & covariance caches; call between sources so they do not grow over a catalog.          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def clear_fit_cache():
+
+    fit_cache.clear()
+    covar_cache.clear()
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     ftest()                                                                                              #
+#                                                                                                                    #
+# DESCRIPTION:  Perform statistical comparison (f-test) between two models, return best model.                       #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model1 -- String; '<model>'                                                                          #
+#               model2 -- String; '<model>'                                                                          #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               good -- Boolean; determines whether good or bad model is returned                                    #
+#               stat -- String; chi-squared fit statistic, e.g. 'chi2datavar'                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+
+
+def ftest(source,model1,model2,binning='',bounds='',good=True,stat='chi2datavar'):
+
+    # Fit simple model (or reuse cached fit), get reduced chi-squared, chi-squared and degrees of freedom
+    fit1 = cached_fit(source, model1, binning, bounds, stat)
+    chi1, stat1, dof1 = fit1['rstat'], fit1['statval'], fit1['dof']
+
+    # Fit simple model (or reuse cached fit), get reduced chi-squared, chi-squared and degrees of freedom
+    fit2 = cached_fit(source, model2, binning, bounds, stat)
+    chi2, stat2, dof2 = fit2['rstat'], fit2['statval'], fit2['dof']
+
+    # Record comparison for the event log; the p-value is None if it could not be calculated (same DoF)
+    def record(winner, p=None):
+        emit('ftest', obsid=source[0], srcid=source[1], model1=model1, model2=model2, stat=stat,
+             statval1=stat1, dof1=dof1, rstat1=chi1, statval2=stat2, dof2=dof2, rstat2=chi2, pvalue=p, winner=winner)
+
+    # Decide which model is more complex
+    if dof1 > dof2:
+        simpMod, compMod = model1, model2
+        simpStat, compStat = stat1, stat2
+        simpDOF, compDOF = dof1, dof2
+    elif dof2 > dof1:
+        simpMod, compMod = model2, model1
+        simpStat, compStat = stat2, stat1
+        simpDOF, compDOF = dof2, dof1
+    # If DoF vals are the same, calc_ftest doesn't work; arbitrarily choose the model with the lower red. chi^2 in this case
+    elif chi1 < chi2:
+        record(model1)
+        return(model1)
+    # If red. chi^2 are identical, arbitrarily choose model2
+    elif chi2 <= chi1:
+        record(model2)
+        return(model2)
+
+    # Calculate p-value from (non-reduced) chi-squared values, select model (95% certainty)
+    p = calc_ftest(simpDOF, simpStat, compDOF, compStat)
+    winner, loser = (simpMod, compMod) if p > 0.05 else (compMod, simpMod)
+    record(winner, p)
+
+    # Return best model (or the rejected one if good is False)
+    if good==True:
+        return(winner)
+    else:
+        return(loser)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     candidate_models()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return list of candidate models (without duplicates) considered by choose_model() for a tier of      #
+#               source brightness (see acab_triage): single emission components for faint sources, two components    #
+#               for medium ones & all models for bright ones.                                                        #
+#                                                                                                                    #
+# VARIABLES:    tier -- String; 'faint', 'medium' or 'bright'                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def candidate_models(tier='bright'):
+
+    #--------------------------------#
+    #        MODEL DEFINITIONS       #
+    #--------------------------------#
+
+    # Define default base model (always two-component absorption from MW & source)
+    base = '(xstbabs.abs1+xstbabs.abs2)'
+
+    # Define allowed emission models
+    diskModels = ['xsdiskbb.didkbb','xsdiskpn.diskpn','xsapec.apec']
+    coronaModels = ['powlaw1d.powlaw','xscompbb.compbb']
+    gasModels = ['xsmekal.mekal']
+
+    # Faint sources cannot constrain more than one emission component; fit a corona or a disk alone
+    if tier == 'faint':
+        return([base + '*(%s)' % coronaModels[0], base + '*(%s)' % diskModels[0]])
+
+    # Create an array of all models; gas, corona cannot exist without disk & base model alone not sufficient
+    allModels = []
+    for disk in diskModels:
+        for corona in coronaModels:
+            for gas in gasModels:
+                # allModels.append(base + ('*(%s)' % (gas)))
+                # allModels.append(base + ('*(%s+%s)' % (gas,corona)))
+                allModels.append(base + ('*(%s+%s)' % (gas,disk)))
+                allModels.append(base + ('*(%s+%s+%s)' % (gas,corona,disk)))
+            # allModels.append(base + ('*(%s)') % corona)
+            allModels.append(base + ('*(%s+%s)' % (corona,disk)))
+        # allModels.append(base + '*(%s)' % disk)
+
+    # Medium sources: two emission components at most
+    if tier == 'medium':
+        allModels = [model for model in allModels if len(model_components(model)) <= 4]
+
+    # Remove duplicates (e.g. gas + disk is added once per corona model), keeping order
+    return([model for n,model in enumerate(allModels) if model not in allModels[:n]])
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     model_components()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return set of model components ('<type>.<name>') in a model expression.                              #
+#                                                                                                                    #
+# VARIABLES:    model -- String; '<model>'                                                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def model_components(model):
+
+    return(frozenset(re.findall(r'\w+\.\w+', model)))
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     info_criterion()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Return Akaike ('aic') or Bayesian ('bic') information criterion of a cached fit; lower is better.    #
+#                                                                                                                    #
+# VARIABLES:    fit -- Dictionary; fit statistics as returned by cached_fit()                                        #
+#               criterion -- String; 'aic' or 'bic'                                                                  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def info_criterion(fit, criterion='aic'):
+
+    # Number of free parameters from number of bins & degrees of freedom
+    npars = fit['numpoints'] - fit['dof']
+
+    if criterion == 'aic':
+        return(fit['statval'] + 2*npars)
+    elif criterion == 'bic':
+        return(fit['statval'] + npars*np.log(fit['numpoints']))
+    else:
+        raise ValueError("info_criterion(): criterion must be 'aic' or 'bic', not %r" % criterion)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     start_tournament_pool()                                                                              #
+#                                                                                                                    #
+# DESCRIPTION:  Start a pool of worker processes (each with its own Sherpa session) fitting the candidate models of  #
+#               a source at the same time in choose_model(); with fewer than 2 workers candidates are fitted in      #
+#               turn. Use from a serial run only (pool workers cannot start pools of their own).                     #
+#                                                                                                                    #
+# VARIABLES:    workers -- Integer; number of candidate fit processes                                                #
+#               policy -- String; plot policy, 'none', 'winner' or 'all'                                             #
+#               fmt -- String; plot file format, 'pdf' or 'png'                                                      #
+#               responses -- Tuple; (<directory>, <megabytes>) of the shared response cache, or None                 #
+#               budgets -- Dictionary; watchdog budgets {<stage>: <seconds>}, or None                                #
+#               events -- Tuple; (<path>, <batch size>) of the event log, or None                                    #
+#               strategy -- Tuple; (<optimizers>, <maximum reduced statistic>, <engine>), see set_fit_strategy(), or #
+#                          None                                                                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+# Pool of candidate fit processes used by choose_model(), if started, & its arguments (for restarts)
+tournament_pool = None
+tournament_args = None
+
+def start_tournament_pool(workers, policy='winner', fmt='pdf', responses=None, budgets=None, events=None, strategy=None):
+
+    global tournament_pool, tournament_args
+
+    if workers > 1 and tournament_pool is None:
+        tournament_pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(policy,fmt,responses,budgets,events,None,strategy))
+        tournament_args = (workers,policy,fmt,responses,budgets,events,strategy)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     stop_tournament_pool()                                                                               #
+#                                                                                                                    #
+# DESCRIPTION:  Stop the candidate fit pool, if started.                                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def stop_tournament_pool():
+
+    global tournament_pool
+
+    if tournament_pool is not None:
+        tournament_pool.close()
+        tournament_pool.join()
+        tournament_pool = None
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     restart_tournament_pool()                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Kill the candidate fit pool (e.g. with fits still running after a tournament timeout) & start a new  #
+#               one with the same arguments.                                                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def restart_tournament_pool():
+
+    global tournament_pool
+
+    if tournament_pool is not None:
+        tournament_pool.terminate()
+        tournament_pool.join()
+        tournament_pool = None
+        start_tournament_pool(*tournament_args)
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     fit_candidate()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Fit one candidate model in a tournament pool worker; return (<model>, <fit summary>, <timings>,      #
+#               <plot jobs>, <watchdog notes>) for the parent process; the fit summary is None if the fit ran out of #
+#               time. The worker's Sherpa session is reset when the first candidate of the next source arrives, as   #
+#               process_source() resets it after each source, so workers' memory stays flat too.                     #
+#                                                                                                                    #
+# VARIABLES:    task -- Tuple; (<source>, <model>, <binning>, <bounds>, <seed>, <stat>), arguments of fitting_fast() #
+#--------------------------------------------------------------------------------------------------------------------#
+
+# Source (<obsid>, <source number>) whose spectrum this tournament pool worker holds
+candidate_source = None
+
+def fit_candidate(task):
+
+    global candidate_source
+
+    source, model, binning, bounds, seed, stat = task
+
+    # Candidates of one source share the loaded spectrum; Sherpa state of the previous source is dropped
+    if candidate_source is not None and candidate_source != (source[0],source[1]):
+        reset_session()
+    candidate_source = (source[0],source[1])
+
+    pop_timings()
+    try:
+        with timer('fitting_fast'):
+            fitting_fast(source, model, binning, bounds, seed=seed, stat=stat)
+        fit = fit_summary()
+    except Timeout as e:
+        note_timeout('fit of %s: %s' % (model,e))
+        fit = None
+
+    # Write the events of this fit now; pool workers exit without running atexit handlers
+    flush_events()
+
+    return((model, fit, pop_timings(), pop_plot_jobs(), pop_timeouts()))
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     parallel_fits()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Fit candidate models of a source on the tournament pool, one level of model complexity at a time so  #
+#               that each level is warm-started from the fits of the simpler one; fill the fit cache & return        #
+#               dictionary of fits {<model>: <fit summary>} (without fits that ran out of time).                     #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               models -- List of strings; candidate models                                                          #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def parallel_fits(source, models, binning='', bounds='', stat='chi2datavar'):
+
+    for size in sorted(set(len(model_components(model)) for model in models)):
+
+        # Models of this level not fitted yet, with seeds from simpler fits
+        tasks = [(source, model, binning, bounds, nested_seed(source, model, binning, bounds, stat), stat) for model in models
+                 if len(model_components(model)) == size and fit_key(source, model, binning, bounds, stat) not in fit_cache]
+
+        # Fit level; worker times (summed over workers), plots & watchdog notes are added to the source
+        for model,fit,timings,plots,timeouts in tournament_pool.imap_unordered(fit_candidate, tasks):
+            if fit is not None:
+                fit_cache[fit_key(source, model, binning, bounds, stat)] = fit
+            add_timings(timings)
+            add_plot_jobs(plots)
+            for text in timeouts:
+                note_timeout(text)
+
+    return({model: fit_cache[fit_key(source, model, binning, bounds, stat)] for model in models
+            if fit_key(source, model, binning, bounds, stat) in fit_cache})
+
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     batch_fits()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Fit the candidate models of a source the batch engine supports (absorbed power laws & disks, see     #
+#               acab_vector) with NumPy, and fill the fit cache with those that converged with a reduced statistic   #
+#               of at most the escalation threshold; other candidates are left to Sherpa. Chi-squared only.          #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               models -- List of strings; candidate models                                                          #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def batch_fits(source, models, binning='', bounds=''):
+
+    # Supported models not fitted yet
+    models = [model for model in models if batch_components(model) is not None
+              and fit_key(source, model, binning, bounds) not in fit_cache]
+    if not models:
+        return
+
+    with timer('batch_fit'):
+        try:
+            loaded = load_batch_source(source, binning, bounds)
+        except Exception as e:
+            print('\nbatch_fits(): Cannot load %s_%s for the batch engine (%s: %s); fitting with Sherpa'
+                  % (source[0],source[1],type(e).__name__,e))
+            return
+
+        # Fits as stored by fit_summary(); a failed or poor fit is fitted again by Sherpa
+        for model in models:
+            fit = batch_fit([loaded], model)[0]
+            if fit['succeeded'] and fit['rstat'] <= fit_strategy['max_rstat']:
+                summary = {key: fit[key] for key in ('rstat','dof','statval','numpoints','parnames','parvals')}
+                fit_cache[fit_key(source, model, binning, bounds)] = dict(summary, method='batch', nfev=0)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     choose_model()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Fit all candidate models of a tier once, f-test nested models (chi-squared statistics only), rank    #
+#               the rest by AIC/BIC, return best model.                                                              #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               criterion -- String; information criterion for non-nested models, 'aic' or 'bic'                     #
+#               stat -- String; fit statistic, e.g. 'chi2datavar' or 'wstat'                                         #
+#               tier -- String; 'faint', 'medium' or 'bright', see candidate_models()                                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def choose_model(source,binning='',bounds='',criterion='aic',stat='chi2datavar',tier='bright'):
+
+    # Candidate models, simplest first
+    allModels = sorted(candidate_models(tier), key=lambda model: len(model_components(model)))
+
+    #------------------------#
+    #         FITTING        #
+    #------------------------#
+
+    # Fit every candidate exactly once, those the batch engine supports first if it is selected, the rest at the same
+    # time on the tournament pool if started; candidates whose fit runs out of time are left out
+    try:
+        with watchdog('tournament'):
+            if fit_strategy['engine'] == 'batch' and stat == 'chi2datavar':
+                batch_fits(source, allModels, binning, bounds)
+            if tournament_pool is not None:
+                parallel_fits(source, allModels, binning, bounds, stat)
+            else:
+                for model in allModels:
+                    try:
+                        cached_fit(source, model, binning, bounds, stat)
+                    except Timeout as e:
+                        if e.stage != 'fit':
+                            raise
+                        note_timeout('fit of %s: %s' % (model,e))
+
+    # If the tournament runs out of time, the models fitted so far compete. Fits abandoned on the tournament pool (also
+    # when the source's budget runs out) would keep its workers busy into the next source, so the pool is replaced
+    except Timeout as e:
+        if tournament_pool is not None:
+            restart_tournament_pool()
+        if e.stage != 'tournament':
+            raise
+        note_timeout('tournament of %s_%s: %s; choosing among models fitted so far' % (source[0],source[1],e))
+
+    fits = {model: fit_cache[fit_key(source, model, binning, bounds, stat)] for model in allModels
+            if fit_key(source, model, binning, bounds, stat) in fit_cache}
+    if not fits:
+        raise RuntimeError('choose_model(): no candidate model could be fitted in time')
+    allModels = [model for model in allModels if model in fits]
+
+    #------------------------#
+    #        F-TESTING       #
+    #------------------------#
+
+    # For each pair of nested models, f-test (using cached fits) and reject the loser; the f-test needs chi-squared
+    rejected = set()
+    for simpMod in allModels:
+        for compMod in allModels:
+            if stat.startswith('chi2') and model_components(simpMod) < model_components(compMod):
+                with timer('ftest'):
+                    rejected.add(ftest(source,simpMod,compMod,binning=binning,bounds=bounds,good=False,stat=stat))
+
+    #------------------------#
+    #         RANKING        #
+    #------------------------#
+
+    # Rank models not rejected by an f-test with the information criterion; if all were rejected, rank all models
+    contenders = [model for model in allModels if model not in rejected] or allModels
+    ranked = sorted(contenders, key=lambda model: info_criterion(fits[model], criterion))
+
+    # Log ranking results
+    emit('rank', obsid=source[0], srcid=source[1], criterion=criterion, stat=stat, winner=ranked[0],
+         rejected=sorted(rejected), ranking=[{'model': model, criterion: info_criterion(fits[model], criterion),
+                                              'statval': fits[model]['statval'], 'dof': fits[model]['dof']} for model in ranked])
 
     # Return best model
-    return(contenders[0])
+    return(ranked[0])
@@ -0,0 +1,125 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_memory.py                                                      #
+#                                                                           #
+# PURPOSE: Memory of long ACAB runs: resident & peak memory of a process    #
+#          per source (from /proc), release of memory held after a source   #
+#          (garbage, matplotlib figures, free heap), and the limits after   #
+#          which worker processes are replaced by fresh ones.               #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import gc
+import sys
+import ctypes
+
+# Worker processes are replaced after this many sources, or once their resident memory after a source exceeds this
+# many megabytes (0: never)
+limits = {'sources': 0, 'rss_mb': 0}
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_recycling()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Set the limits after which worker processes are replaced; 0 means no limit.                          #
+#                                                                                                                    #
+# VARIABLES:    sources -- Integer; sources per worker process                                                       #
+#               rss_mb -- Float; resident megabytes of a worker process after a source                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_recycling(sources=0, rss_mb=0):
+
+    limits.update(sources=int(sources or 0), rss_mb=float(rss_mb or 0))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     memory_mb()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Return memory of this process in megabytes from /proc/self/status: resident ('VmRSS') or peak        #
+#               resident since the last reset_peak() ('VmHWM'); None where /proc is not available.                   #
+#                                                                                                                    #
+# VARIABLES:    field -- String; 'VmRSS' or 'VmHWM'                                                                  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def memory_mb(field='VmRSS'):
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return(int(line.split()[1])/1024.0)
+    except OSError:
+        pass
+
+    return(None)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     reset_peak()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Reset the peak resident memory (VmHWM) of this process to its current resident memory, so that the   #
+#               peak of the next source can be read; no-op where the kernel does not allow it.                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def reset_peak():
+
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     release_memory()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Collect garbage (e.g. the Sherpa session of the previous source), close matplotlib figures still     #
+#               open (if matplotlib was imported) & hand free heap memory back to the system (glibc only).           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def release_memory():
+
+    if 'matplotlib.pyplot' in sys.modules:
+        sys.modules['matplotlib.pyplot'].close('all')
+
+    gc.collect()
+
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     over_limit()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Return True if the worker process of a source result held more resident memory after the source than #
+#               the limit of set_recycling().                                                                        #
+#                                                                                                                    #
+# VARIABLES:    result -- Dictionary; as returned by acab_funcs.process_source()                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def over_limit(result):
+
+    rss = result['timings'].get('rss_mb')
+
+    return(bool(limits['rss_mb']) and rss is not None and rss > limits['rss_mb'])
@@ -0,0 +1,279 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_plots.py                                                       #
+#                                                                           #
+# PURPOSE: Plot policy & deferred plot rendering for ACAB. Plots are saved  #
+#          as arrays while fitting and rendered later, optionally by a      #
+#          background process pool, so matplotlib stays off the fit path.   #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Allowed plot policies; 'winner' keeps raw spectra & the final fit, 'all' also keeps every candidate fit
+PLOT_POLICIES = ('none','winner','all')
+
+# Allowed plot file formats
+PLOT_FORMATS = ('pdf','png')
+
+# Jobs in flight per rendering process above which submit_plots() waits for the oldest; each holds its plot arrays
+PLOT_BACKLOG = 4
+
+# Current policy & format, plot jobs captured in this process, background renderer, its processes & pending jobs
+plot_policy = 'winner'
+plot_format = 'pdf'
+plot_jobs = []
+renderer = None
+render_workers = 0
+rendering = []
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_plot_policy()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Set which plots are kept & the file format they are written in.                                      #
+#                                                                                                                    #
+# VARIABLES:    policy -- String; 'none', 'winner' or 'all'                                                          #
+#               fmt -- String; 'pdf' or 'png'                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_plot_policy(policy='winner', fmt='pdf'):
+
+    global plot_policy, plot_format
+
+    if policy not in PLOT_POLICIES:
+        raise ValueError('set_plot_policy(): policy must be one of %s, not %r' % (PLOT_POLICIES,policy))
+    if fmt not in PLOT_FORMATS:
+        raise ValueError('set_plot_policy(): format must be one of %s, not %r' % (PLOT_FORMATS,fmt))
+
+    plot_policy, plot_format = policy, fmt
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     wants_plot()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Return True if the current plot policy keeps plots of a given stage.                                 #
+#                                                                                                                    #
+# VARIABLES:    stage -- String; 'final' (raw spectra & final fit) or 'candidate' (model tournament fits)            #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def wants_plot(stage='final'):
+
+    if stage == 'candidate':
+        return(plot_policy == 'all')
+    else:
+        return(plot_policy != 'none')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     add_plot_job()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Add file extension to a plot job (dictionary of plot arrays, see render_plot()), queue it for        #
+#               rendering; return the job.                                                                           #
+#                                                                                                                    #
+# VARIABLES:    job -- Dictionary; 'kind' ('data' or 'fit'), 'path' (without extension) & plot arrays                #
+#               queue -- Boolean; if False, the caller renders the job itself                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def add_plot_job(job, queue=True):
+
+    job['path'] = '%s.%s' % (job['path'],plot_format)
+    if queue:
+        plot_jobs.append(job)
+
+    return(job)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     add_plot_jobs()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Queue plot jobs captured in another process (file extension already added), e.g. by a candidate fit  #
+#               worker.                                                                                              #
+#                                                                                                                    #
+# VARIABLES:    jobs -- List of dictionaries; from pop_plot_jobs() in the other process                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def add_plot_jobs(jobs):
+
+    plot_jobs.extend(jobs)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     pop_plot_jobs()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return & forget plot jobs captured in this process (e.g. to hand them from a worker to the driver).  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def pop_plot_jobs():
+
+    jobs = list(plot_jobs)
+    del plot_jobs[:]
+
+    return(jobs)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     render_plot()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Render a plot job with matplotlib & save it to job['path'].                                          #
+#                                                                                                                    #
+# VARIABLES:    job -- Dictionary; 'kind', 'path', 'xlo', 'xhi', 'y', 'yerr', labels, 'xlog', 'ylog' and, for fits,  #
+#                      'model' (model counts per bin) & 'delchi' (residuals in sigma)                                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def render_plot(job):
+
+    # Import matplotlib only where plots are rendered; no display needed
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pylab as plt
+
+    # Matplotlib style sheet
+    plt.style.use('bmh')
+
+    # Bin centers & half-widths
+    xlo, xhi = np.asarray(job['xlo']), np.asarray(job['xhi'])
+    x, xerr = (xlo+xhi)/2, (xhi-xlo)/2
+
+    # Data plot: spectrum only
+    if job['kind'] == 'data':
+        fig, ax = plt.subplots()
+        axes = [ax]
+
+    # Fit plot: spectrum & model over residuals (as plot_fit_delchi())
+    else:
+        fig, (ax, axr) = plt.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2,1]})
+        axes = [ax, axr]
+
+    # Spectrum
+    ax.errorbar(x, job['y'], xerr=xerr, yerr=job['yerr'], fmt='.', ms=3, lw=1)
+    ax.set_ylabel(job['ylabel'])
+    ax.set_title(job['title'])
+
+    # Model & residuals
+    if job['kind'] == 'fit':
+        ax.step(np.append(xlo,xhi[-1]), np.append(job['model'],job['model'][-1]), where='post', lw=1.5)
+        axr.errorbar(x, job['delchi'], xerr=xerr, yerr=np.ones_like(x), fmt='.', ms=3, lw=1)
+        axr.axhline(0, color='k', lw=1)
+        axr.set_ylabel('Sigma')
+
+    # Axes scales & labels
+    if job['xlog']:
+        for a in axes:
+            a.set_xscale('log')
+    if job['ylog']:
+        ax.set_yscale('log')
+    axes[-1].set_xlabel(job['xlabel'])
+
+    # Save & close figure
+    fig.savefig(job['path'])
+    plt.close(fig)
+
+    return(job['path'])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     start_renderer()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Start a background process pool for render_plot(); with 0 workers plots are rendered in-process.     #
+#                                                                                                                    #
+# VARIABLES:    workers -- Integer; number of rendering processes                                                    #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def start_renderer(workers=1):
+
+    global renderer, render_workers
+
+    if workers > 0 and renderer is None:
+        renderer = ProcessPoolExecutor(workers)
+        render_workers = workers
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     submit_plots()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Render plot jobs, in the background if start_renderer() was called, else immediately. At most        #
+#               PLOT_BACKLOG jobs per rendering process are in flight; beyond that the oldest is waited for, so      #
+#               memory does not grow when fitting outpaces rendering.                                                #
+#                                                                                                                    #
+# VARIABLES:    jobs -- List of dictionaries; plot jobs, e.g. from pop_plot_jobs()                                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def submit_plots(jobs):
+
+    for job in jobs:
+        if renderer is None:
+            render_plot(job)
+            continue
+
+        # Wait for the oldest jobs while the renderer is too far behind
+        while len(rendering) >= PLOT_BACKLOG*render_workers:
+            future = rendering.pop(0)
+            if future.exception() is not None:
+                print('\nsubmit_plots(): Plot failed: %s' % future.exception())
+
+        rendering.append(renderer.submit(render_plot, job))
+
+    # Forget finished jobs, report failed ones
+    for future in [future for future in rendering if future.done()]:
+        rendering.remove(future)
+        if future.exception() is not None:
+            print('\nsubmit_plots(): Plot failed: %s' % future.exception())
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     finish_plots()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Render plots still captured in this process, wait for background rendering, stop the renderer.       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def finish_plots():
+
+    global renderer
+
+    submit_plots(pop_plot_jobs())
+
+    for future in rendering:
+        if future.exception() is not None:
+            print('\nfinish_plots(): Plot failed: %s' % future.exception())
+    del rendering[:]
+
+    if renderer is not None:
+        renderer.shutdown()
+        renderer = None
@@ -0,0 +1,239 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_prefetch.py                                                    #
+#                                                                           #
+# PURPOSE: Background prefetch of ACAB spectra. While a source is fitted,   #
+#          threads read & parse the PHA/ARF/RMF/background files of the     #
+#          next sources into a buffer with a bounded memory budget;         #
+#          prepare_data() takes them from there instead of reading again.   #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Spectra read ahead {<path>: (<DataPHA>, <bytes>)}, paths in the order they were scheduled, paths being read,
+# bytes buffered & memory budget; all guarded by the condition
+buffer = {}
+order = deque()
+reading = set()
+state = {'bytes': 0, 'budget': 512*2**20}
+condition = threading.Condition()
+
+# Reading threads, if started
+reader = None
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     spectrum_path()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return path of a source's grouped spectrum.                                                          #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def spectrum_path(source):
+
+    return('%s/extracted_spectra_%s_%s_grp.pi' % (source[0],source[0],source[1]))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     data_size()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Return bytes of array data held by a spectrum, its responses & backgrounds.                          #
+#                                                                                                                    #
+# VARIABLES:    pha -- DataPHA; from sherpa.astro.io.read_pha()                                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def data_size(pha):
+
+    parts = [pha]
+    for data in [pha] + [pha.get_background(bkg_id) for bkg_id in pha.background_ids]:
+        parts += [data] + [data.get_arf(resp_id) for resp_id in data.response_ids] + \
+                 [data.get_rmf(resp_id) for resp_id in data.response_ids]
+
+    # Count each object once
+    seen = {id(part): part for part in parts if part is not None}
+
+    return(sum(value.nbytes for part in seen.values() for value in vars(part).values() if isinstance(value, np.ndarray)))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     start_prefetch()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Start reading threads & set the memory budget of the prefetch buffer.                                #
+#                                                                                                                    #
+# VARIABLES:    budget_mb -- Float; megabytes of spectra held in the buffer (one spectrum may exceed it)             #
+#               threads -- Integer; number of reading threads                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def start_prefetch(budget_mb=512, threads=1):
+
+    global reader
+
+    state['budget'] = budget_mb*2**20
+    if reader is None:
+        reader = ThreadPoolExecutor(threads, thread_name_prefix='acab-prefetch')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     stop_prefetch()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Stop reading threads & empty the buffer.                                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def stop_prefetch():
+
+    global reader
+
+    with condition:
+        buffer.clear()
+        order.clear()
+        state['bytes'] = 0
+        condition.notify_all()
+
+    if reader is not None:
+        reader.shutdown(wait=True, cancel_futures=True)
+        reader = None
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     read_ahead()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Read a spectrum into the buffer (reading thread). Waits while the buffer is over budget; spectra     #
+#               no longer wanted (taken or skipped meanwhile) are dropped. Read errors are left to load_pha().       #
+#                                                                                                                    #
+# VARIABLES:    path -- String; spectrum file                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def read_ahead(path):
+
+    from sherpa.astro.io import read_pha
+
+    with condition:
+        condition.wait_for(lambda: state['bytes'] < state['budget'] or path not in order)
+        if path not in order:
+            return
+        reading.add(path)
+
+    try:
+        pha = read_pha(path)
+        size = data_size(pha)
+    except Exception:
+        pha = None
+
+    with condition:
+        reading.discard(path)
+        if pha is not None and path in order:
+            buffer[path] = (pha,size)
+            state['bytes'] += size
+        elif path in order:
+            order.remove(path)
+        condition.notify_all()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     schedule()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Schedule a spectrum to be read ahead, if prefetching was started.                                    #
+#                                                                                                                    #
+# VARIABLES:    path -- String; spectrum file                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def schedule(path):
+
+    if reader is None:
+        return
+
+    with condition:
+        if path in order:
+            return
+        order.append(path)
+
+    reader.submit(read_ahead, path)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     take_spectrum()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return prefetched spectrum (DataPHA with responses & backgrounds) & remove it from the buffer; waits #
+#               if it is being read. Return None if it was not prefetched (then load it as usual). Spectra scheduled #
+#               before it & not taken are dropped.                                                                   #
+#                                                                                                                    #
+# VARIABLES:    path -- String; spectrum file                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def take_spectrum(path):
+
+    with condition:
+        if path not in order:
+            return(None)
+
+        # Drop spectra that were skipped
+        while order[0] != path:
+            skipped = order.popleft()
+            state['bytes'] -= buffer.pop(skipped, (None,0))[1]
+
+        # Wait for a read in progress; a read not started yet is cancelled
+        condition.wait_for(lambda: path not in reading)
+        order.popleft()
+        pha,size = buffer.pop(path, (None,0))
+        state['bytes'] -= size
+        condition.notify_all()
+
+    return(pha)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     prefetch_tasks()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Yield process_source() tasks while scheduling the spectra of the next k tasks to be read ahead.      #
+#                                                                                                                    #
+# VARIABLES:    tasks -- Iterable of tuples; (<source>, ...), arguments of process_source()                          #
+#               ahead -- Integer; number of upcoming sources to read ahead                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def prefetch_tasks(tasks, ahead=2):
+
+    window = deque()
+    for task in tasks:
+        schedule(spectrum_path(task[0]))
+        window.append(task)
+        if len(window) > ahead:
+            yield(window.popleft())
+
+    while window:
+        yield(window.popleft())
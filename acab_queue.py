@@ -0,0 +1,389 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_queue.py                                                       #
+#                                                                           #
+# PURPOSE: SQLite work queue shared by ACAB drivers on several machines.   #
+#          Drivers claim sources under a time-limited lease renewed by a    #
+#          heartbeat thread while each source is alive; sources of dead or  #
+#          hung drivers are retried when their lease expires, and sources   #
+#          that fail too often are parked.                                  #
+#                                                                           #
+# NOTE: The queue relies on SQLite's file locks, so it must be on a local   #
+#       or lock-safe filesystem: a cluster filesystem with working POSIX    #
+#       locks (Lustre, GPFS, BeeGFS, CephFS) for drivers on several         #
+#       machines. Locking over NFS & SMB is unreliable (claims can          #
+#       interleave, the database can be corrupted), so open_queue()         #
+#       refuses those unless told the locks there are known to work.        #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import json
+import socket
+import sqlite3
+import argparse
+import threading
+import time
+
+# Queue table; state is 'pending', 'leased', 'done' or 'parked'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS queue (
+    obsid        TEXT NOT NULL,
+    srcid        TEXT NOT NULL,
+    position     INTEGER,
+    source       TEXT NOT NULL,
+    state        TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    worker       TEXT,
+    lease_until  REAL,
+    error        TEXT,
+    updated      REAL,
+    PRIMARY KEY (obsid, srcid)
+)
+'''
+
+# Queue states
+STATES = ('pending','leased','done','parked')
+
+# Filesystem types (as in /proc/mounts) on which SQLite locking is unreliable
+NETWORK_FILESYSTEMS = ('nfs','nfs4','cifs','smb3','smbfs','fuse.sshfs','9p')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     filesystem_type()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Return type of the filesystem a file is on (e.g. 'ext4', 'nfs4'), from the longest mount point       #
+#               containing it; None if the mount table cannot be read (not Linux).                                   #
+#                                                                                                                    #
+# VARIABLES:    path -- String; file, need not exist yet                                                             #
+#               mounts -- String; mount table                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def filesystem_type(path, mounts='/proc/mounts'):
+
+    try:
+        with open(mounts) as f:
+            table = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return(None)
+
+    # Spaces in mount points are written as \040
+    folder = os.path.realpath(os.path.dirname(os.path.abspath(path)))
+    found = None
+    for point,fstype in table:
+        point = point.replace('\\040',' ')
+        if (folder == point or folder.startswith(point.rstrip('/') + '/')) and (found is None or len(point) >= len(found[0])):
+            found = (point,fstype)
+
+    return(None if found is None else found[1])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     open_queue()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Open (and create if needed) a queue database; return the connection. Transactions are explicit, so   #
+#               claims by several drivers do not interleave. Raise ValueError if the database is on a filesystem     #
+#               where SQLite locking is unreliable (NETWORK_FILESYSTEMS), unless network is True.                    #
+#                                                                                                                    #
+# VARIABLES:    path -- String; SQLite database file, on a local or lock-safe filesystem shared by all drivers       #
+#               network -- Boolean; allow NFS/SMB, where POSIX locking is known to work                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def open_queue(path='acab_queue.sqlite', network=False):
+
+    fstype = filesystem_type(path)
+    if fstype in NETWORK_FILESYSTEMS and not network:
+        raise ValueError('open_queue(): %s is on %s, where SQLite locking is unreliable; put the queue on a local or '
+                         'lock-safe filesystem' % (path,fstype))
+
+    queue = sqlite3.connect(path, timeout=60, isolation_level=None)
+    queue.execute(SCHEMA)
+    queue.execute('CREATE INDEX IF NOT EXISTS queue_state ON queue (state, position)')
+
+    return(queue)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     worker_id()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Return identifier of this driver, '<host>:<process ID>'.                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def worker_id():
+
+    return('%s:%d' % (socket.gethostname(),os.getpid()))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     enqueue()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  Add sources to the queue; sources already queued (by any driver) are left as they are. Return number #
+#               of sources added.                                                                                    #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#               sources -- Iterable of (<position>, <source list>); e.g. from acab_catalog.read_catalog()            #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def enqueue(queue, sources):
+
+    added = 0
+    queue.execute('BEGIN IMMEDIATE')
+    for position,source in sources:
+        added += queue.execute('INSERT OR IGNORE INTO queue (obsid, srcid, position, source, updated) VALUES (?,?,?,?,?)',
+                               (source[0],source[1],position,json.dumps(source),time.time())).rowcount
+    queue.execute('COMMIT')
+
+    return(added)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     claim()                                                                                              #
+#                                                                                                                    #
+# DESCRIPTION:  Lease the next pending source, or a source whose lease expired (its driver died); return             #
+#               (<position>, <source list>), or None if there is nothing to claim now. Expired sources that already  #
+#               used up their attempts are parked instead.                                                           #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#               worker -- String; driver identifier, from worker_id()                                                #
+#               lease -- Float; seconds until the lease expires unless renewed by heartbeat()                        #
+#               max_attempts -- Integer; attempts before a source is parked                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def claim(queue, worker, lease=600, max_attempts=3):
+
+    now = time.time()
+    queue.execute('BEGIN IMMEDIATE')
+    try:
+        # Park sources whose driver died on their last attempt
+        queue.execute("UPDATE queue SET state = 'parked', worker = NULL, error = 'lease expired', updated = ? "
+                      "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now,now,max_attempts))
+
+        row = queue.execute("SELECT obsid, srcid, position, source FROM queue "
+                            "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                            "ORDER BY position LIMIT 1", (now,)).fetchone()
+        if row is not None:
+            queue.execute("UPDATE queue SET state = 'leased', attempts = attempts + 1, worker = ?, lease_until = ?, updated = ? "
+                          "WHERE obsid = ? AND srcid = ?", (worker,now+lease,now,row[0],row[1]))
+        queue.execute('COMMIT')
+    except:
+        queue.execute('ROLLBACK')
+        raise
+
+    return(None if row is None else (row[2],json.loads(row[3])))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     finish()                                                                                             #
+#                                                                                                                    #
+# DESCRIPTION:  Record result of a source leased by this driver: 'done' if it succeeded; otherwise back to 'pending' #
+#               for a retry, or 'parked' once it has failed max_attempts times. Return the new state, or 'stale' if  #
+#               the lease expired & the source was claimed by another driver (the queue is left as it is then).      #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#               worker -- String; driver identifier, from worker_id()                                                #
+#               result -- Dictionary; as returned by acab_funcs.process_source()                                     #
+#               max_attempts -- Integer; attempts before a source is parked                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def finish(queue, worker, result, max_attempts=3):
+
+    queue.execute('BEGIN IMMEDIATE')
+    try:
+        row = queue.execute("SELECT attempts FROM queue WHERE obsid = ? AND srcid = ? AND worker = ? AND state = 'leased'",
+                            (result['obsid'],result['srcid'],worker)).fetchone()
+        if row is None:
+            state = 'stale'
+        else:
+            if result['status'] == 'ok':
+                state = 'done'
+            else:
+                state = 'parked' if row[0] >= max_attempts else 'pending'
+            queue.execute("UPDATE queue SET state = ?, worker = NULL, lease_until = NULL, error = ?, updated = ? "
+                          "WHERE obsid = ? AND srcid = ? AND worker = ? AND state = 'leased'",
+                          (state,result['error'],time.time(),result['obsid'],result['srcid'],worker))
+        queue.execute('COMMIT')
+    except:
+        queue.execute('ROLLBACK')
+        raise
+
+    return(state)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     heartbeat()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Renew the leases of the sources still held by a driver (not those claimed by another driver since).  #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#               worker -- String; driver identifier, from worker_id()                                                #
+#               lease -- Float; seconds from now until the leases expire                                             #
+#               sources -- List of (<obsid>, <source number>); renew these sources only (None: all of the driver's)  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def heartbeat(queue, worker, lease=600, sources=None):
+
+    now = time.time()
+    if sources is None:
+        queue.execute("UPDATE queue SET lease_until = ?, updated = ? WHERE worker = ? AND state = 'leased'", (now+lease,now,worker))
+    else:
+        queue.executemany("UPDATE queue SET lease_until = ?, updated = ? WHERE obsid = ? AND srcid = ? AND worker = ? "
+                          "AND state = 'leased'", [(now+lease,now,obsid,srcid,worker) for obsid,srcid in sources])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     live_sources()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return list of (<obsid>, <source number>) of the sources a driver holds that are still alive: held   #
+#               for less than max_hold seconds. A source held longer is taken to be hung (its worker is stuck where  #
+#               the watchdog cannot abort it), so its lease is left to expire & another driver retries it.           #
+#                                                                                                                    #
+# VARIABLES:    held -- Dictionary; {(<obsid>, <source number>): <time claimed>} of the sources being processed      #
+#               max_hold -- Float; seconds a source may be held (None: no limit)                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def live_sources(held, max_hold=None):
+
+    now = time.time()
+
+    return([source for source,start in list(held.items()) if max_hold is None or now-start < max_hold])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     start_heartbeat()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Start a daemon thread renewing the leases of the live sources (see live_sources()) every lease/4     #
+#               seconds (with its own connection) while the driver fits; return a threading.Event that stops it when #
+#               set.                                                                                                 #
+#                                                                                                                    #
+# VARIABLES:    path -- String; SQLite queue database file                                                           #
+#               worker -- String; driver identifier, from worker_id()                                                #
+#               held -- Dictionary; {(<obsid>, <source number>): <time claimed>}, kept up to date by the driver      #
+#               lease -- Float; lease length in seconds                                                              #
+#               max_hold -- Float; seconds a source may be held before its lease is left to expire (None: no limit)  #
+#               network -- Boolean; see open_queue()                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def start_heartbeat(path, worker, held, lease=600, max_hold=None, network=False):
+
+    stop = threading.Event()
+
+    def beat():
+        queue = open_queue(path, network)
+        hung = set()
+        while not stop.wait(lease/4.0):
+            live = live_sources(held, max_hold)
+            for obsid,srcid in set(held) - set(live) - hung:
+                print('\nstart_heartbeat(): %s_%s held for over %g s; its lease is left to expire' % (obsid,srcid,max_hold))
+            hung = set(held) - set(live)
+            try:
+                heartbeat(queue, worker, lease, live)
+            except sqlite3.Error as e:
+                print('\nstart_heartbeat(): Lease renewal failed: %s' % e)
+        queue.close()
+
+    threading.Thread(target=beat, name='acab-heartbeat', daemon=True).start()
+
+    return(stop)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     queue_status()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary of number of sources per state.                                                    #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def queue_status(queue):
+
+    status = dict.fromkeys(STATES, 0)
+    status.update(queue.execute('SELECT state, COUNT(*) FROM queue GROUP BY state').fetchall())
+
+    return(status)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     requeue_parked()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Give parked sources a fresh set of attempts (back to 'pending'); return their number.                #
+#                                                                                                                    #
+# VARIABLES:    queue -- SQLite connection; from open_queue()                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def requeue_parked(queue):
+
+    return(queue.execute("UPDATE queue SET state = 'pending', attempts = 0, error = NULL, updated = ? WHERE state = 'parked'",
+                         (time.time(),)).rowcount)
+
+
+
+
+
+
+def main():
+
+    # Command line options
+    parser = argparse.ArgumentParser(description='Show state of an ACAB work queue, or re-queue parked sources.')
+    parser.add_argument('queue', help='SQLite queue database')
+    parser.add_argument('--parked', action='store_true', help='list parked sources & their last error')
+    parser.add_argument('--requeue', action='store_true', help='give parked sources a fresh set of attempts')
+    parser.add_argument('--network', action='store_true', help='allow a queue on NFS/SMB, where POSIX locking is known to work')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue, args.network)
+
+    if args.requeue:
+        requeue_parked(queue)
+
+    print('  '.join('%s: %d' % item for item in queue_status(queue).items()))
+
+    if args.parked:
+        for obsid,srcid,attempts,error in queue.execute("SELECT obsid, srcid, attempts, error FROM queue WHERE state = 'parked' ORDER BY position"):
+            print('%s_%s (%d attempts): %s' % (obsid,srcid,attempts,error))
+
+
+if __name__ == '__main__':
+    main()
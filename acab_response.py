@@ -0,0 +1,232 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_response.py                                                    #
+#                                                                           #
+# PURPOSE: Shared ARF/RMF cache for ACAB. Responses are parsed once, stored #
+#          by content hash as .npy arrays (RMFs in Sherpa's compressed      #
+#          N_GRP/F_CHAN/N_CHAN form) & memory-mapped copy-on-write, so      #
+#          fits & worker processes on a node share one copy in the page     #
+#          cache.                                                           #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+
+# Arrays & scalars stored per response type
+RESPONSE_ARRAYS = {'arf': ('energ_lo','energ_hi','specresp'),
+                   'rmf': ('energ_lo','energ_hi','n_grp','f_chan','n_chan','matrix','e_min','e_max')}
+RESPONSE_SCALARS = {'arf': ('exposure','ethresh'),
+                    'rmf': ('detchans','offset','ethresh')}
+
+# Cache directory, memory budget (bytes) of mapped responses, mapped responses {<content hash>: (<arrays>, <meta>,
+# <bytes>)} in least recently used order, bytes mapped, & the Sherpa readers replaced by the cache; mapped entries are
+# changed under a lock, as spectra are also read by the prefetch thread (acab_prefetch)
+cache = {'dir': None, 'budget': 1024*2**20, 'bytes': 0}
+mapped = OrderedDict()
+readers = {}
+lock = threading.Lock()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     install_response_cache()                                                                             #
+#                                                                                                                    #
+# DESCRIPTION:  Make sherpa.astro.io read ARFs & RMFs (e.g. in load_pha()/read_pha()) through the cache. Call once   #
+#               per process, e.g. in worker initializers.                                                            #
+#                                                                                                                    #
+# VARIABLES:    path -- String; cache directory, shared by the processes of a node                                   #
+#               budget_mb -- Float; megabytes of responses kept mapped per process (least recently used go first)    #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def install_response_cache(path, budget_mb=1024):
+
+    import sherpa.astro.io
+
+    os.makedirs(os.path.join(path,'index'), exist_ok=True)
+    cache['dir'], cache['budget'] = path, budget_mb*2**20
+
+    if not readers:
+        readers['arf'], readers['rmf'] = sherpa.astro.io.read_arf, sherpa.astro.io.read_rmf
+        sherpa.astro.io.read_arf = lambda arg, *args, **kwargs: read_response('arf', arg, *args, **kwargs)
+        sherpa.astro.io.read_rmf = lambda arg, *args, **kwargs: read_response('rmf', arg, *args, **kwargs)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     content_hash()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return content hash of a response file; looked up in the index by path, size & modification time,    #
+#               so each file version is hashed once per node.                                                        #
+#                                                                                                                    #
+# VARIABLES:    kind -- String; 'arf' or 'rmf'                                                                       #
+#               filename -- String; response file                                                                    #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def content_hash(kind, filename):
+
+    stat = os.stat(filename)
+    version = '%s %s %d %d' % (kind,os.path.realpath(filename),stat.st_size,stat.st_mtime_ns)
+    index = os.path.join(cache['dir'], 'index', hashlib.sha1(version.encode()).hexdigest())
+
+    if os.path.exists(index):
+        with open(index) as f:
+            return(f.read().strip())
+
+    sha = hashlib.sha1(kind.encode())
+    with open(filename,'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            sha.update(chunk)
+
+    write_atomic(index, sha.hexdigest().encode())
+
+    return(sha.hexdigest())
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     write_atomic()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Write bytes to a file via a temporary file & rename, so other processes never see partial files.     #
+#                                                                                                                    #
+# VARIABLES:    path -- String; file to write                                                                        #
+#               data -- Bytes                                                                                        #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def write_atomic(path, data):
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    with os.fdopen(fd,'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     store_response()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Parse a response file with Sherpa's reader & store its arrays (.npy) & metadata (JSON) under its     #
+#               content hash. Processes storing the same response at once each write a temporary copy; the first     #
+#               rename wins.                                                                                         #
+#                                                                                                                    #
+# VARIABLES:    kind -- String; 'arf' or 'rmf'                                                                       #
+#               filename -- String; response file                                                                    #
+#               entry -- String; cache entry directory                                                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def store_response(kind, filename, entry):
+
+    response = readers[kind](filename)
+
+    tmp = tempfile.mkdtemp(dir=cache['dir'], prefix='.tmp')
+    for name in RESPONSE_ARRAYS[kind]:
+        if getattr(response, name, None) is not None:
+            np.save(os.path.join(tmp,name+'.npy'), np.asarray(getattr(response, name)))
+
+    meta = {name: getattr(response, name, None) for name in RESPONSE_SCALARS[kind]}
+    meta['class'] = type(response).__name__
+    meta['header'] = dict(response.header)
+    with open(os.path.join(tmp,'meta.json'),'w') as f:
+        json.dump(meta, f, default=lambda value: value.item() if hasattr(value,'item') else str(value))
+
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp,name))
+        os.rmdir(tmp)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     map_response()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return (<arrays>, <metadata>) of a cache entry, arrays memory-mapped copy-on-write; mapped entries   #
+#               reused & evicted least recently used first when over the memory budget.                              #
+#                                                                                                                    #
+# VARIABLES:    kind -- String; 'arf' or 'rmf'                                                                       #
+#               digest -- String; content hash                                                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def map_response(kind, digest):
+
+    with lock:
+        if digest in mapped:
+            mapped.move_to_end(digest)
+            return(mapped[digest][:2])
+
+        entry = os.path.join(cache['dir'], digest)
+        arrays = {name: np.load(os.path.join(entry,name+'.npy'), mmap_mode='c') for name in RESPONSE_ARRAYS[kind]
+                  if os.path.exists(os.path.join(entry,name+'.npy'))}
+        with open(os.path.join(entry,'meta.json')) as f:
+            meta = json.load(f)
+        size = sum(array.nbytes for array in arrays.values())
+
+        # Evict least recently used entries (their arrays stay valid for responses still using them)
+        while mapped and cache['bytes'] + size > cache['budget']:
+            cache['bytes'] -= mapped.popitem(last=False)[1][2]
+        mapped[digest] = (arrays, meta, size)
+        cache['bytes'] += size
+
+        return(arrays, meta)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     read_response()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Replacement of sherpa.astro.io.read_arf/read_rmf; return a new DataARF/DataRMF built on the cached   #
+#               arrays (each dataset gets its own object, so filters set on it are not shared). Any failure of the   #
+#               cache falls back to Sherpa's reader: Sherpa ignores errors of these readers when loading a PHA, so   #
+#               a failing cache would otherwise leave the spectrum without its response.                             #
+#                                                                                                                    #
+# VARIABLES:    kind -- String; 'arf' or 'rmf'                                                                       #
+#               arg -- String (file name) or backend object; anything but a file name goes to Sherpa's reader        #
+#               args, kwargs -- Further arguments of Sherpa's reader                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def read_response(kind, arg, *args, **kwargs):
+
+    import sherpa.astro.data
+
+    if args or kwargs or not isinstance(arg, str) or not os.path.isfile(arg):
+        return(readers[kind](arg, *args, **kwargs))
+
+    try:
+        digest = content_hash(kind, arg)
+        entry = os.path.join(cache['dir'], digest)
+        if not os.path.isdir(entry):
+            store_response(kind, arg, entry)
+        arrays, meta = map_response(kind, digest)
+
+        values = dict(arrays)
+        values.update({name: meta[name] for name in RESPONSE_SCALARS[kind]})
+        values['header'] = dict(meta['header'])
+
+        return(getattr(sherpa.astro.data, meta['class'])(arg, **values))
+
+    except Exception as e:
+        print('\nread_response(): Response cache failed for %s (%s: %s); reading it directly' % (arg,type(e).__name__,e))
+        return(readers[kind](arg))
@@ -0,0 +1,199 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_service.py                                                     #
+#                                                                           #
+# PURPOSE: Spool directory of the ACAB fit service (acab.py --serve). Short #
+#          jobs submit batches of sources as JSON files (acab.py --submit); #
+#          a running service with warm worker processes claims them by     #
+#          renaming & writes each source's outcome, so jobs do not pay     #
+#          Sherpa/XSPEC startup again.                                      #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import json
+import time
+import socket
+
+# Spool subdirectories: batches waiting, claimed by a service (named <host>_<pid>_<batch>), finished & failed
+SPOOL_DIRS = ('incoming','active','done','failed')
+
+# Seconds between looks at the spool while waiting
+POLL_SECONDS = 1.0
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     open_spool()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Create the spool subdirectories if needed; return the spool directory.                               #
+#                                                                                                                    #
+# VARIABLES:    path -- String; spool directory, on a file system shared by submitters & service                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def open_spool(path):
+
+    for name in SPOOL_DIRS:
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    return(path)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     write_json()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Write a JSON file atomically (temporary file renamed into place), so readers never see it partial.   #
+#                                                                                                                    #
+# VARIABLES:    path -- String; file                                                                                 #
+#               value -- Any JSON-serializable value                                                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def write_json(path, value):
+
+    temp = os.path.join(os.path.dirname(path), '.%s.tmp' % os.path.basename(path))
+    with open(temp,'w') as f:
+        json.dump(value, f)
+    os.rename(temp, path)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     submit_batch()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Add a batch of sources to the spool; return the batch name.                                          #
+#                                                                                                                    #
+# VARIABLES:    spool -- String; spool directory                                                                     #
+#               sources -- List of (<position>, <source list>); e.g. from acab_catalog.read_catalog()                #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def submit_batch(spool, sources):
+
+    open_spool(spool)
+    name = '%d_%s_%d.json' % (time.time()*1E6, socket.gethostname(), os.getpid())
+    write_json(os.path.join(spool, 'incoming', name), [[n,list(source)] for n,source in sources])
+
+    return(name)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     claim_batch()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Claim the oldest waiting batch by renaming it into active/ (only one service succeeds); return       #
+#               (<batch name>, <list of (<position>, <source list>)>), or None if no batch is waiting.               #
+#                                                                                                                    #
+# VARIABLES:    spool -- String; spool directory                                                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def claim_batch(spool):
+
+    owner = '%s_%d_' % (socket.gethostname(), os.getpid())
+    for name in sorted(os.listdir(os.path.join(spool, 'incoming'))):
+        if name.startswith('.'):
+            continue
+        active = os.path.join(spool, 'active', owner + name)
+        try:
+            os.rename(os.path.join(spool, 'incoming', name), active)
+        except FileNotFoundError:
+            continue
+        with open(active) as f:
+            return(name, [(n,source) for n,source in json.load(f)])
+
+    return(None)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     finish_batch()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Write the outcome of each source of a claimed batch to done/<batch> (or failed/<batch> with the      #
+#               error of the service) & remove the claim.                                                            #
+#                                                                                                                    #
+# VARIABLES:    spool -- String; spool directory                                                                     #
+#               name -- String; batch name, from claim_batch()                                                       #
+#               outcomes -- List of dictionaries; 'obsid', 'srcid', 'status', 'model' & 'error' per source           #
+#               error -- String; error that stopped the batch, or None                                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def finish_batch(spool, name, outcomes, error=None):
+
+    write_json(os.path.join(spool, 'failed' if error else 'done', name), {'batch': name, 'error': error, 'sources': outcomes})
+    os.remove(os.path.join(spool, 'active', '%s_%d_%s' % (socket.gethostname(),os.getpid(),name)))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     requeue_orphans()                                                                                    #
+#                                                                                                                    #
+# DESCRIPTION:  Move batches claimed by services of this host that are no longer running back to incoming/; return   #
+#               their number.                                                                                        #
+#                                                                                                                    #
+# VARIABLES:    spool -- String; spool directory                                                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def requeue_orphans(spool):
+
+    host = socket.gethostname() + '_'
+    count = 0
+    for name in os.listdir(os.path.join(spool, 'active')):
+        if not name.startswith(host):
+            continue
+        pid, batch = name[len(host):].split('_', 1)
+        try:
+            os.kill(int(pid), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        os.rename(os.path.join(spool, 'active', name), os.path.join(spool, 'incoming', batch))
+        count += 1
+
+    return(count)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     wait_batch()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Wait until a submitted batch is finished; return its outcome {'batch', 'error', 'sources'}, or None  #
+#               if the timeout ran out first.                                                                        #
+#                                                                                                                    #
+# VARIABLES:    spool -- String; spool directory                                                                     #
+#               name -- String; batch name, from submit_batch()                                                      #
+#               timeout -- Float; seconds to wait (None: no limit)                                                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def wait_batch(spool, name, timeout=None):
+
+    start = time.time()
+    while timeout is None or time.time()-start < timeout:
+        for folder in ('done','failed'):
+            path = os.path.join(spool, folder, name)
+            if os.path.exists(path):
+                with open(path) as f:
+                    return(json.load(f))
+        time.sleep(POLL_SECONDS)
+
+    return(None)
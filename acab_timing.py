@@ -0,0 +1,135 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_timing.py                                                      #
+#                                                                           #
+# PURPOSE: Per-stage timers & fit counters for ACAB sources, and a per-run  #
+#          summary table of stage times (percentiles over sources).         #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import time
+import numpy as np
+from contextlib import contextmanager
+
+# Seconds spent per stage, and numbers of fits, optimizer function evaluations & fits escalated to a more robust
+# optimizer (see acab_funcs.run_fit()) for the source being processed
+timings = {}
+counts = {'fits': 0, 'nfev': 0, 'escalations': 0}
+
+# Memory of the process per source in megabytes (peak & retained after the source), added by acab_funcs.process_source()
+MEMORY = ('peak_rss_mb','rss_mb')
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     timer()                                                                                              #
+#                                                                                                                    #
+# DESCRIPTION:  Context manager adding the time spent in its block to a stage of the current source.                 #
+#                                                                                                                    #
+# VARIABLES:    stage -- String; e.g. 'load_pha', 'notice/group', 'fit', 'plotting', 'covariance', 'flux'            #
+#--------------------------------------------------------------------------------------------------------------------#
+
+@contextmanager
+def timer(stage):
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage,0.0) + time.perf_counter() - start
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     count_fit()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Count one fit (one optimizer run) for the current source.                                            #
+#                                                                                                                    #
+# VARIABLES:    nfev -- Integer; function evaluations of the optimizer                                               #
+#               escalated -- Boolean; the fit escalated to a more robust optimizer                                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def count_fit(nfev=0, escalated=False):
+
+    counts['fits'] += 1
+    counts['nfev'] += nfev
+    counts['escalations'] += int(escalated)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     pop_timings()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return stage times & fit counts of the current source as a dictionary, and reset them.               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def pop_timings():
+
+    result = dict(timings)
+    result.update(counts)
+
+    timings.clear()
+    for count in counts:
+        counts[count] = 0
+
+    return(result)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     add_timings()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Add stage times & fit count measured in another process (e.g. by a candidate fit worker) to the      #
+#               current source.                                                                                      #
+#                                                                                                                    #
+# VARIABLES:    other -- Dictionary; from pop_timings() in the other process                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def add_timings(other):
+
+    for stage,seconds in other.items():
+        if stage in counts:
+            counts[stage] += seconds
+        else:
+            timings[stage] = timings.get(stage,0.0) + seconds
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     timing_summary()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Return a table of stage times (median, 90th & 99th percentiles, maximum, total) over sources, and    #
+#               of fits, function evaluations, escalations & memory (MB) per source.                                 #
+#                                                                                                                    #
+# VARIABLES:    source_timings -- List of dictionaries; timings of each source, from pop_timings()                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def timing_summary(source_timings):
+
+    # Stages in order of total time; fit counts & memory are listed last
+    stages = sorted(set(stage for t in source_timings for stage in t if stage not in counts and stage not in MEMORY),
+                    key=lambda stage: -sum(t.get(stage,0.0) for t in source_timings))
+
+    lines = ['%-16s %8s %10s %10s %10s %10s %12s' % ('STAGE','SOURCES','P50','P90','P99','MAX','TOTAL')]
+    for stage in stages + list(counts) + list(MEMORY):
+        vals = np.array([t[stage] for t in source_timings if stage in t], dtype=float)
+        if len(vals) == 0:
+            continue
+        p50, p90, p99 = np.percentile(vals, [50,90,99])
+        lines.append('%-16s %8d %10.2f %10.2f %10.2f %10.2f %12.2f' % (stage,len(vals),p50,p90,p99,vals.max(),vals.sum()))
+
+    return('\n'.join(lines))
@@ -0,0 +1,157 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_triage.py                                                      #
+#                                                                           #
+# PURPOSE: Count-based triage of ACAB sources before any Sherpa fit. Net    #
+#          counts (total & per band) are read from the grouped PHA, its     #
+#          background & the RMF energy bounds with astropy/NumPy, and each  #
+#          source is sorted into a tier that sets its candidate models,     #
+#          fit statistic & binning.                                         #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import numpy as np
+
+# Energy bands (keV) for counts per band
+BANDS = {'soft': (0.3,1.2), 'medium': (1.2,2.0), 'hard': (2.0,10.0)}
+
+# Tiers, faintest first: (<name>, <minimum net counts in bounds>, <fit statistic>, <counts per bin>); the tier also
+# selects the candidate models, see acab_funcs.candidate_models(). Faint spectra are fitted with W-statistic (no
+# background subtraction) at >= 1 count per bin, as chi-squared is biased at few counts per bin. Sources whose counts
+# cannot be read get the last (full tournament) tier.
+TIERS = (('faint', 0, 'wstat', 1),
+         ('medium', 100, 'chi2datavar', ''),
+         ('bright', 1000, 'chi2datavar', ''))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     read_counts()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Return counts per channel, exposure & BACKSCAL of a PHA file, and its SPECTRUM header.               #
+#                                                                                                                    #
+# VARIABLES:    path -- String; PHA file                                                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def read_counts(path):
+
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        hdu = hdul['SPECTRUM'] if 'SPECTRUM' in hdul else hdul[1]
+        header, data = hdu.header, hdu.data
+        names = [name.upper() for name in data.columns.names]
+
+        exposure = float(header.get('EXPOSURE', 1.0))
+        if 'COUNTS' in names:
+            counts = np.asarray(data['COUNTS'], dtype=float)
+        else:
+            counts = np.asarray(data['RATE'], dtype=float)*exposure
+        channel = np.asarray(data['CHANNEL'])
+        backscal = np.asarray(data['BACKSCAL'], dtype=float) if 'BACKSCAL' in names else float(header.get('BACKSCAL', 1.0))
+
+        return(channel, counts, exposure, backscal, header.copy())
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     channel_energies()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return mid-energies (keV) of channels from the EBOUNDS extension of an RMF (the matrix is not read). #
+#                                                                                                                    #
+# VARIABLES:    path -- String; RMF file                                                                             #
+#               channel -- Array; channels of the spectrum                                                           #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def channel_energies(path, channel):
+
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        ebounds = hdul['EBOUNDS'].data
+        lookup = dict(zip(np.asarray(ebounds['CHANNEL']), (np.asarray(ebounds['E_MIN'])+np.asarray(ebounds['E_MAX']))/2))
+
+    return(np.array([lookup.get(chan, np.nan) for chan in channel], dtype=float))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     net_counts()                                                                                         #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary of background-subtracted counts within bounds ('net') & per band, and of source &  #
+#               scaled background counts within bounds ('src', 'bkg'). Raises ValueError if the PHA header names no  #
+#               response file.                                                                                       #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def net_counts(source, bounds=[0.3,10]):
+
+    from acab_prefetch import spectrum_path
+
+    # Source spectrum; response & background files are relative to it, as in Sherpa
+    path = spectrum_path(source)
+    channel, counts, exposure, backscal, header = read_counts(path)
+    folder = os.path.dirname(path)
+    respfile = str(header.get('RESPFILE', 'none'))
+    if respfile.lower() == 'none':
+        raise ValueError('no RESPFILE in header of %s' % path)
+    energy = channel_energies(os.path.join(folder, respfile), channel)
+
+    # Background scaled to the source exposure & extraction area
+    background = np.zeros_like(counts)
+    backfile = str(header.get('BACKFILE', 'none'))
+    if backfile.lower() != 'none':
+        bchannel, bcounts, bexposure, bbackscal, _ = read_counts(os.path.join(folder, backfile))
+        background = bcounts*(exposure*np.asarray(backscal))/(bexposure*np.asarray(bbackscal))
+
+    def total(lo, hi, values):
+        return(float(np.sum(values[(energy >= lo) & (energy < hi)])))
+
+    result = {'src': total(bounds[0], bounds[1], counts), 'bkg': total(bounds[0], bounds[1], background)}
+    result['net'] = result['src'] - result['bkg']
+    for band,(lo,hi) in BANDS.items():
+        result[band] = total(lo, hi, counts-background)
+
+    return(result)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     triage_source()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return dictionary with tier name, fit statistic & counts per bin for a source, and its counts from   #
+#               net_counts(); the last (full tournament) tier with counts None if the counts cannot be read, so the  #
+#               source is still fitted.                                                                              #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def triage_source(source, bounds=[0.3,10]):
+
+    try:
+        counts = net_counts(source, bounds)
+    except Exception as e:
+        print('\ntriage_source(): Cannot read counts of %s_%s (%s: %s); full tournament' % (source[0],source[1],type(e).__name__,e))
+        return({'tier': TIERS[-1][0], 'stat': TIERS[-1][2], 'binning': TIERS[-1][3], 'counts': None})
+
+    tier = TIERS[0]
+    for candidate in TIERS:
+        if counts['net'] >= candidate[1]:
+            tier = candidate
+
+    return({'tier': tier[0], 'stat': tier[2], 'binning': tier[3], 'counts': counts})
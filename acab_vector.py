@@ -0,0 +1,610 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_vector.py                                                      #
+#                                                                           #
+# PURPOSE: Vectorized NumPy batch fitting of absorbed power-law/disk models #
+#          for many sources at once: the batch engine of choose_model()     #
+#          (acab.py --engine batch) & first-pass screening of large         #
+#          catalogs. Sherpa remains the fallback & the validator.           #
+#                                                                           #
+# USAGE: python acab_vector.py [--catalog srcs_2000_rk.csv] [--model ...]   #
+#                              [--batch 64] [--validate 0.05]               #
+#                              [--output screen.csv]                        #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import re
+import csv
+import hashlib
+import argparse
+import itertools
+import numpy as np
+from acab_catalog import read_catalog
+
+# Absorption base model supported by the batch engine; the Galactic abs1 is frozen at the catalog nH
+BATCH_BASE = '(xstbabs.abs1+xstbabs.abs2)'
+
+# Emission components supported by the batch engine: (<nonlinear parameter>, <normalization>)
+BATCH_COMPONENTS = {'powlaw1d': ('gamma','ampl'),
+                    'xsdiskbb': ('Tin','norm')}
+
+# Allowed ranges of nonlinear parameters, and starting grids searched before optimizing. The grids are fine enough to
+# start in the basin of the global minimum: nH & the spectral shape are strongly correlated, and with the summed
+# absorption of the base model a column far from the truth can be a local minimum
+PAR_LIMITS = {'nH': (0.0, 100.0), 'gamma': (-10.0, 10.0), 'Tin': (0.01, 20.0)}
+PAR_GRIDS = {'nH': [0.01, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.5, 7.0, 10.0, 20.0],
+             'gamma': [0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.25, 2.5, 2.75, 3.0, 3.5, 4.0],
+             'Tin': [0.1, 0.15, 0.2, 0.3, 0.45, 0.7, 1.0, 1.5, 2.0, 3.0, 5.0]}
+
+# Starting points optimized per source: the best grid points of this many different nH values
+BATCH_STARTS = 3
+
+# Photon flux constant of XSPEC's bbodyrad/diskbb (photons/cm^2/s/keV for K = 1, E & kT in keV)
+BB_CONST = 1.0344E-3
+
+# Cross-section (per 1e22 cm^-2) curves per energy grid, and the tabulated disk-blackbody integral
+sigma_cache = {}
+disk_table = {}
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     batch_components()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return list of (<type>, <name>) emission components of a model if the batch engine supports it,      #
+#               else None.                                                                                           #
+#                                                                                                                    #
+# VARIABLES:    model -- String; '(<absorption models>)*(<emission models>)'                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def batch_components(model):
+
+    # Absorption must be the standard base model
+    if not model.startswith(BATCH_BASE + '*(') or not model.endswith(')'):
+        return(None)
+
+    # Emission must be a sum of supported components
+    components = []
+    for term in model[len(BATCH_BASE)+2:-1].split('+'):
+        match = re.fullmatch(r'(\w+)\.(\w+)', term.strip())
+        if match is None or match.group(1) not in BATCH_COMPONENTS:
+            return(None)
+        components.append((match.group(1),match.group(2)))
+
+    return(components)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     batch_parnames()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Return Sherpa names of the free parameters of a supported model, in batch_fit() order:               #
+#               'abs2.nH', nonlinear parameters, then normalizations.                                                #
+#                                                                                                                    #
+# VARIABLES:    model -- String; '<model>' supported by the batch engine                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def batch_parnames(model):
+
+    components = batch_components(model)
+
+    return(['abs2.nH'] + ['%s.%s' % (name,BATCH_COMPONENTS[typ][0]) for typ,name in components]
+                       + ['%s.%s' % (name,BATCH_COMPONENTS[typ][1]) for typ,name in components])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     absorption_sigma()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return xstbabs optical depth per 1e22 cm^-2 on an energy grid (cached per grid), so transmission of  #
+#               any column is exp(-nH*sigma).                                                                        #
+#                                                                                                                    #
+# VARIABLES:    elo, ehi -- Arrays; energy bin edges in keV                                                          #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def absorption_sigma(elo, ehi):
+
+    key = hashlib.sha1(np.ascontiguousarray(elo).tobytes() + np.ascontiguousarray(ehi).tobytes()).hexdigest()
+
+    if key not in sigma_cache:
+        from sherpa.astro import xspec
+        from acab_absorb import init_xspec
+
+        # Same abundance & cross-section tables as the Sherpa fits
+        init_xspec()
+
+        tbabs = xspec.XStbabs('batchsigma')
+        tbabs.nH = 1.0
+        sigma_cache[key] = -np.log(np.clip(tbabs(elo, ehi), 1E-300, None))
+
+    return(sigma_cache[key])
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     disk_integral()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Return I(y) = integral over x = r/r_in from 1 to infinity of 2x/(exp(y*x^(3/4))-1), y = E/T_in,      #
+#               interpolated from a table; diskbb(E) = norm * BB_CONST * E^2 * I(E/T_in).                            #
+#                                                                                                                    #
+# VARIABLES:    y -- Array; E/T_in                                                                                   #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def disk_integral(y):
+
+    # Tabulate once; integrate in log(x) up to where the exponential has cut off
+    if not disk_table:
+        ty = np.logspace(-4, np.log10(80.0), 400)
+        ti = np.empty_like(ty)
+        for n,yy in enumerate(ty):
+            t = np.linspace(0.0, np.log(max((60.0/yy)**(4.0/3.0),2.0)), 4000)
+            f = 2*np.exp(2*t)/np.expm1(yy*np.exp(0.75*t))
+            ti[n] = np.sum((f[1:]+f[:-1])/2*np.diff(t))
+        disk_table['logy'], disk_table['logi'] = np.log(ty), np.log(ti)
+
+    # Interpolate in log-log space; I(y) ~ y^(-8/3) below the table, 0 above it
+    logy = np.log(np.clip(y, 1E-300, None))
+    out = np.exp(np.interp(logy, disk_table['logy'], disk_table['logi']))
+    low = logy < disk_table['logy'][0]
+    out[low] = np.exp(disk_table['logi'][0] - 8.0/3.0*(logy[low]-disk_table['logy'][0]))
+    out[logy > disk_table['logy'][-1]] = 0.0
+
+    return(out)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     component_flux()                                                                                     #
+#                                                                                                                    #
+# DESCRIPTION:  Return photon flux per energy bin (photons/cm^2/s) of an emission component with unit normalization. #
+#                                                                                                                    #
+# VARIABLES:    typ -- String; component type, a key of BATCH_COMPONENTS                                             #
+#               elo, ehi -- Arrays (sources x energies); energy bin edges in keV                                     #
+#               par -- Array (sources x 1); nonlinear parameter (gamma or T_in)                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def component_flux(typ, elo, ehi, par):
+
+    # powlaw1d (ref = 1): integral of E^-gamma over the bin
+    if typ == 'powlaw1d':
+        g = 1.0 - par
+        near1 = np.abs(g) < 1E-6
+        g = np.where(near1, 1.0, g)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            flux = np.where(near1, np.log(ehi/elo), (ehi**g - elo**g)/g)
+        return(np.nan_to_num(flux))
+
+    # xsdiskbb: multicolour disk, integrated over the bin with Simpson's rule (bin centers alone miss the curvature of
+    # the Wien tail on coarse grids)
+    elif typ == 'xsdiskbb':
+        def shape(energy):
+            energy = np.clip(energy, 1E-6, None)
+            return(BB_CONST*energy**2*disk_integral(energy/par))
+        return((shape(elo) + 4*shape((elo+ehi)/2) + shape(ehi))/6*(ehi-elo))
+
+    raise ValueError('component_flux(): unsupported component type %r' % typ)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     load_batch_source()                                                                                  #
+#                                                                                                                    #
+# DESCRIPTION:  Read a source's grouped spectrum, filter/group/subtract it as prepare_data() does, and return the    #
+#               arrays needed by batch_fit() (data, errors, response folded into fit bins, energy grid, frozen nH).  #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def load_batch_source(source, binning='', bounds=''):
+
+    from sherpa.astro.io import read_pha
+    from sherpa.astro.instrument import rmf_to_matrix
+    from sherpa.stats import Chi2DataVar
+
+    # Unpack source array to define OBSID, source ID, column density
+    obsid,srcid,srcnh = source[0],source[1],source[4]
+
+    # If bounds are not provided with function call, use default bounds
+    if bounds == '':
+        bounds = [0.3,10]
+
+    # Load, filter, group & background-subtract spectrum
+    pha = read_pha('%s/extracted_spectra_%s_%s_grp.pi' % (obsid,obsid,srcid))
+    pha.set_analysis('energy')
+    pha.notice(bounds[0],bounds[1])
+    if binning != '':
+        pha.group_counts(binning)
+    pha.subtract()
+
+    # Data & errors per fit bin, as for set_stat('chi2datavar')
+    y, err, _ = pha.to_fit(staterrfunc=Chi2DataVar.calc_staterror)
+
+    # Response per energy bin & fit bin: exposure * ARF * RMF, channels summed into fit bins
+    arf, rmf = pha.get_arf(), pha.get_rmf()
+    matrix = rmf_to_matrix(rmf).matrix.astype(float)
+    chans = np.array([pha.apply_filter(unit, groupfunc=np.sum) for unit in np.eye(matrix.shape[1])])
+    area = np.ones(matrix.shape[0]) if arf is None else np.asarray(arf.specresp, dtype=float)
+    resp = (pha.exposure*area)[:,None]*matrix.dot(chans)
+
+    return({'source': source, 'y': np.asarray(y, dtype=float), 'err': np.asarray(err, dtype=float), 'resp': resp,
+            'elo': np.asarray(rmf.energ_lo, dtype=float), 'ehi': np.asarray(rmf.energ_hi, dtype=float),
+            'sigma': absorption_sigma(rmf.energ_lo, rmf.energ_hi), 'nh1': float(srcnh)/1.0E22})
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     stack_sources()                                                                                      #
+#                                                                                                                    #
+# DESCRIPTION:  Stack loaded sources into zero-padded arrays (sources x energies, sources x energies x fit bins).    #
+#                                                                                                                    #
+# VARIABLES:    loaded -- List of dictionaries; from load_batch_source()                                             #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def stack_sources(loaded):
+
+    nsrc = len(loaded)
+    nen = max(len(d['elo']) for d in loaded)
+    nbin = max(len(d['y']) for d in loaded)
+
+    # Padded energy bins have zero width (zero flux), padded fit bins have zero weight
+    stack = {'elo': np.ones((nsrc,nen)), 'ehi': np.ones((nsrc,nen)), 'sigma': np.zeros((nsrc,nen)),
+             'resp': np.zeros((nsrc,nen,nbin)), 'y': np.zeros((nsrc,nbin)), 'w': np.zeros((nsrc,nbin)),
+             'nh1': np.array([d['nh1'] for d in loaded])[:,None], 'nbins': np.array([len(d['y']) for d in loaded])}
+    for n,d in enumerate(loaded):
+        ne, nb = len(d['elo']), len(d['y'])
+        stack['elo'][n,:ne], stack['ehi'][n,:ne], stack['sigma'][n,:ne] = d['elo'], d['ehi'], d['sigma']
+        stack['resp'][n,:ne,:nb], stack['y'][n,:nb] = d['resp'], d['y']
+        good = d['err'] > 0
+        stack['w'][n,:nb][good] = 1.0/d['err'][good]**2
+
+    return(stack)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     component_counts()                                                                                   #
+#                                                                                                                    #
+# DESCRIPTION:  Return model counts per fit bin (sources x fit bins) of an absorbed emission component with unit     #
+#               normalization.                                                                                       #
+#                                                                                                                    #
+# VARIABLES:    stack -- Dictionary; from stack_sources()                                                            #
+#               typ -- String; emission component type                                                               #
+#               nh -- Array (sources x 1); abs2 nH                                                                   #
+#               par -- Array (sources x 1); nonlinear parameter of the component                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def component_counts(stack, typ, nh, par):
+
+    # Transmission of (abs1 + abs2), as in the base model
+    trans = np.exp(-stack['nh1']*stack['sigma']) + np.exp(-nh*stack['sigma'])
+
+    return(np.einsum('se,seb->sb', trans*component_flux(typ, stack['elo'], stack['ehi'], par), stack['resp']))
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     project()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  For given nonlinear parameters, solve for the best non-negative normalizations by weighted linear    #
+#               least squares; return chi-squared, normalizations & model counts for all sources.                    #
+#                                                                                                                    #
+# VARIABLES:    stack -- Dictionary; from stack_sources()                                                            #
+#               types -- List of strings; emission component types                                                   #
+#               theta -- Array (sources x parameters); abs2 nH then each component's nonlinear parameter             #
+#               basis -- Array (sources x components x fit bins); component counts, if already computed (theta is    #
+#                        then not used)                                                                              #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def project(stack, types, theta, basis=None):
+
+    # Model counts per fit bin of each component with unit normalization (sources x components x fit bins)
+    if basis is None:
+        basis = np.stack([component_counts(stack, typ, theta[:,:1], theta[:,k+1:k+2]) for k,typ in enumerate(types)],
+                         axis=1)
+
+    # Weighted normal equations; components without counts in the fit bins (e.g. a disk at the lowest Tin) are left
+    # out, and components are forced to zero where the unconstrained solution is negative
+    w, y = stack['w'][:,None,:], stack['y'][:,None,:]
+    active = np.einsum('skb,skb->sk', basis*w, basis) > 0
+    for _ in range(len(types)):
+        b = basis*active[:,:,None]
+        a = np.einsum('skb,slb->skl', b*w, b) + np.eye(len(types))*(~active)[:,:,None]
+        rhs = np.einsum('skb,skb->sk', b*w, np.broadcast_to(y, b.shape))
+        norms = np.linalg.solve(a, rhs[:,:,None])[:,:,0]
+        if not (norms < 0).any():
+            break
+        active &= norms >= 0
+    norms = np.clip(norms, 0.0, None)*active
+
+    # Model counts & chi-squared
+    counts = np.einsum('sk,skb->sb', norms, basis)
+    chisq = np.sum(stack['w']*(stack['y']-counts)**2, axis=1)
+
+    return(chisq, norms, counts)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     batch_fit()                                                                                          #
+#                                                                                                                    #
+# DESCRIPTION:  Fit one supported model to many sources at once (grid search, then batched Levenberg-Marquardt on    #
+#               the nonlinear parameters with normalizations solved linearly); return one dictionary per source      #
+#               with the same keys as acab_funcs.cached_fit() plus 'succeeded'.                                      #
+#                                                                                                                    #
+# VARIABLES:    loaded -- List of dictionaries; from load_batch_source()                                             #
+#               model -- String; '<model>' supported by the batch engine                                             #
+#               maxiter -- Integer; maximum number of Levenberg-Marquardt iterations                                 #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def batch_fit(loaded, model, maxiter=50):
+
+    components = batch_components(model)
+    if components is None:
+        raise ValueError('batch_fit(): model %s is not supported by the batch engine' % model)
+
+    types = [typ for typ,name in components]
+    names = ['nH'] + [BATCH_COMPONENTS[typ][0] for typ in types]
+    lo = np.array([PAR_LIMITS[name][0] for name in names])
+    hi = np.array([PAR_LIMITS[name][1] for name in names])
+    stack = stack_sources(loaded)
+    nsrc = len(loaded)
+
+    #------------------------#
+    #       GRID SEARCH      #
+    #------------------------#
+
+    # Best grid point per source & nH value; component counts depend on nH & the component's own parameter only, so
+    # they are computed once per pair & combined for every grid point
+    nhs = PAR_GRIDS['nH']
+    points, best = np.zeros((len(nhs),nsrc,len(names))), np.full((len(nhs),nsrc), np.inf)
+    for i,nh in enumerate(nhs):
+        column = np.full((nsrc,1), nh)
+        counts = [{value: component_counts(stack, typ, column, np.full((nsrc,1), value)) for value in PAR_GRIDS[name]}
+                  for typ,name in zip(types,names[1:])]
+        for values in itertools.product(*[PAR_GRIDS[name] for name in names[1:]]):
+            basis = np.stack([counts[k][value] for k,value in enumerate(values)], axis=1)
+            chisq = project(stack, types, None, basis)[0]
+            better = chisq < best[i]
+            points[i][better], best[i][better] = (nh,) + values, chisq[better]
+
+    # Starting points: the best grid points of BATCH_STARTS different nH values per source, since nH & the spectral
+    # shape are correlated along narrow valleys that a grid of the shape alone can miss
+    order = np.argsort(best, axis=0)[:BATCH_STARTS]
+
+    #------------------------#
+    #   LEVENBERG-MARQUARDT  #
+    #------------------------#
+
+    # Residuals (weighted) as a function of the nonlinear parameters
+    def residuals(theta):
+        chisq, norms, counts = project(stack, types, theta)
+        return(np.sqrt(stack['w'])*(stack['y']-counts), chisq)
+
+    # Optimize all sources from starting points theta; return the optimized parameters & chi-squared
+    def optimize(theta):
+
+        lam = np.full(nsrc, 1E-2)
+        res, chisq = residuals(theta)
+        converged = np.zeros(nsrc, dtype=bool)
+        for _ in range(maxiter):
+
+            # Forward-difference Jacobian (sources x fit bins x parameters)
+            step = 1E-4*np.maximum(np.abs(theta), 1E-2)
+            jac = np.stack([(residuals(theta + step*(np.arange(len(names)) == k))[0] - res)/step[:,k:k+1]
+                            for k in range(len(names))], axis=2)
+
+            # Damped Gauss-Newton step, kept within parameter limits
+            jtj = np.einsum('sbk,sbl->skl', jac, jac)
+            jtr = np.einsum('sbk,sb->sk', jac, res)
+            eye = np.eye(len(names))
+            damp = lam[:,None,None]*(eye*np.diagonal(jtj, axis1=1, axis2=2)[:,:,None] + 1E-12*eye)
+            delta = -np.linalg.solve(jtj + damp, jtr[:,:,None])[:,:,0]
+            trial = np.clip(theta + delta*(~converged)[:,None], lo, hi)
+
+            # Accept improvements per source, adapt damping; converged once an accepted step is small both in
+            # statistic & in parameters (a small gain alone also happens on the flat nH valleys of the base model), or
+            # no step helps
+            tres, tchisq = residuals(trial)
+            better = tchisq < chisq
+            small = np.all(np.abs(trial-theta) <= 1E-4*np.maximum(np.abs(theta), 1E-2), axis=1)
+            converged |= better & small & (chisq - tchisq < 1E-6*np.maximum(chisq,1.0))
+            converged |= ~better & (lam > 1E8)
+            theta[better], res[better], chisq[better] = trial[better], tres[better], tchisq[better]
+            lam = np.where(better, lam/10.0, lam*10.0)
+            if converged.all():
+                break
+
+        return(theta, chisq)
+
+    # Best optimum of all starting points per source
+    theta, chisq = np.zeros((nsrc,len(names))), np.full(nsrc, np.inf)
+    for start in order:
+        trial, tchisq = optimize(points[start,np.arange(nsrc)])
+        better = tchisq < chisq
+        theta[better], chisq[better] = trial[better], tchisq[better]
+
+    #------------------------#
+    #         RESULTS        #
+    #------------------------#
+
+    chisq, norms, counts = project(stack, types, theta)
+    parnames = batch_parnames(model)
+    npars = len(parnames)
+    results = []
+    for n in range(nsrc):
+        numpoints = int(stack['nbins'][n])
+        dof = numpoints - npars
+        results.append({'rstat': chisq[n]/dof if dof > 0 else np.nan,
+                        'dof': dof,
+                        'statval': float(chisq[n]),
+                        'numpoints': numpoints,
+                        'parnames': tuple(parnames),
+                        'parvals': tuple(float(val) for val in np.concatenate([theta[n],norms[n]])),
+                        'succeeded': bool(np.isfinite(chisq[n]) and dof > 0)})
+
+    return(results)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     validate()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Refit a source with Sherpa (acab_funcs.fitting_fast(), warm-started from the batch fit) and return   #
+#               (<agrees>, <Sherpa fit>); the batch fit agrees if its statistic is within rtol of Sherpa's.          #
+#                                                                                                                    #
+# VARIABLES:    source -- List of five strings; [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]                #
+#               model -- String; '<model>'                                                                           #
+#               fit -- Dictionary; batch fit result of the source                                                    #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#               rtol -- Float; allowed relative difference of the fit statistic                                      #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def validate(source, model, fit, binning='', bounds='', rtol=0.05):
+
+    from acab_funcs import fit_cache, fit_key, fitting_fast, fit_summary
+
+    # Sherpa fit (once) starting from the batch best-fit values
+    key = fit_key(source, model, binning, bounds)
+    if key not in fit_cache:
+        fitting_fast(source, model, binning, bounds, seed=dict(zip(fit['parnames'], fit['parvals'])))
+        fit_cache[key] = fit_summary()
+    sherpa_fit = fit_cache[key]
+
+    agrees = fit['succeeded'] and abs(fit['statval']-sherpa_fit['statval']) <= rtol*max(sherpa_fit['statval'],1.0)
+
+    return(agrees, sherpa_fit)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     screen()                                                                                             #
+#                                                                                                                    #
+# DESCRIPTION:  Batch-fit a model to sources in chunks; sources that cannot be loaded or batch-fitted (also whole    #
+#               chunks the batch engine fails on), and a random fraction of the rest, are fitted with Sherpa         #
+#               instead/as well. Yields (source, fit, method) per source, method being 'batch', 'sherpa' (fallback)  #
+#               or 'validated'/'rejected' (batch fit checked by Sherpa).                                             #
+#                                                                                                                    #
+# VARIABLES:    sources -- List of source lists                                                                      #
+#               model -- String; '<model>' supported by the batch engine                                             #
+#               batch -- Integer; sources per batch                                                                  #
+#               fraction -- Float; fraction of batch fits to validate with Sherpa                                    #
+#               binning -- Integer; counts per bin                                                                   #
+#               bounds -- List of two floats; [<lower bound>, <upper bound>]                                         #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def screen(sources, model, batch=64, fraction=0.05, binning='', bounds='', seed=1):
+
+    from acab_funcs import cached_fit, clear_fit_cache
+
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, len(sources), batch):
+
+        # Load chunk; sources that fail to load go straight to Sherpa
+        loaded, fallback = [], []
+        for source in sources[start:start+batch]:
+            try:
+                loaded.append(load_batch_source(source, binning, bounds))
+            except Exception:
+                fallback.append(source)
+
+        # Batch fit; a chunk the batch engine cannot solve goes to Sherpa as a whole
+        try:
+            fits = batch_fit(loaded, model) if loaded else []
+        except (np.linalg.LinAlgError, FloatingPointError, ValueError) as e:
+            print('\nscreen(): Batch fit of %d sources failed (%s); fitting them with Sherpa' % (len(loaded),e))
+            fallback += [data['source'] for data in loaded]
+            loaded, fits = [], []
+        for data,fit in zip(loaded,fits):
+            source = data['source']
+            clear_fit_cache()
+            if not fit['succeeded']:
+                fallback.append(source)
+            elif rng.random() < fraction:
+                agrees, sherpa_fit = validate(source, model, fit, binning, bounds)
+                yield(source, fit if agrees else sherpa_fit, 'validated' if agrees else 'rejected')
+            else:
+                yield(source, fit, 'batch')
+
+        # Sherpa fallback
+        for source in fallback:
+            clear_fit_cache()
+            try:
+                yield(source, cached_fit(source, model, binning, bounds), 'sherpa')
+            except Exception:
+                print('\n\n\nERROR in SOURCE %s_%s' % (source[0],source[1]))
+
+
+
+
+
+
+def main():
+
+    # Command line options
+    parser = argparse.ArgumentParser(description='Screen a source catalog with the vectorized batch fitting engine.')
+    parser.add_argument('--catalog', default='srcs_2000_rk.csv', help='source list (default: srcs_2000_rk.csv)')
+    parser.add_argument('--model', default=BATCH_BASE + '*(powlaw1d.powlaw+xsdiskbb.didkbb)',
+                        help='model to fit; emission components from %s' % ', '.join(sorted(BATCH_COMPONENTS)))
+    parser.add_argument('--batch', type=int, default=64, help='sources per batch (default: 64)')
+    parser.add_argument('--validate', type=float, default=0.05,
+                        help='fraction of batch fits checked against Sherpa (default: 0.05)')
+    parser.add_argument('--output', default='screen.csv', help='CSV file of fit results (default: screen.csv)')
+    args = parser.parse_args()
+
+    if batch_components(args.model) is None:
+        parser.error('model %s is not supported by the batch engine' % args.model)
+
+    # Input sources from catalog
+    sources = [source for n,source in read_catalog(args.catalog)]
+
+    # Write one row per source: fit statistics & best-fit values
+    parnames = batch_parnames(args.model)
+    with open(args.output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['obsid','srcid','method','statval','dof','rstat'] + parnames)
+        for source,fit,method in screen(sources, args.model, args.batch, args.validate):
+            values = dict(zip(fit['parnames'], fit['parvals']))
+            writer.writerow([source[0],source[1],method,fit['statval'],fit['dof'],fit['rstat']] + [values.get(name) for name in parnames])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: acab_watchdog.py                                                    #
+#                                                                           #
+# PURPOSE: Wall-clock budgets for ACAB fits, model tournaments & sources.   #
+#          A SIGALRM watchdog aborts a block whose budget ran out by        #
+#          raising Timeout; aborted stages are noted for the source's       #
+#          result.                                                          #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+# Budgets in seconds per stage (None: no limit)
+STAGES = ('fit','tournament','source')
+budgets = dict.fromkeys(STAGES)
+
+# Active deadlines [<monotonic time>, <stage>, <seconds>], outermost first, & notes on aborted stages of the source
+deadlines = []
+notes = []
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# CLASS:        Timeout                                                                                              #
+#                                                                                                                    #
+# DESCRIPTION:  Raised when the budget of a stage runs out. Derives from BaseException so that 'except Exception'    #
+#               blocks (in Sherpa's optimizers or log_info()) do not swallow it.                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+class Timeout(BaseException):
+
+    def __init__(self, stage, seconds):
+
+        BaseException.__init__(self, '%s budget of %g s exceeded' % (stage,seconds))
+        self.stage = stage
+        self.seconds = seconds
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     set_budgets()                                                                                        #
+#                                                                                                                    #
+# DESCRIPTION:  Set wall-clock budgets; None or 0 means no limit.                                                    #
+#                                                                                                                    #
+# VARIABLES:    fit -- Float; seconds per fit() call                                                                 #
+#               tournament -- Float; seconds per choose_model() tournament                                           #
+#               source -- Float; seconds per source                                                                  #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def set_budgets(fit=None, tournament=None, source=None):
+
+    budgets.update(fit=fit or None, tournament=tournament or None, source=source or None)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     arm()                                                                                                #
+#                                                                                                                    #
+# DESCRIPTION:  Set the interval timer to the earliest deadline not yet expired, or disarm it.                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def arm():
+
+    pending = [d[0] for d in deadlines if d[0] != float('inf')]
+    if pending:
+        signal.signal(signal.SIGALRM, expired)
+        signal.setitimer(signal.ITIMER_REAL, max(min(pending) - time.monotonic(), 1E-3))
+    else:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     expired()                                                                                            #
+#                                                                                                                    #
+# DESCRIPTION:  SIGALRM handler; raise Timeout for the outermost stage whose deadline passed (so that it propagates  #
+#               through the handlers of inner stages).                                                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def expired(signum, frame):
+
+    now = time.monotonic()
+    for d in deadlines:
+        if d[0] <= now:
+            d[0] = float('inf')
+            arm()
+            raise Timeout(d[1], d[2])
+
+    arm()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     watchdog()                                                                                           #
+#                                                                                                                    #
+# DESCRIPTION:  Context manager raising Timeout in its block once the stage's budget has run out. No-op without a    #
+#               budget or outside the main thread (signals are delivered to the main thread only).                   #
+#                                                                                                                    #
+# VARIABLES:    stage -- String; 'fit', 'tournament' or 'source'                                                     #
+#--------------------------------------------------------------------------------------------------------------------#
+
+@contextmanager
+def watchdog(stage):
+
+    seconds = budgets[stage]
+    if not seconds or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    entry = [time.monotonic()+seconds, stage, seconds]
+    deadlines.append(entry)
+    arm()
+    try:
+        yield
+    finally:
+        deadlines.remove(entry)
+        arm()
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     note_timeout()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Note an aborted stage (e.g. a candidate fit) for the current source.                                 #
+#                                                                                                                    #
+# VARIABLES:    text -- String; what was aborted & why                                                               #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def note_timeout(text):
+
+    print('\nWATCHDOG: %s' % text)
+    notes.append(text)
+
+
+
+
+
+
+#--------------------------------------------------------------------------------------------------------------------#
+# FUNCTION:     pop_timeouts()                                                                                       #
+#                                                                                                                    #
+# DESCRIPTION:  Return & forget notes on aborted stages of the current source.                                       #
+#--------------------------------------------------------------------------------------------------------------------#
+
+def pop_timeouts():
+
+    result = list(notes)
+    del notes[:]
+
+    return(result)
@@ -0,0 +1,103 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_catalog.py                                                     #
+#                                                                           #
+# PURPOSE: Tests of the streaming, sharded catalog reader (acab_catalog):   #
+#          shard specifications, invalid rows & shards that split the       #
+#          catalog without changing source positions.                       #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import argparse
+import pytest
+from acab_catalog import parse_shard,shard_of,read_catalog
+
+# Catalog with comments, blank lines & invalid rows between valid ones
+CATALOG = '''# obsid, srcid, ra, dec, nh
+100, 1, 10.0, 20.0, 1E20
+100, 2, 10.1, 20.1, 2E20
+
+200, 1, 30.0, -5.0, 3E20   # comment after a row
+200, 2, 30.1
+300, , 45.0, 10.0, 1E20
+300, 1, abc, 10.0, 1E20
+300, 2, 400.0, 10.0, 1E20
+300, 3, 45.0, 10.0, -1E20
+400, 1, 50.0, 15.0, 0
+500, 1, 60.0, -80.0, 5E21
+600, 1, 70.0, 30.0, 1E21
+'''
+
+# Valid sources of CATALOG with their positions
+VALID = [(1, ['100','1','10.0','20.0','1E20']),
+         (2, ['100','2','10.1','20.1','2E20']),
+         (3, ['200','1','30.0','-5.0','3E20']),
+         (4, ['400','1','50.0','15.0','0']),
+         (5, ['500','1','60.0','-80.0','5E21']),
+         (6, ['600','1','70.0','30.0','1E21'])]
+
+
+
+
+
+
+@pytest.fixture
+def catalog(tmp_path):
+
+    path = tmp_path / 'catalog.csv'
+    path.write_text(CATALOG)
+
+    return(str(path))
+
+
+
+
+
+
+@pytest.mark.parametrize('text,shard', [('0/1',(0,1)), ('3/4',(3,4)), (' 1 / 2 ',(1,2))])
+def test_parse_shard(text, shard):
+
+    assert parse_shard(text) == shard
+
+
+
+@pytest.mark.parametrize('text', ['', '1', '1/2/3', 'a/b', '2/2', '-1/2', '0/0'])
+def test_parse_shard_invalid(text):
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_shard(text)
+
+
+
+def test_read_catalog_skips_invalid_rows(catalog, capsys):
+
+    assert list(read_catalog(catalog)) == VALID
+
+    # One report per invalid row, with its line number
+    skipped = [line for line in capsys.readouterr().out.splitlines() if line.startswith('read_catalog(): Skipping')]
+    assert [line.split()[3] for line in skipped] == ['6','7','8','9','10']
+
+
+
+@pytest.mark.parametrize('count', [1,2,3,5])
+def test_shards_split_catalog(catalog, count):
+
+    shards = [list(read_catalog(catalog, (index,count))) for index in range(count)]
+
+    # Shards are disjoint, cover the catalog & keep the positions of the whole catalog
+    assert sorted(item for shard in shards for item in shard) == VALID
+    for index,shard in enumerate(shards):
+        assert all(shard_of(source[0], count) == index for position,source in shard)
+
+
+
+def test_observations_stay_in_one_shard(catalog):
+
+    for index in range(3):
+        obsids = [source[0] for position,source in read_catalog(catalog, (index,3))]
+        assert '100' not in obsids or obsids.count('100') == 2
+
+
+
+def test_read_catalog_obsids(catalog):
+
+    assert list(read_catalog(catalog, obsids={'200','500'})) == [VALID[2], VALID[4]]
@@ -0,0 +1,56 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_db.py                                                          #
+#                                                                           #
+# PURPOSE: Tests of the results database (acab_db): sources done & sources  #
+#          written, with results saved out of catalog order as by pool,     #
+#          queue & service runs.                                            #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import pytest
+from acab_db import open_db,save_result,done_sources,written_sources,source_outcomes
+
+
+
+
+
+
+def result(srcid, status='ok', error=None):
+
+    return({'obsid': '100', 'srcid': srcid, 'status': status, 'model': 'xstbabs.abs1*powlaw1d.p1' if status == 'ok' else None,
+            'stats': None, 'timings': {}, 'error': error, 'timeouts': [], 'tier': None, 'fingerprint': None})
+
+
+
+@pytest.fixture
+def db(tmp_path):
+
+    db = open_db(str(tmp_path / 'results.sqlite'))
+    yield db
+    db.close()
+
+
+
+
+
+
+def test_results_out_of_order(db):
+
+    # Sources 1 & 3 finished, source 2 failed, source 4 never finished; results arrive out of order
+    save_result(db, result('3'), 3)
+    save_result(db, result('1'), 1)
+    save_result(db, result('2', 'error', 'fit failed'), 2)
+
+    assert set(done_sources(db)) == {('100','1'), ('100','3')}
+    assert written_sources(db) == {('100','1'), ('100','2'), ('100','3')}
+    assert ('100','4') not in written_sources(db)
+
+
+
+def test_result_overwritten(db):
+
+    save_result(db, result('1', 'error', 'fit failed'), 1)
+    save_result(db, result('1'), 1)
+
+    assert set(done_sources(db)) == {('100','1')}
+    assert [outcome['status'] for outcome in source_outcomes(db, [(1,['100','1']),(2,['100','2'])])] == ['ok','missing']
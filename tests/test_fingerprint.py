@@ -0,0 +1,86 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_fingerprint.py                                                 #
+#                                                                           #
+# PURPOSE: Tests of the input fingerprints (acab_fingerprint): FITS header  #
+#          keywords read without astropy & file digests cached in the       #
+#          results database.                                                #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import hashlib
+from acab_db import open_db
+from acab_fingerprint import header_keywords,file_digest
+
+
+
+
+
+
+def fits_header(cards):
+
+    text = ''.join(card.ljust(80) for card in cards + ['END'])
+
+    return(text.ljust((len(text)+2879)//2880*2880).encode('ascii'))
+
+
+
+def write_fits(path, bytes_per_row=3000):
+
+    # Primary HDU with a data unit longer than one block, then a table extension holding the keywords
+    primary = fits_header(['SIMPLE  =                    T', 'BITPIX  =                    8', 'NAXIS   =                    1',
+                           'NAXIS1  = %20d' % bytes_per_row, "RESPFILE= 'primary.rmf'        / read from the primary HDU"])
+    extension = fits_header(["XTENSION= 'BINTABLE'", 'BITPIX  =                    8', 'NAXIS   =                    2',
+                             'NAXIS1  =                   10', 'NAXIS2  =                    4', 'PCOUNT  =                    0',
+                             'GCOUNT  =                    1', "RESPFILE= 'other.rmf'", "ANCRFILE= 'src.arf   '",
+                             "BACKFILE= 'none'", 'EXPOSURE=              20000.0 / seconds'])
+    data = bytes(bytes_per_row).ljust((bytes_per_row+2879)//2880*2880, b'\0')
+    with open(path,'wb') as f:
+        f.write(primary + data + extension + bytes(2880))
+
+
+
+
+
+
+def test_header_keywords(tmp_path):
+
+    path = str(tmp_path / 'src.pha')
+    write_fits(path)
+
+    # Keywords after the data unit of the primary HDU are found; the first value of a keyword wins
+    assert header_keywords(path, ('RESPFILE','ANCRFILE','BACKFILE','EXPOSURE','MISSING')) == \
+           {'RESPFILE': 'primary.rmf', 'ANCRFILE': 'src.arf', 'BACKFILE': 'none', 'EXPOSURE': '20000.0'}
+
+
+
+def test_header_keywords_truncated(tmp_path):
+
+    path = str(tmp_path / 'src.pha')
+    write_fits(path)
+    with open(path,'rb+') as f:
+        f.truncate(2880*3 + 100)
+
+    # The extension header is cut off; the primary header is still read
+    assert header_keywords(path, ('RESPFILE','ANCRFILE')) == {'RESPFILE': 'primary.rmf'}
+
+
+
+def test_file_digest(tmp_path):
+
+    db = open_db(str(tmp_path / 'results.sqlite'))
+    path = tmp_path / 'src.arf'
+    path.write_bytes(b'effective area')
+
+    assert file_digest(db, str(tmp_path / 'none.arf')) == 'missing'
+    assert file_digest(db, str(path)) == hashlib.sha1(b'effective area').hexdigest()
+    assert db.execute('SELECT COUNT(*) FROM files').fetchone()[0] == 1
+
+    # Unchanged file (same size & modification time): the stored digest is used, not the contents
+    db.execute('UPDATE files SET sha1 = ?', ('stored',))
+    assert file_digest(db, str(path)) == 'stored'
+
+    # Changed file: read again
+    path.write_bytes(b'new effective area')
+    os.utime(str(path), ns=(1,1))
+    assert file_digest(db, str(path)) == hashlib.sha1(b'new effective area').hexdigest()
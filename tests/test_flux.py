@@ -0,0 +1,100 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_flux.py                                                        #
+#                                                                           #
+# PURPOSE: Tests of the NumPy flux uncertainties (acab_flux): parameter     #
+#          sampling, batch flux evaluation against analytic & finely        #
+#          integrated fluxes, and the intervals reported.                   #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import numpy as np
+import pytest
+from acab_flux import KEV_TO_ERG,sample_parameters,flux_samples,flux_agrees,flux_interval
+from acab_vector import component_flux
+
+# Energy grid of 0.01 keV bins from 0.3 to 10 keV, and no absorption (transmission of abs1 + abs2 is then 2)
+ELO = np.arange(0.3, 10.0, 0.01)
+EHI = ELO + 0.01
+SIGMA = np.zeros_like(ELO)
+
+
+
+
+
+
+def test_sample_parameters():
+
+    covar = [[0.04, 0.01], [0.01, 0.09]]
+    samples = sample_parameters([1.0, 2.0], covar, [-10,-10], [10,10], 200000, seed=1)
+
+    assert samples.shape == (200000,2)
+    assert np.allclose(samples.mean(axis=0), [1.0,2.0], atol=0.005)
+    assert np.allclose(np.cov(samples.T), covar, atol=0.002)
+
+
+
+def test_sample_parameters_limits_and_singular_covariance():
+
+    samples = sample_parameters([0.0, 1.0], [[1.0, 1.0], [1.0, 1.0]], [0.0,-10], [10,10], 1000, seed=1)
+
+    assert samples[:,0].min() == 0.0
+    assert np.all(np.isfinite(samples))
+    assert np.array_equal(sample_parameters([0.0], [[1.0]], [-10], [10], 5, seed=2),
+                          sample_parameters([0.0], [[1.0]], [-10], [10], 5, seed=2))
+
+
+
+def test_flux_samples_powerlaw():
+
+    column = {'abs2.nH': np.zeros(2), 'p1.gamma': np.array([2.0, 1.0]), 'p1.ampl': np.array([1.0, 3.0])}
+    photons, energies = flux_samples([('powlaw1d','p1')], column, 0.0, SIGMA, ELO, EHI)
+
+    # Integral of E^-2 & 3 E^-1 from 0.3 to 10 keV, times the transmission of (abs1 + abs2)
+    assert photons == pytest.approx([2*(1/0.3-1/EHI[-1]), 2*3*np.log(EHI[-1]/0.3)], rel=1E-9)
+    assert energies == pytest.approx([2*KEV_TO_ERG*np.sum((1/ELO-1/EHI)*(ELO+EHI)/2), 2*3*KEV_TO_ERG*(EHI[-1]-0.3)],
+                                     rel=1E-9)
+
+
+
+def test_disk_flux_coarse_grid():
+
+    # Bins of 0.5 keV integrate the disk as a grid of 0.001 keV does
+    tin = np.array([[0.3],[1.0],[2.5]])
+    coarse = component_flux('xsdiskbb', np.arange(0.5,8.0,0.5)[None,:], np.arange(1.0,8.5,0.5)[None,:], tin).sum(axis=1)
+    fine = component_flux('xsdiskbb', np.arange(0.5,8.0,0.001)[None,:], np.arange(0.501,8.001,0.001)[None,:], tin).sum(axis=1)
+
+    assert coarse == pytest.approx(fine, rel=0.005)
+
+
+
+def test_sample_median_matches_best_fit():
+
+    # Small parameter errors: the median flux of the samples is the flux of the best fit
+    names = ['abs2.nH','p1.gamma','d1.Tin','p1.ampl','d1.norm']
+    best = np.array([0.5, 1.8, 1.2, 1E-4, 2.0])
+    samples = sample_parameters(best, np.diag((best*0.01)**2), [0,-10,0.01,0,0], [100,10,20,1E24,1E24], 4000, seed=3)
+    sigma = 0.2/np.maximum(ELO,0.1)**2.5
+    components = [('powlaw1d','p1'), ('xsdiskbb','d1')]
+
+    photons, energies = flux_samples(components, {name: samples[:,n] for n,name in enumerate(names)}, 0.03, sigma, ELO, EHI)
+    pflux, eflux = flux_samples(components, {name: best[n:n+1] for n,name in enumerate(names)}, 0.03, sigma, ELO, EHI)
+
+    assert flux_interval(photons)[1] == pytest.approx(pflux[0], rel=0.002)
+    assert flux_interval(energies)[1] == pytest.approx(eflux[0], rel=0.002)
+
+
+
+def test_flux_agrees():
+
+    assert flux_agrees(1.005E-12, 1.0E-12)
+    assert not flux_agrees(1.02E-12, 1.0E-12)
+    assert not flux_agrees(np.nan, 1.0E-12)
+
+
+
+def test_flux_interval():
+
+    samples = np.append(np.random.default_rng(4).normal(10.0, 1.0, 100000), [np.nan, np.inf])
+    lo, med, hi = flux_interval(samples)
+
+    assert (lo, med, hi) == pytest.approx((9.0, 10.0, 11.0), abs=0.02)
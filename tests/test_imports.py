@@ -0,0 +1,27 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_imports.py                                                     #
+#                                                                           #
+# PURPOSE: Tests that the driver (acab.py) & its modules import without     #
+#          Sherpa, so submitting to the service & running the spool         #
+#          driver do not pay Sherpa's startup.                              #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import sys
+import subprocess
+
+# Folder of the ACAB modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+
+
+
+
+def test_driver_does_not_import_sherpa():
+
+    code = 'import sys, acab; print(sorted(name for name in sys.modules if name.split(".")[0] == "sherpa"))'
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+    assert out.strip() == '[]'
@@ -0,0 +1,39 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_plots.py                                                       #
+#                                                                           #
+# PURPOSE: Tests of deferred plot rendering (acab_plots): the number of     #
+#          plot jobs in flight on the background renderer is bounded.       #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import time
+from concurrent.futures import ThreadPoolExecutor
+import acab_plots
+
+
+
+
+
+
+def test_jobs_in_flight_are_bounded(monkeypatch):
+
+    # A slow renderer of 2 workers; every plot takes 10 ms
+    rendered, peak = [], []
+    def render_plot(job):
+        time.sleep(0.01)
+        rendered.append(job)
+
+    renderer = ThreadPoolExecutor(2)
+    monkeypatch.setattr(acab_plots, 'render_plot', render_plot)
+    monkeypatch.setattr(acab_plots, 'renderer', renderer)
+    monkeypatch.setattr(acab_plots, 'render_workers', 2)
+    monkeypatch.setattr(acab_plots, 'rendering', [])
+
+    for n in range(40):
+        acab_plots.submit_plots([n])
+        peak.append(len(acab_plots.rendering))
+
+    assert max(peak) <= acab_plots.PLOT_BACKLOG*2
+    acab_plots.finish_plots()
+    assert sorted(rendered) == list(range(40))
+    assert acab_plots.renderer is None
@@ -0,0 +1,202 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_queue.py                                                       #
+#                                                                           #
+# PURPOSE: Tests of the SQLite work queue (acab_queue): claims, expired     #
+#          leases, retries, parking, re-queueing, results of drivers that   #
+#          lost their lease, leases of hung sources & filesystems refused.  #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import time
+import pytest
+import acab_queue
+from acab_queue import open_queue,enqueue,claim,finish,heartbeat,live_sources,filesystem_type,requeue_parked,queue_status
+
+# Sources as read by acab_catalog.read_catalog(); [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]
+SOURCES = [(0, ['100','1','10.0','20.0','1E20']),
+           (1, ['100','2','10.1','20.1','2E20']),
+           (2, ['200','1','30.0','-5.0','3E20'])]
+
+
+
+
+
+
+@pytest.fixture
+def queue(tmp_path):
+
+    queue = open_queue(str(tmp_path / 'queue.sqlite'))
+    enqueue(queue, SOURCES)
+    yield queue
+    queue.close()
+
+
+
+def row(queue, obsid, srcid):
+
+    return(queue.execute('SELECT state, attempts, worker, error FROM queue WHERE obsid = ? AND srcid = ?',
+                         (obsid,srcid)).fetchone())
+
+
+
+def result(source, status='ok', error=None):
+
+    return({'obsid': source[0], 'srcid': source[1], 'status': status, 'error': error})
+
+
+
+
+
+
+def test_enqueue_ignores_queued_sources(queue):
+
+    assert enqueue(queue, SOURCES[:1]) == 0
+    assert queue_status(queue) == {'pending': 3, 'leased': 0, 'done': 0, 'parked': 0}
+
+
+
+def test_claim_in_catalog_order(queue):
+
+    claims = [claim(queue, 'a') for _ in SOURCES]
+
+    assert claims == [(position,source) for position,source in SOURCES]
+    assert claim(queue, 'a') is None
+    assert row(queue, '100', '1') == ('leased', 1, 'a', None)
+
+
+
+def test_claim_reclaims_expired_lease(queue):
+
+    source = SOURCES[0][1]
+    assert claim(queue, 'a', lease=-1) == (0, source)
+
+    # The lease of driver a expired, so the source goes to driver b before the pending ones
+    assert claim(queue, 'b') == (0, source)
+    assert row(queue, '100', '1') == ('leased', 2, 'b', None)
+
+
+
+def test_claim_leaves_live_lease(queue):
+
+    claim(queue, 'a')
+
+    assert claim(queue, 'b') == SOURCES[1]
+
+
+
+def test_claim_parks_expired_lease_without_attempts(queue):
+
+    claim(queue, 'a', lease=-1, max_attempts=1)
+
+    assert claim(queue, 'b', max_attempts=1) == SOURCES[1]
+    assert row(queue, '100', '1') == ('parked', 1, None, 'lease expired')
+
+
+
+def test_finish_done(queue):
+
+    claim(queue, 'a')
+
+    assert finish(queue, 'a', result(SOURCES[0][1])) == 'done'
+    assert row(queue, '100', '1') == ('done', 1, None, None)
+
+
+
+def test_finish_retries_then_parks(queue):
+
+    failed = result(SOURCES[0][1], 'error', 'fit failed')
+    for attempt in (1,2):
+        assert claim(queue, 'a', max_attempts=3) == SOURCES[0]
+        assert finish(queue, 'a', failed, max_attempts=3) == 'pending'
+        assert row(queue, '100', '1') == ('pending', attempt, None, 'fit failed')
+
+    claim(queue, 'a', max_attempts=3)
+    assert finish(queue, 'a', failed, max_attempts=3) == 'parked'
+    assert row(queue, '100', '1') == ('parked', 3, None, 'fit failed')
+
+    # Parked sources are not claimed again
+    assert claim(queue, 'a', max_attempts=3) == SOURCES[1]
+
+
+
+def test_finish_stale_result(queue):
+
+    claim(queue, 'a', lease=-1)
+    claim(queue, 'b')
+
+    # Driver a lost its lease; its result must not touch the source now held by driver b
+    assert finish(queue, 'a', result(SOURCES[0][1], 'error', 'late')) == 'stale'
+    assert row(queue, '100', '1') == ('leased', 2, 'b', None)
+
+    assert finish(queue, 'b', result(SOURCES[0][1])) == 'done'
+    assert finish(queue, 'a', result(SOURCES[0][1])) == 'stale'
+    assert row(queue, '100', '1') == ('done', 2, None, None)
+
+
+
+def test_heartbeat_renews_own_leases_only(queue):
+
+    claim(queue, 'a', lease=-1)
+    heartbeat(queue, 'a', lease=600)
+    assert claim(queue, 'b', lease=-1) == SOURCES[1]
+    heartbeat(queue, 'a', lease=600)
+
+    # Source of driver a is held again, the expired one of driver b is reclaimed before the pending one
+    assert claim(queue, 'c') == SOURCES[1]
+    assert row(queue, '100', '1')[2] == 'a'
+    assert row(queue, '100', '2')[2] == 'c'
+
+
+
+def test_heartbeat_renews_live_sources_only(queue):
+
+    claim(queue, 'a')
+    claim(queue, 'a')
+    heartbeat(queue, 'a', lease=-1)
+
+    # Source 100_1 is hung: held for longer than the limit, so only 100_2 is renewed & 100_1 goes to driver b
+    held = {('100','1'): time.time()-100, ('100','2'): time.time()}
+    assert live_sources(held, max_hold=50) == [('100','2')]
+    assert live_sources(held) == [('100','1'), ('100','2')]
+
+    heartbeat(queue, 'a', lease=600, sources=live_sources(held, max_hold=50))
+    assert claim(queue, 'b') == SOURCES[0]
+    assert row(queue, '100', '2')[2] == 'a'
+
+
+
+def test_filesystem_type(tmp_path):
+
+    mounts = tmp_path / 'mounts'
+    mounts.write_text('/dev/sda1 / ext4 rw 0 0\n'
+                      'server:/export /data nfs4 rw 0 0\n'
+                      '/dev/sdb1 /data/local\\040disk xfs rw 0 0\n')
+
+    assert filesystem_type('/home/user/queue.sqlite', str(mounts)) == 'ext4'
+    assert filesystem_type('/data/queue.sqlite', str(mounts)) == 'nfs4'
+    assert filesystem_type('/data/local disk/run/queue.sqlite', str(mounts)) == 'xfs'
+    assert filesystem_type('/database/queue.sqlite', str(mounts)) == 'ext4'
+    assert filesystem_type('/data/queue.sqlite', str(tmp_path / 'missing')) is None
+
+
+
+def test_open_queue_refuses_network_filesystem(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(acab_queue, 'filesystem_type', lambda path: 'nfs4')
+    path = str(tmp_path / 'queue.sqlite')
+
+    with pytest.raises(ValueError):
+        open_queue(path)
+    open_queue(path, network=True).close()
+
+
+
+def test_requeue_parked(queue):
+
+    claim(queue, 'a', max_attempts=1)
+    finish(queue, 'a', result(SOURCES[0][1], 'error', 'fit failed'), max_attempts=1)
+
+    assert requeue_parked(queue) == 1
+    assert row(queue, '100', '1') == ('pending', 0, None, None)
+    assert requeue_parked(queue) == 0
+    assert claim(queue, 'a') == SOURCES[0]
@@ -0,0 +1,30 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_tournament.py                                                  #
+#                                                                           #
+# PURPOSE: Tests of the tournament pool workers (acab_funcs): a worker's    #
+#          Sherpa session is reset between sources, not between the         #
+#          candidates of one source.                                        #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import acab_funcs
+
+
+
+
+
+
+def test_candidate_worker_reset_per_source(monkeypatch):
+
+    # Fits & Sherpa are replaced; only the order of fits & resets is recorded
+    calls = []
+    monkeypatch.setattr(acab_funcs, 'fitting_fast', lambda source, model, *args, **kwargs: calls.append(('fit',source[1],model)))
+    monkeypatch.setattr(acab_funcs, 'fit_summary', lambda: {})
+    monkeypatch.setattr(acab_funcs, 'reset_session', lambda: calls.append(('reset',)))
+    monkeypatch.setattr(acab_funcs, 'candidate_source', None)
+
+    for srcid,model in (('1','a'), ('1','b'), ('2','a'), ('2','b'), ('1','a')):
+        acab_funcs.fit_candidate((['100',srcid,'0','0','1E20'], model, '', [0.3,10], None, 'chi2datavar'))
+
+    assert calls == [('fit','1','a'), ('fit','1','b'), ('reset',), ('fit','2','a'), ('fit','2','b'), ('reset',),
+                     ('fit','1','a')]
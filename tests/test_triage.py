@@ -0,0 +1,119 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_triage.py                                                      #
+#                                                                           #
+# PURPOSE: Tests of the count-based triage (acab_triage) on small PHA,      #
+#          background & RMF files: net counts in bounds & bands, tiers,     #
+#          and the full tournament for sources whose counts are unknown.    #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import os
+import numpy as np
+import pytest
+
+fits = pytest.importorskip('astropy.io.fits')
+
+from acab_triage import net_counts,triage_source
+
+# Source [<obsid>, <source number>, <RA>, <DEC>, <Goddard nH>]; its spectrum is <obsid>/extracted_spectra_..._grp.pi
+SOURCE = ['100','1','10.0','20.0','1E20']
+
+# 100 channels of 0.1 keV from 0 to 10 keV
+CHANNELS = np.arange(1,101)
+
+
+
+
+
+
+def write_pha(path, counts, exposure, backscal, header):
+
+    hdu = fits.BinTableHDU.from_columns([fits.Column(name='CHANNEL', format='J', array=CHANNELS),
+                                         fits.Column(name='COUNTS', format='D', array=counts)], name='SPECTRUM')
+    hdu.header['EXPOSURE'] = exposure
+    hdu.header['BACKSCAL'] = backscal
+    for key,value in header.items():
+        hdu.header[key] = value
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(path)
+
+
+
+def write_spectrum(folder, per_channel=2.0, header=None):
+
+    # Source 2 counts per channel; background 4 counts per channel from twice the exposure & 4 times the area, so
+    # 0.5 counts per channel scaled to the source
+    os.makedirs(folder, exist_ok=True)
+    write_pha(os.path.join(folder, 'extracted_spectra_100_1_grp.pi'), np.full(100, per_channel), 1000.0, 1.0,
+              {'RESPFILE': 'src.rmf', 'BACKFILE': 'bkg.pi'} if header is None else header)
+    write_pha(os.path.join(folder, 'bkg.pi'), np.full(100, 4.0), 2000.0, 4.0, {})
+
+    ebounds = fits.BinTableHDU.from_columns([fits.Column(name='CHANNEL', format='J', array=CHANNELS),
+                                             fits.Column(name='E_MIN', format='E', array=(CHANNELS-1)*0.1),
+                                             fits.Column(name='E_MAX', format='E', array=CHANNELS*0.1)], name='EBOUNDS')
+    fits.HDUList([fits.PrimaryHDU(), ebounds]).writeto(os.path.join(folder, 'src.rmf'))
+
+
+
+
+
+
+def test_net_counts(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    write_spectrum('100')
+
+    # Channels with mid-energies in [0.3, 10) keV: 4 ... 100
+    counts = net_counts(SOURCE)
+    assert counts['src'] == pytest.approx(97*2.0)
+    assert counts['bkg'] == pytest.approx(97*0.5)
+    assert counts['net'] == pytest.approx(97*1.5)
+    assert counts['soft'] == pytest.approx(9*1.5)
+    assert counts['medium'] == pytest.approx(8*1.5)
+    assert counts['hard'] == pytest.approx(80*1.5)
+
+    assert net_counts(SOURCE, [1.0,2.0])['net'] == pytest.approx(10*1.5)
+
+
+
+def test_net_counts_without_background(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    write_spectrum('100', header={'RESPFILE': 'src.rmf', 'BACKFILE': 'none'})
+
+    counts = net_counts(SOURCE)
+    assert counts['bkg'] == 0.0
+    assert counts['net'] == pytest.approx(97*2.0)
+
+
+
+@pytest.mark.parametrize('per_channel,tier,stat,binning', [(0.6,'faint','wstat',1), (2.0,'medium','chi2datavar',''),
+                                                           (20.0,'bright','chi2datavar','')])
+def test_triage_source_tiers(tmp_path, monkeypatch, per_channel, tier, stat, binning):
+
+    monkeypatch.chdir(tmp_path)
+    write_spectrum('100', per_channel)
+
+    triage = triage_source(SOURCE)
+    assert (triage['tier'],triage['stat'],triage['binning']) == (tier,stat,binning)
+    assert triage['counts']['net'] == pytest.approx(97*(per_channel-0.5))
+
+
+
+def test_triage_source_without_respfile(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    write_spectrum('100', header={'BACKFILE': 'bkg.pi'})
+
+    with pytest.raises(ValueError):
+        net_counts(SOURCE)
+
+    # Counts cannot be read: full tournament, so the source is still fitted
+    assert triage_source(SOURCE) == {'tier': 'bright', 'stat': 'chi2datavar', 'binning': '', 'counts': None}
+
+
+
+def test_triage_source_without_spectrum(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+
+    assert triage_source(SOURCE) == {'tier': 'bright', 'stat': 'chi2datavar', 'binning': '', 'counts': None}
@@ -0,0 +1,174 @@
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# FILE: test_vector.py                                                      #
+#                                                                           #
+# PURPOSE: Tests of the NumPy batch engine (acab_vector) on simulated       #
+#          spectra of known parameters: supported models, the disk          #
+#          integral, recovery of absorbed power-law & disk parameters, and  #
+#          candidate fits of choose_model() with --engine batch.            #
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+
+# Import libraries
+import numpy as np
+import pytest
+import acab_funcs
+from acab_vector import BATCH_BASE,batch_components,batch_parnames,disk_integral,component_flux,stack_sources,project,batch_fit
+
+# Energy grid of 0.02 keV bins from 0.1 to 11 keV, photoelectric-like optical depth per 1e22 cm^-2 & a Gaussian
+# effective area (cm^2) peaking at 1.5 keV
+ELO = np.arange(0.1, 11.0, 0.02)
+EHI = ELO + 0.02
+SIGMA = 0.25*((ELO+EHI)/2)**-2.6
+AREA = 400*np.exp(-np.log((ELO+EHI)/3.0)**2)
+
+POWERLAW = BATCH_BASE + '*(powlaw1d.p1)'
+DISK = BATCH_BASE + '*(powlaw1d.p1+xsdiskbb.d1)'
+
+
+
+
+
+
+def simulate(nh2, gamma, ampl, tin=None, norm=None, nh1=0.02, exposure=2E5, seed=0):
+
+    # Poisson counts of (abs1+abs2)*(powlaw1d[+xsdiskbb]) with a diagonal response, 0.3-10 keV grouped to 15 counts
+    rng = np.random.default_rng(seed)
+    flux = ampl*component_flux('powlaw1d', ELO[None,:], EHI[None,:], np.array([[gamma]]))[0]
+    if tin is not None:
+        flux += norm*component_flux('xsdiskbb', ELO[None,:], EHI[None,:], np.array([[tin]]))[0]
+    counts = rng.poisson(exposure*AREA*(np.exp(-nh1*SIGMA)+np.exp(-nh2*SIGMA))*flux)
+
+    groups, group = [], []
+    for n in np.flatnonzero(((ELO+EHI)/2 >= 0.3) & ((ELO+EHI)/2 < 10.0)):
+        group.append(n)
+        if counts[group].sum() >= 15:
+            groups.append(group)
+            group = []
+    groups[-1] += group
+
+    y = np.array([counts[group].sum() for group in groups], dtype=float)
+    resp = np.zeros((len(ELO),len(groups)))
+    for k,group in enumerate(groups):
+        resp[group,k] = exposure*AREA[group]
+
+    return({'source': ['100',str(seed),'0','0',str(nh1*1E22)], 'y': y, 'err': np.sqrt(y), 'resp': resp, 'elo': ELO,
+            'ehi': EHI, 'sigma': SIGMA, 'nh1': nh1})
+
+
+
+def chisq_at(loaded, model, theta):
+
+    # Chi-squared at given nonlinear parameters, with the best normalizations
+    types = [typ for typ,name in batch_components(model)]
+
+    return(project(stack_sources([loaded]), types, np.array([theta]))[0][0])
+
+
+
+
+
+
+def test_batch_components():
+
+    assert batch_components(DISK) == [('powlaw1d','p1'), ('xsdiskbb','d1')]
+    assert batch_components(BATCH_BASE + '*(xsmekal.mekal+xsdiskbb.d1)') is None
+    assert batch_components('xstbabs.abs1*(powlaw1d.p1)') is None
+    assert batch_parnames(DISK) == ['abs2.nH', 'p1.gamma', 'd1.Tin', 'p1.ampl', 'd1.norm']
+
+
+
+def test_disk_integral():
+
+    # Continuous across the ends of the table: y^(-8/3) below it, 0 far above it
+    y = np.array([0.9999E-4, 1.0001E-4, 1E-6, 200.0])
+    out = disk_integral(y)
+
+    assert out[0] == pytest.approx(out[1], rel=1E-3)
+    assert out[2] == pytest.approx(out[1]*(1E-6/1.0001E-4)**(-8.0/3.0), rel=1E-3)
+    assert out[3] == 0.0
+
+
+
+def test_powerlaw_flux():
+
+    # Bin integrals of E^-2 & E^0
+    flux = component_flux('powlaw1d', ELO[None,:], EHI[None,:], np.array([[2.0],[0.0]]))
+
+    assert flux[0] == pytest.approx(1/ELO-1/EHI, rel=1E-9)
+    assert flux[1] == pytest.approx(EHI-ELO, rel=1E-9)
+
+
+
+def test_project_unabsorbed():
+
+    # Without absorption the best normalization of a noiseless spectrum is the true one
+    loaded = simulate(0.0, 1.8, 1E-3, nh1=0.0)
+    loaded['y'] = loaded['resp'].T.dot(2*1E-3*component_flux('powlaw1d', ELO[None,:], EHI[None,:], np.array([[1.8]]))[0])
+    loaded['err'] = np.sqrt(loaded['y'])
+    chisq, norms, counts = project(stack_sources([loaded]), ['powlaw1d'], np.array([[0.0, 1.8]]))
+
+    assert chisq[0] == pytest.approx(0.0, abs=1E-12)
+    assert norms[0,0] == pytest.approx(1E-3, rel=1E-9)
+
+
+
+@pytest.mark.parametrize('nh2,gamma,ampl', [(0.3, 1.5, 1E-3), (1.0, 1.37, 9E-4), (2.7, 2.35, 2E-4), (3.0, 2.08, 6E-4),
+                                            (6.0, 1.9, 2E-3)])
+def test_batch_fit_powerlaw(nh2, gamma, ampl):
+
+    loaded = simulate(nh2, gamma, ampl, seed=int(10*nh2))
+    fit = batch_fit([loaded], POWERLAW)[0]
+    fitted = dict(zip(fit['parnames'], fit['parvals']))
+
+    # No collapse of abs2 onto a local minimum: the fit is at least as good as the truth, and close to it
+    assert fit['succeeded'] and fit['rstat'] < 1.5
+    assert fit['statval'] <= chisq_at(loaded, POWERLAW, [nh2,gamma]) + 1E-6
+    assert fitted['abs2.nH'] == pytest.approx(nh2, rel=0.2)
+    assert fitted['p1.gamma'] == pytest.approx(gamma, abs=0.1)
+    assert fitted['p1.ampl'] == pytest.approx(ampl, rel=0.2)
+
+
+
+def test_batch_fit_many_sources():
+
+    # Sources fitted together get the fits they get alone
+    loaded = [simulate(nh2, gamma, ampl, seed=seed) for seed,(nh2,gamma,ampl) in enumerate([(0.5,1.6,1E-3), (2.0,2.2,5E-4),
+                                                                                             (4.0,1.4,1E-3)])]
+    together = batch_fit(loaded, POWERLAW)
+
+    for d,fit in zip(loaded,together):
+        assert fit['parvals'] == pytest.approx(batch_fit([d], POWERLAW)[0]['parvals'], rel=1E-3)
+
+
+
+def test_batch_fit_disk():
+
+    loaded = simulate(1.0, 2.0, 3E-4, tin=1.0, norm=20.0, exposure=1E6, seed=1)
+    fit = batch_fit([loaded], DISK)[0]
+    fitted = dict(zip(fit['parnames'], fit['parvals']))
+
+    assert fit['succeeded'] and fit['rstat'] < 1.5
+    assert fit['statval'] <= chisq_at(loaded, DISK, [1.0,2.0,1.0]) + 1E-6
+    assert fitted['abs2.nH'] == pytest.approx(1.0, rel=0.2)
+    assert fitted['d1.Tin'] == pytest.approx(1.0, rel=0.1)
+    assert fitted['d1.norm'] == pytest.approx(20.0, rel=0.3)
+
+
+
+def test_batch_fits(monkeypatch):
+
+    # Candidates of the batch engine are cached as fits of the batch optimizer; the rest are left to Sherpa
+    loaded = simulate(1.5, 1.8, 1E-3)
+    monkeypatch.setattr(acab_funcs, 'load_batch_source', lambda source, binning, bounds: loaded)
+    monkeypatch.setattr(acab_funcs, 'fit_strategy', dict(acab_funcs.fit_strategy, engine='batch'))
+    acab_funcs.clear_fit_cache()
+
+    source = loaded['source']
+    other = BATCH_BASE + '*(xsmekal.mekal+xsdiskbb.d1)'
+    acab_funcs.batch_fits(source, [POWERLAW, other])
+
+    fit = acab_funcs.fit_cache[acab_funcs.fit_key(source, POWERLAW)]
+    assert (fit['method'], fit['parnames']) == ('batch', tuple(batch_parnames(POWERLAW)))
+    assert dict(zip(fit['parnames'], fit['parvals']))['abs2.nH'] == pytest.approx(1.5, rel=0.2)
+    assert acab_funcs.fit_key(source, other) not in acab_funcs.fit_cache
+
+    acab_funcs.clear_fit_cache()